@@ -1,6 +1,6 @@
 import React, { useState } from 'react'
-import { useQuery } from '@tanstack/react-query'
-import { sweetService } from '../../services/sweetService'
+import { useQuery, useQueryClient } from '@tanstack/react-query'
+import { analyticsService } from '../../services/analyticsService'
 import { useAuth } from '../../contexts/AuthContext'
 import { SweetList } from '../sweets/SweetList'
 import { SweetForm } from './SweetForm'
@@ -9,14 +9,26 @@ import { Card, CardContent, CardHeader, CardTitle } from '../ui/Card'
 import { Plus, Package, DollarSign, TrendingUp, AlertTriangle } from 'lucide-react'
 import { formatPrice } from '../../lib/utils'
 
+const LOW_STOCK_THRESHOLD = 10
+
 export const AdminDashboard = () => {
   const { user } = useAuth()
   const [showForm, setShowForm] = useState(false)
   const [selectedSweet, setSelectedSweet] = useState(null)
 
-  const { data: sweets = [], refetch } = useQuery({
-    queryKey: ['sweets'],
-    queryFn: sweetService.getAllSweets,
+  const queryClient = useQueryClient()
+
+  // Totals are aggregated server-side rather than from the full list
+  const { data: stockValue } = useQuery({
+    queryKey: ['analytics', 'stock-value'],
+    queryFn: analyticsService.getStockValue,
+    enabled: user?.role === 'admin',
+  })
+
+  const { data: lowStock } = useQuery({
+    queryKey: ['analytics', 'low-stock', LOW_STOCK_THRESHOLD],
+    queryFn: () => analyticsService.getLowStock(LOW_STOCK_THRESHOLD),
+    enabled: user?.role === 'admin',
   })
 
   if (!user || user.role !== 'admin') {
@@ -29,11 +41,12 @@ export const AdminDashboard = () => {
     )
   }
 
+  const outOfStock = stockValue?.out_of_stock ?? 0
   const stats = {
-    totalSweets: sweets.length,
-    totalValue: sweets.reduce((sum, sweet) => sum + sweet.price * sweet.quantity, 0),
-    lowStock: sweets.filter(s => s.quantity > 0 && s.quantity < 10).length,
-    outOfStock: sweets.filter(s => s.quantity === 0).length,
+    totalSweets: stockValue?.total_items ?? 0,
+    totalValue: stockValue?.total_value ?? 0,
+    lowStock: Math.max((lowStock?.count ?? 0) - outOfStock, 0),
+    outOfStock,
   }
 
   const handleEditSweet = (sweet) => {
@@ -110,7 +123,8 @@ export const AdminDashboard = () => {
         onClose={handleCloseForm}
         sweet={selectedSweet}
         onSuccess={() => {
-          refetch()
+          queryClient.invalidateQueries({ queryKey: ['sweets'] })
+          queryClient.invalidateQueries({ queryKey: ['analytics'] })
           handleCloseForm()
         }}
       />
@@ -27,7 +27,7 @@ export const SweetForm = ({ open, onClose, sweet, onSuccess }) => {
   const onSubmit = async (data) => {
     try {
       if (sweet) {
-        await sweetService.updateSweet(sweet.id, data)
+        await sweetService.updateSweet(sweet.id, data, sweet.version)
       } else {
         await sweetService.createSweet(data)
       }
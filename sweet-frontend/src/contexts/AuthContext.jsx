@@ -28,6 +28,7 @@ export const AuthProvider = ({ children }) => {
       const response = await authService.login(email, password)
       setUser(response.user)
       localStorage.setItem('token', response.token)
+      localStorage.setItem('refreshToken', response.refresh_token)
       localStorage.setItem('user', JSON.stringify(response.user))
       return { success: true, data: response }
     } catch (error) {
@@ -40,6 +41,7 @@ export const AuthProvider = ({ children }) => {
       const response = await authService.register(name, email, password, role)
       setUser(response.user)
       localStorage.setItem('token', response.token)
+      localStorage.setItem('refreshToken', response.refresh_token)
       localStorage.setItem('user', JSON.stringify(response.user))
       return { success: true, data: response }
     } catch (error) {
@@ -50,13 +50,14 @@ const AdminDashboard = () => {
 
     try {
       editingSweet
-        ? await sweetService.updateSweet(editingSweet.id, payload)
+        ? await sweetService.updateSweet(editingSweet.id, payload, editingSweet.version)
         : await sweetService.createSweet(payload)
 
       resetForm()
       fetchSweets()
     } catch (err) {
       setError(err.response?.data?.error || 'Action failed')
+      if (err.response?.status === 409) fetchSweets()
     }
   }
 
@@ -162,6 +163,7 @@ const AdminDashboard = () => {
                   <span>₹{s.price}</span>
                   <span className={s.quantity > 0 ? 'text-green-600' : 'text-red-600'}>
                     Stock: {s.quantity}
+                    {s.on_hand > s.quantity && ` (${s.on_hand - s.quantity} held)`}
                   </span>
                 </div>
               </div>
@@ -40,6 +40,7 @@ const RegisterPage = () => {
       const response = await authService.register(name, email, password, role)
 
       localStorage.setItem('token', response.token)
+      localStorage.setItem('refreshToken', response.refresh_token)
       localStorage.setItem('user', JSON.stringify(response.user))
 
       role === 'admin'
@@ -0,0 +1,18 @@
+import api from './api'
+
+export const analyticsService = {
+  getStockValue: async () => {
+    const response = await api.get('/analytics/stock-value')
+    return response.data
+  },
+
+  getLowStock: async (threshold) => {
+    const response = await api.get('/analytics/low-stock', { params: { threshold } })
+    return response.data
+  },
+
+  getPriceHistogram: async (buckets) => {
+    const response = await api.get('/analytics/price-histogram', { params: { buckets } })
+    return response.data
+  }
+}
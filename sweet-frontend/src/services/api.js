@@ -21,17 +21,59 @@ api.interceptors.request.use(
   (error) => Promise.reject(error)
 )
 
-// Response interceptor for error handling
+// One refresh at a time: concurrent 401s wait for the same new token
+let pendingRefresh = null
+
+const refreshAccessToken = () => {
+  if (!pendingRefresh) {
+    const refreshToken = localStorage.getItem('refreshToken')
+    pendingRefresh = axios
+      .post(`${API_BASE_URL}/auth/refresh`, null, {
+        headers: { Authorization: `Bearer ${refreshToken}` },
+      })
+      .then((response) => {
+        localStorage.setItem('token', response.data.token)
+        return response.data.token
+      })
+      .finally(() => {
+        pendingRefresh = null
+      })
+  }
+  return pendingRefresh
+}
+
+const endSession = () => {
+  localStorage.removeItem('token')
+  localStorage.removeItem('refreshToken')
+  localStorage.removeItem('user')
+  window.location.href = '/login'
+}
+
+// Response interceptor for error handling: an expired access token is
+// renewed once with the refresh token and the request retried
 api.interceptors.response.use(
   (response) => response,
-  (error) => {
+  async (error) => {
+    const request = error.config
     if (error.response?.status === 401) {
-      localStorage.removeItem('token')
-      localStorage.removeItem('user')
-      window.location.href = '/login'
+      const canRefresh =
+        request && !request._retried && !request.url?.startsWith('/auth/') &&
+        localStorage.getItem('refreshToken')
+      if (canRefresh) {
+        request._retried = true
+        try {
+          const token = await refreshAccessToken()
+          request.headers.Authorization = `Bearer ${token}`
+          return api(request)
+        } catch (refreshError) {
+          endSession()
+          return Promise.reject(refreshError)
+        }
+      }
+      endSession()
     }
     return Promise.reject(error)
   }
 )
 
-export default api
\ No newline at end of file
+export default api
@@ -41,7 +41,18 @@ export const authService = {
 
   logout: () => {
     console.log('Logging out')
+    // Revoke the token server-side; local state is cleared either way
+    const token = localStorage.getItem('token')
+    const refreshToken = localStorage.getItem('refreshToken')
+    if (token) {
+      api.post(
+        '/auth/logout',
+        refreshToken ? { refresh_token: refreshToken } : null,
+        { headers: { Authorization: `Bearer ${token}` } }
+      ).catch(() => {})
+    }
     localStorage.removeItem('token')
+    localStorage.removeItem('refreshToken')
     localStorage.removeItem('user')
   },
 
@@ -18,8 +18,11 @@ export const sweetService = {
     return response.data
   },
 
-  updateSweet: async (id, sweetData) => {
-    const response = await api.put(`/sweets/${id}`, sweetData)
+  // Pass the version the edit started from to get a 409 instead of
+  // overwriting someone else's change
+  updateSweet: async (id, sweetData, version) => {
+    const headers = version === undefined ? {} : { 'If-Match': `"${version}"` }
+    const response = await api.put(`/sweets/${id}`, sweetData, { headers })
     return response.data
   },
 
@@ -1,10 +1,14 @@
 from flask import Flask, jsonify
-from flask_jwt_extended import JWTManager
 from flask_cors import CORS
-from app.models import mongo, bcrypt
+from app.models import mongo, bcrypt, passwords, Sweet, Hold
+from app.cache import create_cache
+from app.tokens import TokenManager
+from app.ratelimit import limiter, MongoBackend
+from app.db import pool_stats, catalogue_read_preference
+from app import holds, ledger, metrics, reports, stock
 from config import config
 
-jwt = JWTManager()
+jwt = TokenManager()
 
 def create_app(config_name='default'):
     app = Flask(__name__)
@@ -12,20 +16,64 @@ def create_app(config_name='default'):
     # Load configuration
     app.config.from_object(config[config_name])
     
+    # Serialize responses with the configured JSON provider
+    from . import serialization
+    serialization.init_app(app)
+    
+    # Structured, non-blocking logging with per-request ids
+    from . import log
+    log.init_app(app)
+    
     # Initialize extensions
-    mongo.init_app(app)
+    mongo_listeners = [metrics.mongo_listener] if app.config['METRICS_ENABLED'] else []
+    mongo.init_app(app, event_listeners=mongo_listeners)
     bcrypt.init_app(app)
+    passwords.init_app(app)
     jwt.init_app(app)
-    CORS(app, supports_credentials=True, origins=["http://localhost:3000"])
+    Sweet.cache = create_cache(app.config)
+    Sweet.catalogue_reads = catalogue_read_preference(app.config)
+    limiter.init_app(app, MongoBackend(lambda: mongo.db.rate_limits))
+    ledger.ledger.init_app(app, lambda movements: mongo.db.inventory_movements.insert_many(movements, ordered=False))
+    ledger.init_cli(app, lambda: mongo.db.inventory_movements)
+    reports.reports.init_app(app)
+    stock.stock.init_app(app)
+    
+    def release_expired_holds():
+        with app.app_context():
+            return Hold.release_expired()
+    
+    holds.sweeper.init_app(app, release_expired_holds)
+    holds.init_cli(app, Hold.release_expired)
+    
+    @app.before_request
+    def start_hold_sweeper():
+        # Not started in create_app, which a preloading gunicorn master runs;
+        # gunicorn workers start it in post_fork, other servers here
+        holds.sweeper.start()
+    
+    CORS(app, supports_credentials=True, origins=app.config['CORS_ORIGINS'])
+    
+    # Create MongoDB indexes before serving traffic
+    from . import indexes
+    indexes.init_app(app)
+    
+    # Open the minimum pool now rather than on the first requests
+    if app.config['MONGO_WARM_UP'] and not mongo.warm_up():
+        app.logger.warning('Mongo pool did not reach MONGO_MIN_POOL_SIZE during warm-up')
     
     # Register blueprints
     from .auth.routes import auth_bp
     from .sweets.routes import sweets_bp
     from .inventory.routes import inventory_bp
+    from .analytics.routes import analytics_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(sweets_bp, url_prefix='/api/sweets')
     app.register_blueprint(inventory_bp, url_prefix='/api/sweets')
+    app.register_blueprint(analytics_bp, url_prefix='/api/analytics')
+    
+    # Per-route request metrics, served at /api/metrics
+    metrics.init_app(app)
     
     # Error handlers
     @app.errorhandler(404)
@@ -43,6 +91,11 @@ def create_app(config_name='default'):
     
     @app.route('/api/health')
     def health():
-        return jsonify({'status': 'healthy', 'service': 'sweet-shop-api'})
+        return jsonify({
+            'status': 'healthy',
+            'service': 'sweet-shop-api',
+            'cache': Sweet.cache.stats(),
+            'mongo_pool': pool_stats.snapshot()
+        })
     
     return app
\ No newline at end of file
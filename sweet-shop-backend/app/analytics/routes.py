@@ -0,0 +1,57 @@
+import logging
+from flask import Blueprint, request, jsonify, current_app
+from app import reports
+from app.tokens import admin_required
+from app.validation import ValidationError, parse_page_size, parse_positive_int
+
+analytics_bp = Blueprint('analytics', __name__)
+logger = logging.getLogger(__name__)
+
+@analytics_bp.route('/stock-value', methods=['GET'])
+@admin_required()
+def stock_value():
+    try:
+        return jsonify({'message': 'Stock value by category', **reports.stock_value()}), 200
+    except Exception:
+        logger.exception('Stock value report failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@analytics_bp.route('/low-stock', methods=['GET'])
+@admin_required()
+def low_stock():
+    try:
+        try:
+            threshold = parse_positive_int(
+                request.args.get('threshold'), current_app.config['ANALYTICS_LOW_STOCK_THRESHOLD'], 'threshold'
+            )
+            limit = parse_page_size(
+                request.args.get('limit'),
+                current_app.config['SWEETS_DEFAULT_PAGE_SIZE'],
+                current_app.config['SWEETS_MAX_PAGE_SIZE']
+            )
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        return jsonify({'message': 'Low stock sweets', **reports.low_stock(threshold, limit)}), 200
+    except Exception:
+        logger.exception('Low stock report failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@analytics_bp.route('/price-histogram', methods=['GET'])
+@admin_required()
+def price_histogram():
+    try:
+        try:
+            buckets = parse_positive_int(
+                request.args.get('buckets'),
+                current_app.config['ANALYTICS_HISTOGRAM_BUCKETS'],
+                'buckets',
+                current_app.config['ANALYTICS_MAX_HISTOGRAM_BUCKETS']
+            )
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        return jsonify({'message': 'Price distribution', **reports.price_histogram(buckets)}), 200
+    except Exception:
+        logger.exception('Price histogram report failed')
+        return jsonify({'error': 'Internal server error'}), 500
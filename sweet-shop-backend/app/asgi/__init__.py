@@ -0,0 +1,138 @@
+import asyncio
+from pymongo import MongoClient
+from quart import Quart, jsonify, request
+from app import log, serialization, indexes
+from app.models import passwords, Sweet
+from app.asgi import ratelimit, reports, stock, tokens
+from app.asgi.models import mongo, AsyncHold
+from app.holds import sweeper
+from app.ledger import ledger
+from app.db import pool_stats, catalogue_read_preference
+from config import config
+
+def bootstrap_indexes(app_config):
+    """Create (and optionally verify) indexes with the synchronous helpers"""
+    client = MongoClient(app_config['MONGO_URI'])
+    try:
+        db = client.get_default_database()
+        indexes.ensure_indexes(db)
+        if app_config['MONGO_VERIFY_INDEXES']:
+            indexes.verify_indexes(db)
+    finally:
+        client.close()
+
+def create_asgi_app(config_name='default'):
+    """Async variant of create_app: the same API on Quart and Motor.
+
+    A request waiting on Mongo no longer holds a worker thread, so one
+    process can keep far more requests in flight. Serve it with an ASGI
+    server, e.g. ``hypercorn asgi:app``.
+    """
+    app = Quart(__name__)
+
+    # Load configuration
+    app.config.from_object(config[config_name])
+
+    serialization.init_app(app)
+    log.configure(app.config)
+
+    # Initialize extensions
+    mongo.init_app(app)
+    passwords.init_app(app)
+    tokens.init_app(app)
+    ratelimit.init_app(app)
+    reports.init_app(app)
+    stock.init_app(app)
+    Sweet.catalogue_reads = catalogue_read_preference(app.config)
+
+    @app.before_serving
+    async def create_indexes():
+        if app.config['MONGO_CREATE_INDEXES']:
+            await asyncio.to_thread(bootstrap_indexes, app.config)
+
+    @app.before_serving
+    async def start_ledger():
+        # The ledger writes from its own thread; Motor calls have to be
+        # handed to the serving loop
+        loop = asyncio.get_running_loop()
+
+        def write(movements):
+            insert = mongo.db.inventory_movements.insert_many(movements, ordered=False)
+            asyncio.run_coroutine_threadsafe(insert, loop).result()
+
+        ledger.init_app(app, write)
+
+    @app.after_serving
+    async def stop_ledger():
+        await asyncio.to_thread(ledger.close)
+
+    @app.before_serving
+    async def start_hold_sweeper():
+        # Like the ledger, the sweeper runs on its own thread
+        loop = asyncio.get_running_loop()
+
+        def release_expired():
+            return asyncio.run_coroutine_threadsafe(AsyncHold.release_expired(), loop).result()
+
+        sweeper.init_app(app, release_expired)
+        sweeper.start()
+
+    @app.after_serving
+    async def stop_hold_sweeper():
+        await asyncio.to_thread(sweeper.close)
+
+    @app.before_request
+    async def assign_request_id():
+        log.current_request_id.set(log.request_id(request.headers))
+
+    @app.after_request
+    async def finish_response(response):
+        response.headers['X-Request-ID'] = log.current_request_id.get()
+
+        # Same CORS policy flask_cors applies to the WSGI app
+        origin = request.headers.get('Origin')
+        if origin in app.config['CORS_ORIGINS']:
+            response.headers['Access-Control-Allow-Origin'] = origin
+            response.headers['Access-Control-Allow-Credentials'] = 'true'
+            response.vary.add('Origin')
+            if request.method == 'OPTIONS':
+                response.headers['Access-Control-Allow-Methods'] = response.headers.get('Allow', '')
+                response.headers['Access-Control-Allow-Headers'] = request.headers.get(
+                    'Access-Control-Request-Headers', ''
+                )
+        return response
+
+    # Register blueprints
+    from .auth import auth_bp
+    from .sweets import sweets_bp
+    from .inventory import inventory_bp
+    from .analytics import analytics_bp
+
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(sweets_bp, url_prefix='/api/sweets')
+    app.register_blueprint(inventory_bp, url_prefix='/api/sweets')
+    app.register_blueprint(analytics_bp, url_prefix='/api/analytics')
+
+    # Error handlers
+    @app.errorhandler(404)
+    async def not_found(error):
+        return jsonify({'error': 'Not found'}), 404
+
+    @app.errorhandler(500)
+    async def internal_error(error):
+        return jsonify({'error': 'Internal server error'}), 500
+
+    @app.route('/')
+    async def home():
+        return jsonify({'message': 'TDD Kata Sweet Shop Backend API'})
+
+    @app.route('/api/health')
+    async def health():
+        return jsonify({
+            'status': 'healthy',
+            'service': 'sweet-shop-api',
+            'server': 'asgi',
+            'mongo_pool': pool_stats.snapshot()
+        })
+
+    return app
@@ -0,0 +1,138 @@
+import logging
+from jwt import InvalidTokenError
+from quart import Blueprint, request, jsonify
+from app.asgi.models import AsyncUser
+from app.asgi.ratelimit import rate_limited
+from app.asgi.tokens import (
+    create_access_token, create_refresh_token, decode_token, get_jwt, jwt_required, revoke
+)
+from app.passwords import HasherBusy
+from app.validation import ValidationError, parse_registration, parse_login
+
+auth_bp = Blueprint('auth', __name__)
+logger = logging.getLogger(__name__)
+
+def busy_response(error):
+    """503 telling the client when to retry a shed login or registration"""
+    response = jsonify({'error': 'Server is busy, please try again shortly'})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+def user_token(user):
+    return create_access_token(
+        identity=str(user['id']),
+        additional_claims={
+            'email': user['email'],
+            'role': user['role'],
+            'name': user['name']
+        }
+    )
+
+@auth_bp.route('/register', methods=['POST'])
+@rate_limited
+async def register():
+    try:
+        try:
+            fields = parse_registration(await request.get_json())
+        except ValidationError as e:
+            logger.info('Registration rejected', extra={'reason': e.reason, **e.details})
+            return jsonify({'error': str(e)}), 400
+
+        if await AsyncUser.find_by_email(fields['email']):
+            logger.info('Registration rejected', extra={'reason': 'duplicate email'})
+            return jsonify({'error': 'User with this email already exists'}), 400
+
+        user = await AsyncUser.create(**fields)
+        if not user:
+            logger.error('User creation failed', extra={'email': fields['email']})
+            return jsonify({'error': 'Failed to create user'}), 500
+
+        logger.info('User registered', extra={'user_id': user['id'], 'role': user['role']})
+        return jsonify({
+            'message': 'User registered successfully',
+            'token': user_token(user),
+            'refresh_token': create_refresh_token(str(user['id'])),
+            'user': AsyncUser.to_dict(user)
+        }), 201
+
+    except HasherBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        logger.exception('Registration failed')
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+@auth_bp.route('/login', methods=['POST'])
+@rate_limited
+async def login():
+    try:
+        try:
+            email, password = parse_login(await request.get_json())
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        user = await AsyncUser.find_by_email(email)
+        if not user:
+            logger.info('Login failed', extra={'reason': 'unknown email'})
+            return jsonify({'error': 'Invalid credentials'}), 401
+
+        if not await AsyncUser.verify_password(user['password'], password):
+            logger.info('Login failed', extra={'reason': 'invalid password', 'user_id': user['id']})
+            return jsonify({'error': 'Invalid credentials'}), 401
+
+        logger.info('Login successful', extra={'user_id': user['id']})
+        return jsonify({
+            'message': 'Login successful',
+            'token': user_token(user),
+            'refresh_token': create_refresh_token(str(user['id'])),
+            'user': AsyncUser.to_dict(user)
+        }), 200
+
+    except HasherBusy as e:
+        return busy_response(e)
+    except Exception:
+        logger.exception('Login failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@auth_bp.route('/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+@rate_limited
+async def refresh():
+    try:
+        user = await AsyncUser.find_by_id(get_jwt()['sub'])
+        if not user:
+            return jsonify({'error': 'User no longer exists'}), 401
+
+        return jsonify({
+            'message': 'Token refreshed',
+            'token': user_token(user)
+        }), 200
+
+    except Exception:
+        logger.exception('Token refresh failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@auth_bp.route('/logout', methods=['POST'])
+@jwt_required()
+async def logout():
+    try:
+        claims = get_jwt()
+        revoked = [claims]
+
+        refresh_token = ((await request.get_json(silent=True)) or {}).get('refresh_token')
+        if refresh_token:
+            try:
+                refresh_claims = decode_token(refresh_token)
+            except InvalidTokenError:
+                refresh_claims = {}
+            if refresh_claims.get('type') != 'refresh' or refresh_claims.get('sub') != claims['sub']:
+                return jsonify({'error': 'Invalid refresh token'}), 400
+            revoked.append(refresh_claims)
+
+        for token_claims in revoked:
+            await revoke(token_claims)
+        logger.info('User logged out', extra={'user_id': claims['sub']})
+        return jsonify({'message': 'Logged out successfully'}), 200
+
+    except Exception:
+        logger.exception('Logout failed')
+        return jsonify({'error': 'Internal server error'}), 500
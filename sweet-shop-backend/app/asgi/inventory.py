@@ -0,0 +1,233 @@
+import logging
+from quart import Blueprint, current_app, request, jsonify
+from app.asgi.models import AsyncHold, AsyncSweet
+from app.asgi.tokens import admin_required, get_jwt, jwt_required
+from app.asgi.ratelimit import rate_limited
+from app.asgi.sweets import version_conflict
+from app.ledger import ledger
+from app.models import to_object_id
+from app.validation import ValidationError, parse_checkout, parse_if_match, parse_quantity, parse_shards
+
+inventory_bp = Blueprint('inventory', __name__)
+logger = logging.getLogger(__name__)
+
+@inventory_bp.route('/<sweet_id>/purchase', methods=['POST'])
+@jwt_required()
+@rate_limited
+async def purchase_sweet(sweet_id):
+    try:
+        try:
+            quantity = parse_quantity(await request.get_json(), default=1)
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        updated_sweet = await AsyncSweet.purchase(sweet_id, quantity)
+
+        if not updated_sweet:
+            sweet = await AsyncSweet.find_by_id(sweet_id, primary=True)
+            if not sweet:
+                return jsonify({'error': 'Sweet not found'}), 404
+            return jsonify({'error': f'Not enough stock. Available: {sweet["quantity"]}'}), 400
+
+        ledger.record(updated_sweet['id'], -quantity, get_jwt().get('sub'), 'purchase')
+        return jsonify({
+            'message': f'Purchased {quantity} {updated_sweet["name"]}(s) successfully',
+            'sweet': AsyncSweet.to_dict(updated_sweet)
+        }), 200
+
+    except Exception:
+        logger.exception('Purchase failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@inventory_bp.route('/checkout', methods=['POST'])
+@jwt_required()
+@rate_limited
+async def checkout():
+    try:
+        try:
+            lines = parse_checkout(await request.get_json(), to_object_id)
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        success, results = await AsyncSweet.checkout(lines)
+
+        if not success:
+            return jsonify({
+                'error': 'Checkout failed, no items were purchased',
+                'items': results
+            }), 400
+
+        for result in results:
+            ledger.record(result['sweet_id'], -result['quantity'], get_jwt().get('sub'), 'checkout')
+        total = sum(result['price'] * result['quantity'] for result in results)
+        return jsonify({
+            'message': 'Checkout successful',
+            'items': results,
+            'total': round(total, 2)
+        }), 200
+
+    except Exception:
+        logger.exception('Checkout failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@inventory_bp.route('/holds', methods=['POST'])
+@jwt_required()
+@rate_limited
+async def create_hold():
+    try:
+        try:
+            lines = parse_checkout(await request.get_json(), to_object_id, action='Hold')
+            hold, results = await AsyncHold.create(get_jwt().get('sub'), lines)
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if not hold:
+            return jsonify({
+                'error': 'Hold failed, no items were reserved',
+                'items': results
+            }), 400
+
+        return jsonify({
+            'message': 'Items held',
+            'hold': AsyncHold.to_dict(hold),
+            'items': results
+        }), 201
+
+    except Exception:
+        logger.exception('Hold failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@inventory_bp.route('/holds/<hold_id>/confirm', methods=['POST'])
+@jwt_required()
+async def confirm_hold(hold_id):
+    try:
+        user_id = get_jwt().get('sub')
+        hold = await AsyncHold.confirm(hold_id, user_id)
+
+        if not hold:
+            if await AsyncHold.find(hold_id, user_id):
+                return jsonify({'error': 'Hold has expired'}), 410
+            return jsonify({'error': 'Hold not found'}), 404
+        if not hold['items']:
+            return jsonify({'error': 'The held sweets no longer exist'}), 410
+
+        for item in hold['items']:
+            ledger.record(item['sweet_id'], -item['quantity'], user_id, 'checkout')
+        data = AsyncHold.to_dict(hold)
+        return jsonify({
+            'message': 'Checkout successful',
+            'items': data['items'],
+            'total': data['total']
+        }), 200
+
+    except Exception:
+        logger.exception('Confirming hold failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@inventory_bp.route('/holds/<hold_id>', methods=['DELETE'])
+@jwt_required()
+async def release_hold(hold_id):
+    try:
+        hold = await AsyncHold.release(hold_id, get_jwt().get('sub'))
+        if not hold:
+            return jsonify({'error': 'Hold not found'}), 404
+
+        return jsonify({'message': 'Hold released', 'hold': AsyncHold.to_dict(hold)}), 200
+
+    except Exception:
+        logger.exception('Releasing hold failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@inventory_bp.route('/restock', methods=['POST'])
+@admin_required()
+async def restock_many():
+    try:
+        try:
+            lines = parse_checkout(await request.get_json(), to_object_id, action='Restock')
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        results = await AsyncSweet.restock_many(lines)
+
+        restocked = [result for result in results if result['status'] == 'restocked']
+        for result in restocked:
+            ledger.record(result['sweet_id'], result['quantity'], get_jwt().get('sub'), 'restock')
+        return jsonify({
+            'message': 'Restock finished',
+            'restocked': len(restocked),
+            'not_found': len(results) - len(restocked),
+            'items': results
+        }), 200
+
+    except Exception:
+        logger.exception('Bulk restock failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@inventory_bp.route('/<sweet_id>/restock', methods=['POST'])
+@admin_required()
+async def restock_sweet(sweet_id):
+    try:
+        try:
+            quantity = parse_quantity(await request.get_json(), default=0)
+            version = parse_if_match(request.headers.get('If-Match'))
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        updated_sweet = await AsyncSweet.restock(sweet_id, quantity, version)
+        if not updated_sweet:
+            sweet = await AsyncSweet.find_by_id(sweet_id, primary=True)
+            if not sweet:
+                return jsonify({'error': 'Sweet not found'}), 404
+            return version_conflict(sweet)
+
+        ledger.record(updated_sweet['id'], quantity, get_jwt().get('sub'), 'restock')
+        return jsonify({
+            'message': f'Restocked {quantity} {updated_sweet["name"]}(s) successfully',
+            'sweet': AsyncSweet.to_dict(updated_sweet)
+        }), 200
+
+    except Exception:
+        logger.exception('Restock failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@inventory_bp.route('/<sweet_id>/shards', methods=['PUT'])
+@admin_required()
+async def shard_stock(sweet_id):
+    try:
+        try:
+            shards = parse_shards(await request.get_json(silent=True), current_app.config['STOCK_DEFAULT_SHARDS'],
+                                  current_app.config['STOCK_MAX_SHARDS'])
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        sweet = await AsyncSweet.shard_stock(sweet_id, shards)
+        if not sweet:
+            return jsonify({'error': 'Sweet not found'}), 404
+
+        return jsonify({
+            'message': f'Stock of {sweet["name"]} split over {shards} counters',
+            'sweet': AsyncSweet.to_dict(sweet),
+            'shards': shards
+        }), 200
+
+    except Exception:
+        logger.exception('Sharding stock failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@inventory_bp.route('/<sweet_id>/shards', methods=['DELETE'])
+@admin_required()
+async def unshard_stock(sweet_id):
+    try:
+        sweet = await AsyncSweet.unshard_stock(sweet_id)
+        if not sweet:
+            return jsonify({'error': 'Sweet not found'}), 404
+
+        return jsonify({
+            'message': f'Stock of {sweet["name"]} folded back into one counter',
+            'sweet': AsyncSweet.to_dict(sweet),
+            'shards': 0
+        }), 200
+
+    except Exception:
+        logger.exception('Unsharding stock failed')
+        return jsonify({'error': 'Internal server error'}), 500
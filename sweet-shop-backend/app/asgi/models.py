@@ -0,0 +1,540 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from bson import ObjectId
+from app.asgi import stock
+from app.db import client_options, pool_stats
+from app.holds import (
+    active_holds, confirm_updates, hold_document, held_quantities, holds_released, release_updates, sweeper, too_many_holds,
+    without_deleted
+)
+from app.models import User, Sweet, Hold, passwords, to_object_id
+from app.serialization import dumps
+from app.validation import ValidationError
+
+class MotorMongo:
+    """Motor counterpart of flask_pymongo.PyMongo for the ASGI app.
+
+    The client is created once the server starts serving, in each worker
+    and on the event loop that will use it, and closed when the server stops.
+    Pool settings and stats are shared with the WSGI app's client.
+    """
+
+    def __init__(self):
+        self.cx = None
+        self.db = None
+
+    def init_app(self, app, **kwargs):
+        options = client_options(app.config, kwargs.pop('event_listeners', ()))
+        options.update(kwargs)
+
+        @app.before_serving
+        async def connect():
+            pool_stats.reset()
+            self.cx = AsyncIOMotorClient(app.config['MONGO_URI'], **options)
+            self.db = self.cx.get_default_database()
+            if app.config['MONGO_WARM_UP']:
+                await self.warm_up(options['minPoolSize'], app.config['MONGO_WARM_UP_TIMEOUT'])
+
+        @app.after_serving
+        async def disconnect():
+            self.cx.close()
+
+    async def warm_up(self, target, timeout):
+        """Open the minimum pool before serving, see ForkSafeMongo.warm_up"""
+        await self.cx.admin.command('ping')
+        deadline = time.monotonic() + timeout
+        while pool_stats.open_connections() < target and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        return pool_stats.open_connections() >= target
+
+mongo = MotorMongo()
+
+def supports_transactions():
+    """Multi-document transactions need a replica set or sharded cluster"""
+    topology = mongo.cx.topology_description.topology_type_name
+    return topology in ('ReplicaSetWithPrimary', 'Sharded')
+
+def _with_id(document):
+    """Swap Mongo's _id for the string id the API exposes"""
+    if document:
+        document['id'] = str(document['_id'])
+        del document['_id']
+    return document
+
+class AsyncUser:
+    to_dict = staticmethod(User.to_dict)
+
+    @staticmethod
+    async def create(email, password, name, role='customer'):
+        user_data = {
+            'email': email,
+            'password': await passwords.hash_async(password),
+            'name': name,
+            'role': role,
+            'created_at': datetime.utcnow(),
+            'updated_at': datetime.utcnow()
+        }
+
+        try:
+            result = await mongo.db.users.insert_one(user_data)
+        except DuplicateKeyError:
+            return None
+        user_data['id'] = str(result.inserted_id)
+        return user_data
+
+    @staticmethod
+    async def find_by_email(email):
+        return _with_id(await mongo.db.users.find_one({'email': email}))
+
+    @staticmethod
+    async def find_by_id(user_id):
+        obj_id = to_object_id(user_id)
+        if not obj_id:
+            return None
+        return _with_id(await mongo.db.users.find_one({'_id': obj_id}))
+
+    @staticmethod
+    async def verify_password(stored_password, provided_password):
+        return await passwords.check_async(stored_password, provided_password)
+
+class AsyncSweet:
+    """Sweet's queries on Motor.
+
+    Query building, cursors and checkout bookkeeping are shared with Sweet.
+    There is no in-process cache here, but catalogue edits still bump the
+    catalogue version so WSGI workers on the same database stay coherent;
+    stock writes move their sweet's updated_at, see Sweet.catalogue_version.
+    """
+
+    FIELDS = Sweet.FIELDS
+    SEARCH_MODES = Sweet.SEARCH_MODES
+    to_dict = staticmethod(Sweet.to_dict)
+
+    @staticmethod
+    async def catalogue_version(session=None):
+        counter = await mongo.db.counters.find_one({'_id': 'sweets'}, session=session)
+        latest = await mongo.db.sweets.find_one(
+            {}, {'updated_at': 1, 'version': 1}, sort=Sweet.LATEST_WRITE, session=session
+        )
+        return Sweet.version_of(counter, latest)
+    
+    @staticmethod
+    def catalogue():
+        """Catalogue reads may go to a secondary, see Sweet.catalogue"""
+        return mongo.db.sweets.with_options(read_preference=Sweet.catalogue_reads)
+    
+    @staticmethod
+    @asynccontextmanager
+    async def catalogue_snapshot():
+        """Causally consistent (session, version), see Sweet.catalogue_snapshot"""
+        async with await mongo.cx.start_session(causal_consistency=True) as session:
+            yield session, await AsyncSweet.catalogue_version(session)
+
+    @staticmethod
+    async def mark_changed():
+        await mongo.db.counters.update_one({'_id': 'sweets'}, {'$inc': {'version': 1}}, upsert=True)
+
+    @staticmethod
+    async def create(name, category, price, quantity=0):
+        sweet_data = {
+            'name': name,
+            'category': category,
+            'price': float(price),
+            'quantity': int(quantity),
+            'version': 1,
+            'created_at': datetime.utcnow(),
+            'updated_at': datetime.utcnow()
+        }
+        sweet_data.update(Sweet.search_fields(name, category))
+
+        try:
+            result = await mongo.db.sweets.insert_one(sweet_data)
+        except DuplicateKeyError:
+            return None
+        sweet_data['id'] = str(result.inserted_id)
+        await AsyncSweet.mark_changed()
+        return sweet_data
+
+    @staticmethod
+    async def get_all_json(fields=None):
+        """The sorted catalogue as a ready-to-send JSON array (bytes)"""
+        async with AsyncSweet.catalogue_snapshot() as (session, _):
+            cursor = AsyncSweet.catalogue().aggregate([
+                {'$sort': {'name': 1}},
+                {'$project': {**Sweet.public_shape(fields), '_id': 1, 'stock_shards': 1}}
+            ], session=session)
+            documents = await stock.with_totals(mongo.db, await cursor.to_list(length=None), key='_id')
+        for document in documents:
+            del document['_id']
+            document.pop('stock_shards', None)
+        return dumps(documents)
+
+    @staticmethod
+    async def iter_all(batch_size, fields=None):
+        """Yield sweets sorted by name without materializing the collection"""
+        projection = Sweet.page_projection(fields, need_name=False)
+
+        async with AsyncSweet.catalogue_snapshot() as (session, _):
+            cursor = AsyncSweet.catalogue().find({}, projection, session=session)
+            cursor = cursor.sort('name', 1).batch_size(batch_size)
+            try:
+                async for sweet in cursor:
+                    yield (await stock.with_totals(mongo.db, [_with_id(sweet)]))[0]
+            finally:
+                await cursor.close()
+
+    @staticmethod
+    async def get_page(limit, after=None, fields=None, with_total=True):
+        """Keyset page, see Sweet.get_page"""
+        sweets = AsyncSweet.catalogue()
+        query = Sweet.page_query(after)
+        async with AsyncSweet.catalogue_snapshot() as (session, _):
+            cursor = sweets.find(query, Sweet.page_projection(fields), session=session)
+            cursor = cursor.sort(Sweet.PAGE_ORDER).limit(limit + 1)
+            page = [_with_id(sweet) for sweet in await cursor.to_list(length=None)]
+        page, next_cursor = Sweet.split_page(page, limit)
+        await stock.with_totals(mongo.db, page)
+
+        total = await sweets.estimated_document_count() if with_total else None
+        return page, next_cursor, total
+
+    @staticmethod
+    async def find_by_id(sweet_id, primary=False):
+        """Catalogue read of one sweet; pass primary=True before read-modify-write"""
+        obj_id = to_object_id(sweet_id)
+        if not obj_id:
+            return None
+        if primary:
+            sweet = _with_id(await mongo.db.sweets.find_one({'_id': obj_id}))
+        else:
+            async with AsyncSweet.catalogue_snapshot() as (session, _):
+                sweet = _with_id(await AsyncSweet.catalogue().find_one({'_id': obj_id}, session=session))
+        return (await stock.with_totals(mongo.db, [sweet]))[0] if sweet else None
+
+    @staticmethod
+    async def update(sweet_id, update_data, version=None):
+        """Set fields and return the updated sweet, or None, see Sweet.update"""
+        obj_id = to_object_id(sweet_id)
+        if not obj_id:
+            return None
+
+        update_data['updated_at'] = datetime.utcnow()
+        update_data.update(Sweet.search_fields(update_data.get('name'), update_data.get('category')))
+
+        try:
+            before = await mongo.db.sweets.find_one_and_update(
+                Sweet.version_query(obj_id, version),
+                {'$set': update_data, '$inc': {'version': 1}},
+                return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            raise ValidationError('Sweet with this name already exists')
+        if not before:
+            return None
+        await AsyncSweet.mark_changed()
+        return (await stock.with_totals(mongo.db, [Sweet.applied_update(before, update_data)]))[0]
+
+    @staticmethod
+    async def restock(sweet_id, quantity, version=None):
+        """Atomically add quantity to stock, see Sweet.restock"""
+        obj_id = to_object_id(sweet_id)
+        if not obj_id:
+            return None
+
+        sweet = await mongo.db.sweets.find_one_and_update(
+            Sweet.version_query(obj_id, version),
+            {
+                '$inc': {'quantity': quantity, 'version': 1},
+                '$set': {'updated_at': datetime.utcnow()}
+            },
+            return_document=ReturnDocument.AFTER
+        )
+        if not sweet:
+            return None
+        return (await stock.with_totals(mongo.db, [_with_id(sweet)]))[0]
+
+    @staticmethod
+    async def purchase(sweet_id, quantity):
+        """Atomically take quantity from stock, return updated sweet or None"""
+        obj_id = to_object_id(sweet_id)
+        if not obj_id:
+            return None
+
+        shards = stock.stock.hint(obj_id)
+        if shards:
+            sweet = await AsyncSweet._purchase_sharded(obj_id, shards, quantity)
+            if sweet:
+                return sweet
+
+        sweet = await mongo.db.sweets.find_one_and_update(
+            {'_id': obj_id, 'quantity': {'$gte': quantity}},
+            {
+                '$inc': {'quantity': -quantity, 'version': 1},
+                '$set': {'updated_at': datetime.utcnow()}
+            },
+            return_document=ReturnDocument.AFTER
+        )
+        if sweet:
+            return (await stock.with_totals(mongo.db, [_with_id(sweet)]))[0]
+
+        current = await mongo.db.sweets.find_one({'_id': obj_id}, {'stock_shards': 1})
+        stock.stock.remember(obj_id, current and current.get('stock_shards'))
+        if current and current.get('stock_shards') and current['stock_shards'] != shards:
+            return await AsyncSweet._purchase_sharded(obj_id, current['stock_shards'], quantity)
+        return None
+
+    @staticmethod
+    async def _purchase_sharded(obj_id, shards, quantity):
+        """Take stock from one counter, see Sweet._purchase_sharded"""
+        purchased, _ = await stock.purchase(mongo.db, obj_id, shards, quantity)
+        if not purchased:
+            return None
+        return await AsyncSweet.find_by_id(str(obj_id))
+
+    @staticmethod
+    async def shard_stock(sweet_id, shards):
+        obj_id = to_object_id(sweet_id)
+        if not obj_id or not await stock.enable(mongo.db, obj_id, shards):
+            return None
+        await AsyncSweet.mark_changed()
+        return await AsyncSweet.find_by_id(sweet_id, primary=True)
+
+    @staticmethod
+    async def unshard_stock(sweet_id):
+        obj_id = to_object_id(sweet_id)
+        if not obj_id or not await stock.disable(mongo.db, obj_id):
+            return None
+        await AsyncSweet.mark_changed()
+        return await AsyncSweet.find_by_id(sweet_id, primary=True)
+
+    @staticmethod
+    async def checkout(items, hold=False):
+        """Purchase every (sweet_id, quantity) line or none of them, see Sweet.checkout"""
+        sweets = mongo.db.sweets
+        wanted = Sweet.checkout_quantities(items)
+        reserve = AsyncSweet._checkout_transaction if supports_transactions() else AsyncSweet._checkout_bulk
+
+        for obj_id, quantity in wanted.items():
+            if stock.stock.hint(obj_id):
+                await stock.gather(mongo.db, obj_id, quantity)
+        docs, failed = await reserve(sweets, wanted, hold)
+
+        unhinted = [obj_id for obj_id in failed
+                    if docs.get(obj_id, {}).get('stock_shards') and not stock.stock.hint(obj_id)]
+        if unhinted:
+            for obj_id in unhinted:
+                stock.stock.remember(obj_id, docs[obj_id]['stock_shards'])
+                await stock.gather(mongo.db, obj_id, wanted[obj_id])
+            docs, failed = await reserve(sweets, wanted, hold)
+        await stock.with_totals(mongo.db, list(docs.values()), key='_id')
+        return not failed, Sweet.checkout_results(items, docs, failed, 'held' if hold else 'purchased')
+
+    @staticmethod
+    async def _checkout_transaction(sweets, wanted, hold=False):
+        async def reserve(session):
+            docs, failed = {}, set()
+            now = datetime.utcnow()
+            for obj_id, quantity in wanted.items():
+                doc = await sweets.find_one_and_update(
+                    {'_id': obj_id, 'quantity': {'$gte': quantity}},
+                    {'$inc': Sweet.reservation_inc(quantity, hold), '$set': {'updated_at': now}},
+                    return_document=ReturnDocument.AFTER,
+                    session=session
+                )
+                if doc:
+                    docs[obj_id] = doc
+                else:
+                    failed.add(obj_id)
+
+            if failed:
+                async for doc in sweets.find({'_id': {'$in': list(failed)}}, session=session):
+                    docs[doc['_id']] = doc
+                await session.abort_transaction()
+            return docs, failed
+
+        async with await mongo.cx.start_session() as session:
+            return await session.with_transaction(reserve)
+
+    @staticmethod
+    async def _checkout_bulk(sweets, wanted, hold=False):
+        order_id = ObjectId()
+        now = datetime.utcnow()
+
+        await sweets.bulk_write(Sweet.reservation_updates(wanted, order_id, now, hold), ordered=False)
+
+        cursor = sweets.find({'_id': {'$in': list(wanted)}})
+        docs = {doc['_id']: doc for doc in await cursor.to_list(length=None)}
+        applied = Sweet.applied_reservations(wanted, docs, order_id)
+        failed = set(wanted) - set(applied)
+
+        if not failed:
+            await sweets.update_many(
+                {'_id': {'$in': applied}},
+                {'$pull': {'pending_checkouts': order_id}}
+            )
+        elif applied:
+            await sweets.bulk_write(Sweet.compensating_updates(wanted, applied, order_id, now, hold), ordered=False)
+        return docs, failed
+
+    @staticmethod
+    async def find_by_name(name):
+        return _with_id(await mongo.db.sweets.find_one({'name': name}))
+
+    @staticmethod
+    async def reprice(query, percent=None, amount=None):
+        """Bulk price change, see Sweet.reprice"""
+        sweets = mongo.db.sweets
+        guarded, skipped = query, 0
+        if amount is not None and amount < 0:
+            price = query.get('price', {})
+            guarded = {**query, 'price': {**price, '$gt': -amount}}
+            skipped = await sweets.count_documents({**query, 'price': {**price, '$lte': -amount}})
+
+        result = await sweets.update_many(guarded, Sweet.price_update(percent, amount))
+        await AsyncSweet.mark_changed()
+        return result.matched_count, result.modified_count, skipped
+
+    @staticmethod
+    async def restock_many(lines):
+        """Multi-item restock in one bulk_write, see Sweet.restock_many"""
+        sweets = mongo.db.sweets
+        wanted = Sweet.checkout_quantities(lines)
+        now = datetime.utcnow()
+        await sweets.bulk_write([
+            UpdateOne(
+                {'_id': obj_id},
+                {'$inc': {'quantity': quantity, 'version': 1}, '$set': {'updated_at': now}}
+            )
+            for obj_id, quantity in wanted.items()
+        ], ordered=False)
+
+        cursor = sweets.find({'_id': {'$in': list(wanted)}}, {'name': 1, 'quantity': 1, 'stock_shards': 1})
+        docs = {doc['_id']: doc for doc in await cursor.to_list(length=None)}
+        await stock.with_totals(mongo.db, list(docs.values()), key='_id')
+        return Sweet.restock_results(wanted, docs)
+
+    @staticmethod
+    async def upsert_many(rows):
+        """Bulk upsert by name, see Sweet.upsert_many"""
+        if not rows:
+            return {}, 0, {}, {}
+        sweets = mongo.db.sweets
+        batch_id = ObjectId()
+        try:
+            result = await sweets.bulk_write(
+                Sweet.upsert_operations(rows, datetime.utcnow(), batch_id), ordered=False
+            )
+            result = result.bulk_api_result
+        except BulkWriteError as e:
+            result = e.details
+        inserted = {upsert['index']: str(upsert['_id']) for upsert in result.get('upserted', [])}
+        failed = {error['index']: error for error in result.get('writeErrors', [])}
+        if failed:
+            cursor = sweets.find(Sweet.sharded_query(rows, failed), {'name': 1})
+            Sweet.mark_sharded(rows, failed, await cursor.to_list(length=None))
+
+        adjusted = {}
+        if result.get('nMatched'):
+            query = {'name': {'$in': [row['name'] for row in rows]}, 'pending_import.batch': batch_id}
+            docs = await sweets.find(query, {'name': 1, 'pending_import': 1}).to_list(length=None)
+            adjusted = Sweet.import_adjustments(rows, inserted, failed, docs)
+            await sweets.update_many(query, {'$unset': {'pending_import': ''}})
+        await AsyncSweet.mark_changed()
+        return inserted, result.get('nModified', 0), failed, adjusted
+
+    @staticmethod
+    async def delete(sweet_id):
+        obj_id = to_object_id(sweet_id)
+        if not obj_id:
+            return False
+        result = await mongo.db.sweets.delete_one({'_id': obj_id})
+        await mongo.db.stock_shards.delete_many({'sweet_id': obj_id})
+        stock.stock.remember(obj_id, None)
+        await AsyncSweet.mark_changed()
+        return result.deleted_count > 0
+
+    @staticmethod
+    async def search(name=None, category=None, min_price=None, max_price=None, mode='auto'):
+        query = Sweet.search_query(name, category, min_price, max_price, mode)
+        async with AsyncSweet.catalogue_snapshot() as (session, _):
+            cursor = AsyncSweet.catalogue().find(query, session=session).sort('name', 1)
+            sweets = [_with_id(sweet) for sweet in await cursor.to_list(length=None)]
+        return await stock.with_totals(mongo.db, sweets)
+
+class AsyncHold:
+    """Cart holds on Motor, see Hold"""
+
+    to_dict = staticmethod(Hold.to_dict)
+
+    @staticmethod
+    async def create(user_id, items):
+        now = datetime.utcnow()
+        active = await mongo.db.holds.count_documents(active_holds(user_id, now), limit=sweeper.max_active)
+        if active >= sweeper.max_active:
+            raise ValidationError(too_many_holds(sweeper.max_active))
+        success, results = await AsyncSweet.checkout(items, hold=True)
+        if not success:
+            return None, results
+        hold = hold_document(user_id, results, sweeper.ttl, now)
+        await mongo.db.holds.insert_one(hold)
+        return hold, results
+
+    @staticmethod
+    async def find(hold_id, user_id):
+        obj_id = to_object_id(hold_id)
+        if not obj_id:
+            return None
+        return await mongo.db.holds.find_one({'_id': obj_id, 'user_id': user_id})
+
+    @staticmethod
+    async def confirm(hold_id, user_id):
+        obj_id = to_object_id(hold_id)
+        if not obj_id:
+            return None
+        now = datetime.utcnow()
+        hold = await mongo.db.holds.find_one_and_delete(
+            {'_id': obj_id, 'user_id': user_id, 'expires_at': {'$gt': now}}
+        )
+        if not hold:
+            return None
+        updates = confirm_updates(hold, now)
+        result = await mongo.db.sweets.bulk_write(updates, ordered=False)
+        if result.matched_count < len(updates):
+            cursor = mongo.db.sweets.find({'_id': {'$in': list(held_quantities(hold))}}, {'_id': 1})
+            hold = without_deleted(hold, {sweet['_id'] for sweet in await cursor.to_list(length=None)})
+        return hold
+
+    @staticmethod
+    async def release(hold_id, user_id):
+        obj_id = to_object_id(hold_id)
+        if not obj_id:
+            return None
+        hold = await mongo.db.holds.find_one_and_delete({'_id': obj_id, 'user_id': user_id})
+        if not hold:
+            return None
+        await AsyncHold._put_back([hold])
+        holds_released.inc('cancelled')
+        return hold
+
+    @staticmethod
+    async def release_expired(now=None):
+        now = now or datetime.utcnow()
+        cursor = mongo.db.holds.find({'expires_at': {'$lte': now}}, {'_id': 1}).limit(sweeper.batch_size)
+        released = []
+        async for candidate in cursor:
+            hold = await mongo.db.holds.find_one_and_delete({'_id': candidate['_id'], 'expires_at': {'$lte': now}})
+            if hold:
+                released.append(hold)
+        if released:
+            await AsyncHold._put_back(released, now)
+            holds_released.inc('expired', amount=len(released))
+        return len(released)
+
+    @staticmethod
+    async def _put_back(holds, now=None):
+        await mongo.db.sweets.bulk_write(release_updates(holds, now or datetime.utcnow()), ordered=False)
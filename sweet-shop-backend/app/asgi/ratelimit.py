@@ -0,0 +1,40 @@
+import math
+from functools import wraps
+import jwt
+from quart import jsonify, request
+from app.ratelimit import RateLimiter, MongoBackend
+from app.asgi.models import mongo
+from app.asgi.tokens import decode_token, get_jwt
+
+# Same limits and bucket keys as app.ratelimit, checked without blocking the loop
+limiter = RateLimiter()
+
+def init_app(app):
+    limiter.init_app(app, MongoBackend(lambda: mongo.db.rate_limits))
+
+def too_many_requests(wait):
+    response = jsonify({'error': 'Too many requests, please try again later'})
+    response.headers['Retry-After'] = str(math.ceil(wait))
+    return response, 429
+
+def client_key():
+    """The JWT identity when the request carries a valid token, else its IP"""
+    identity = get_jwt().get('sub')
+    if not identity:
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme == 'Bearer' and token:
+            try:
+                identity = decode_token(token).get('sub')
+            except jwt.InvalidTokenError:
+                identity = None
+    return f'user:{identity}' if identity else f'ip:{request.remote_addr}'
+
+def rate_limited(view):
+    @wraps(view)
+    async def wrapper(*args, **kwargs):
+        if limiter.limit_for(request.endpoint):
+            wait = await limiter.check_async(request.endpoint, client_key())
+            if wait:
+                return too_many_requests(wait)
+        return await view(*args, **kwargs)
+    return wrapper
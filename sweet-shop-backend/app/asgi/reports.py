@@ -0,0 +1,58 @@
+from app.asgi import stock
+from app.asgi.models import AsyncSweet, mongo
+from app.reports import (
+    add_counters_to_buckets, add_counters_to_groups, counters_pipeline, histogram_boundaries, low_stock_match,
+    low_stock_pipeline, low_stock_report, price_histogram_pipeline, price_histogram_report, reports,
+    stock_value_pipeline, stock_value_report
+)
+
+def init_app(app):
+    reports.init_app(app)
+
+async def stock_version(session, version):
+    return version, await stock.units(mongo.db, session)
+
+async def stock_value():
+    async with AsyncSweet.catalogue_snapshot() as (session, version):
+        async def compute():
+            cursor = AsyncSweet.catalogue().aggregate(stock_value_pipeline(), session=session)
+            groups = await cursor.to_list(length=None)
+            cursor = mongo.db.stock_shards.aggregate(counters_pipeline(), session=session)
+            return stock_value_report(add_counters_to_groups(groups, await cursor.to_list(length=None)))
+        return await reports.get_async(('stock-value',), await stock_version(session, version), compute)
+
+async def low_stock(threshold, limit):
+    async with AsyncSweet.catalogue_snapshot() as (session, version):
+        async def compute():
+            sweets = AsyncSweet.catalogue()
+            cursor = sweets.aggregate(low_stock_pipeline(threshold, limit), session=session)
+            documents = await cursor.to_list(length=None)
+            cursor = sweets.aggregate([*low_stock_match(threshold), {'$count': 'count'}], session=session)
+            counted = await cursor.to_list(length=None)
+            return low_stock_report(threshold, documents, counted[0]['count'] if counted else 0)
+        return await reports.get_async(('low-stock', threshold, limit), await stock_version(session, version), compute)
+
+async def price_range(sweets, session=None):
+    ends = []
+    for direction in (1, -1):
+        cursor = sweets.find({}, {'price': 1}, session=session).sort('price', direction).limit(1)
+        found = await cursor.to_list(length=1)
+        if not found:
+            return None
+        ends.append(found[0]['price'])
+    return tuple(ends)
+
+async def price_histogram(buckets):
+    async with AsyncSweet.catalogue_snapshot() as (session, version):
+        async def compute():
+            sweets = AsyncSweet.catalogue()
+            prices = await price_range(sweets, session)
+            if prices is None:
+                return price_histogram_report([], [])
+            boundaries = histogram_boundaries(*prices, buckets)
+            cursor = sweets.aggregate(price_histogram_pipeline(boundaries), session=session)
+            rows = await cursor.to_list(length=None)
+            cursor = mongo.db.stock_shards.aggregate(counters_pipeline(), session=session)
+            counters = await cursor.to_list(length=None)
+            return price_histogram_report(boundaries, add_counters_to_buckets(boundaries, rows, counters))
+        return await reports.get_async(('price-histogram', buckets), await stock_version(session, version), compute)
@@ -0,0 +1,131 @@
+import random
+from datetime import datetime
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from app.stock import (
+    add_totals, needs_total, pool_query, pool_update, rebalances, shard_query, split, stock, sweet_update, take_update,
+    taken, totals_pipeline, units_pipeline
+)
+
+def init_app(app):
+    stock.init_app(app)
+
+# Motor versions of StockShards' operations; see app/stock.py
+
+async def totals(db, sweet_ids, session=None):
+    if not sweet_ids:
+        return {}
+    cursor = db.stock_shards.aggregate(totals_pipeline(sweet_ids), session=session)
+    return {str(row['_id']): row['quantity'] for row in await cursor.to_list(length=None)}
+
+async def units(db, session=None):
+    rows = await db.stock_shards.aggregate(units_pipeline(), session=session).to_list(length=None)
+    return rows[0]['quantity'] if rows else 0
+
+async def with_totals(db, sweets, key='id', session=None):
+    sharded = [sweet[key] for sweet in sweets if needs_total(sweet)]
+    if not sharded:
+        return sweets
+    ids = [sweet_id if key == '_id' else ObjectId(sweet_id) for sweet_id in sharded]
+    return add_totals(sweets, await totals(db, ids, session), key)
+
+async def enable(db, sweet_id, shards):
+    sweet = await db.sweets.find_one_and_update(
+        {'_id': sweet_id},
+        sweet_update({'stock_shards': shards}),
+        return_document=ReturnDocument.BEFORE
+    )
+    if not sweet:
+        return None
+    await _fold(db, sweet_id, {'sweet_id': sweet_id, 'shard': {'$gte': shards}})
+    before = await db.sweets.find_one_and_update(
+        {'_id': sweet_id}, sweet_update({'quantity': 0}),
+        return_document=ReturnDocument.BEFORE
+    )
+    await db.stock_shards.bulk_write([
+        UpdateOne(shard_query(sweet_id, shard), {'$inc': {'quantity': amount}}, upsert=True)
+        for shard, amount in enumerate(split(before['quantity'] if before else 0, shards))
+    ], ordered=False)
+    stock.remember(sweet_id, shards)
+    return sweet
+
+async def disable(db, sweet_id):
+    sweet = await db.sweets.find_one_and_update(
+        {'_id': sweet_id},
+        sweet_update(unset={'stock_shards': ''})
+    )
+    stock.remember(sweet_id, None)
+    if not sweet:
+        return None
+    await _fold(db, sweet_id, {'sweet_id': sweet_id})
+    return sweet
+
+async def _fold(db, sweet_id, query):
+    moved = 0
+    async for counter in db.stock_shards.find(query, {'_id': 1}):
+        deleted = await db.stock_shards.find_one_and_delete({'_id': counter['_id']})
+        moved += deleted['quantity'] if deleted else 0
+    if moved:
+        await db.sweets.update_one({'_id': sweet_id}, pool_update(moved))
+    return moved
+
+async def purchase(db, sweet_id, shards, quantity):
+    """(purchased, pool_changed), see StockShards.purchase"""
+    order = random.sample(range(shards), shards)
+    for shard in order:
+        result = await db.stock_shards.update_one(
+            shard_query(sweet_id, shard, at_least=quantity), {'$inc': {'quantity': -quantity}}
+        )
+        if result.modified_count:
+            return True, False
+    return await _rebalance(db, sweet_id, order, quantity)
+
+async def _rebalance(db, sweet_id, order, quantity):
+    limit = max(quantity, stock.refill)
+    before = await db.sweets.find_one_and_update(
+        pool_query(sweet_id), take_update(limit, datetime.utcnow()), return_document=ReturnDocument.BEFORE
+    )
+    gathered = from_pool = taken(before, limit)
+    for shard in order:
+        if gathered >= quantity:
+            break
+        need = quantity - gathered
+        before = await db.stock_shards.find_one_and_update(
+            {**shard_query(sweet_id, shard), 'quantity': {'$gt': 0}},
+            take_update(need), return_document=ReturnDocument.BEFORE
+        )
+        gathered += taken(before, need)
+
+    if gathered < quantity:
+        await _return_to_pool(db, sweet_id, gathered)
+        rebalances.inc('sold_out')
+        return False, bool(from_pool or gathered)
+
+    leftover = 0
+    for shard, amount in zip(order, split(gathered - quantity, len(order))):
+        if amount and not (await db.stock_shards.update_one(
+            shard_query(sweet_id, shard), {'$inc': {'quantity': amount}}
+        )).matched_count:
+            leftover += amount
+    await _return_to_pool(db, sweet_id, leftover)
+    rebalances.inc('refilled')
+    return True, bool(from_pool or leftover)
+
+async def _return_to_pool(db, sweet_id, quantity):
+    if quantity:
+        await db.sweets.update_one({'_id': sweet_id}, pool_update(quantity))
+
+async def gather(db, sweet_id, quantity):
+    gathered = 0
+    cursor = db.stock_shards.find({'sweet_id': sweet_id, 'quantity': {'$gt': 0}}, {'_id': 1})
+    for counter in await cursor.to_list(length=None):
+        if gathered >= quantity:
+            break
+        need = quantity - gathered
+        before = await db.stock_shards.find_one_and_update(
+            {'_id': counter['_id'], 'quantity': {'$gt': 0}}, take_update(need),
+            return_document=ReturnDocument.BEFORE
+        )
+        gathered += taken(before, need)
+    await _return_to_pool(db, sweet_id, gathered)
+    return gathered
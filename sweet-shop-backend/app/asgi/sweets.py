@@ -0,0 +1,295 @@
+import io
+import csv
+import logging
+from quart import Blueprint, Response, request, jsonify, current_app
+from app.asgi.models import AsyncSweet
+from app.models import Sweet
+from app.asgi.tokens import admin_required, get_jwt
+from app import bulk
+from app.ledger import ledger
+from app.serialization import dumps
+from app.sweets.routes import NDJSON_MIMETYPE, wants_stream
+from app.validation import (
+    ValidationError, parse_fields, parse_if_match, parse_new_sweet, parse_page_size,
+    parse_price_change, parse_search, parse_sweet_changes
+)
+
+sweets_bp = Blueprint('sweets', __name__)
+logger = logging.getLogger(__name__)
+
+def version_conflict(sweet):
+    """409 for a stale If-Match, see app.sweets.routes.version_conflict"""
+    return jsonify({
+        'error': 'Sweet was changed by someone else, reload and try again',
+        'sweet': AsyncSweet.to_dict(sweet)
+    }), 409
+
+def stream_sweets(mode, fields):
+    """Stream the catalogue one record at a time, see app.sweets.routes"""
+    sweets = AsyncSweet.iter_all(current_app.config['SWEETS_STREAM_BATCH_SIZE'], fields)
+
+    async def generate_ndjson():
+        async for sweet in sweets:
+            yield dumps(AsyncSweet.to_dict(sweet, fields)) + b'\n'
+
+    async def generate_json():
+        yield b'{"message":"Sweets retrieved successfully","sweets":['
+        separator = b''
+        async for sweet in sweets:
+            yield separator + dumps(AsyncSweet.to_dict(sweet, fields))
+            separator = b','
+        yield b']}'
+
+    if mode == 'json':
+        return Response(generate_json(), mimetype='application/json')
+    return Response(generate_ndjson(), mimetype=NDJSON_MIMETYPE)
+
+@sweets_bp.route('', methods=['POST'])
+@admin_required()
+async def create_sweet():
+    try:
+        try:
+            fields = parse_new_sweet(await request.get_json())
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        sweet = await AsyncSweet.create(**fields)
+        if not sweet:
+            return jsonify({'error': 'Sweet with this name already exists'}), 400
+
+        ledger.record(sweet['id'], sweet['quantity'], get_jwt().get('sub'), 'create')
+        return jsonify({
+            'message': 'Sweet added successfully',
+            'sweet': AsyncSweet.to_dict(sweet)
+        }), 201
+
+    except Exception:
+        logger.exception('Create sweet failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@sweets_bp.route('/bulk', methods=['POST'])
+@admin_required()
+async def bulk_upsert_sweets():
+    """Bulk create or update by name, see the WSGI view.
+
+    The body is read whole before parsing; batches are still written one
+    bulk_write at a time.
+    """
+    try:
+        if request.mimetype not in bulk.MIMETYPES:
+            return jsonify({'error': f'Content-Type must be one of: {", ".join(bulk.MIMETYPES)}'}), 415
+
+        if request.mimetype == bulk.JSON_MIMETYPE:
+            try:
+                rows = bulk.json_records(await request.get_json(silent=True))
+            except ValidationError as e:
+                return jsonify({'error': str(e)}), 400
+        else:
+            body = await request.get_data()
+            lines = io.TextIOWrapper(io.BytesIO(body), encoding='utf-8-sig', newline='')
+            rows = bulk.records(request.mimetype, lines)
+
+        report = bulk.ImportReport(current_app.config['SWEETS_BULK_MAX_ERRORS'])
+        try:
+            for batch in bulk.validated_batches(rows, current_app.config['SWEETS_BULK_BATCH_SIZE'], report):
+                report.add_batch(batch, await AsyncSweet.upsert_many([fields for _, fields in batch]))
+        except UnicodeDecodeError:
+            return jsonify({'error': 'Upload must be UTF-8 encoded', **report.to_dict()}), 400
+        except csv.Error as e:
+            return jsonify({'error': f'Invalid CSV: {e}', **report.to_dict()}), 400
+        finally:
+            for sweet_id, quantity in report.created:
+                ledger.record(sweet_id, quantity, get_jwt().get('sub'), 'import')
+            for sweet_id, change in report.adjusted:
+                ledger.record(sweet_id, change, get_jwt().get('sub'), 'import')
+
+        return jsonify({'message': 'Bulk import finished', **report.to_dict()}), 200
+
+    except Exception:
+        logger.exception('Bulk import failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@sweets_bp.route('/bulk/price', methods=['POST'])
+@admin_required()
+async def bulk_price_change():
+    try:
+        try:
+            filters, percent, amount = parse_price_change(
+                await request.get_json(), AsyncSweet.SEARCH_MODES, current_app.config['SEARCH_MAX_TERM_LENGTH']
+            )
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        matched, updated, skipped = await AsyncSweet.reprice(Sweet.search_query(**filters), percent, amount)
+
+        return jsonify({
+            'message': 'Prices updated',
+            'matched': matched,
+            'updated': updated,
+            'skipped': skipped
+        }), 200
+
+    except Exception:
+        logger.exception('Bulk price change failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@sweets_bp.route('', methods=['GET'])
+async def get_all_sweets():
+    try:
+        try:
+            fields = parse_fields(request.args.get('fields'), AsyncSweet.FIELDS)
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        mode = wants_stream(request.args, request.accept_mimetypes)
+        if mode:
+            return stream_sweets(mode, fields)
+
+        if 'limit' not in request.args and 'after' not in request.args:
+            body = b''.join([
+                b'{"message":"Sweets retrieved successfully","sweets":',
+                await AsyncSweet.get_all_json(fields),
+                b'}\n'
+            ])
+            return Response(body, mimetype='application/json'), 200
+
+        try:
+            limit = parse_page_size(
+                request.args.get('limit'),
+                current_app.config['SWEETS_DEFAULT_PAGE_SIZE'],
+                current_app.config['SWEETS_MAX_PAGE_SIZE']
+            )
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        with_total = request.args.get('count', 'true').lower() not in ('0', 'false', 'no')
+
+        try:
+            sweets, next_cursor, total = await AsyncSweet.get_page(
+                limit,
+                after=request.args.get('after'),
+                fields=fields,
+                with_total=with_total
+            )
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+        response_data = {
+            'message': 'Sweets retrieved successfully',
+            'sweets': [AsyncSweet.to_dict(sweet, fields) for sweet in sweets],
+            'next_cursor': next_cursor
+        }
+        if with_total:
+            response_data['total'] = total
+        return jsonify(response_data), 200
+    except Exception:
+        logger.exception('Get sweets failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@sweets_bp.route('/search', methods=['GET'])
+async def search_sweets():
+    try:
+        try:
+            params = parse_search(
+                request.args, AsyncSweet.SEARCH_MODES, current_app.config['SEARCH_MAX_TERM_LENGTH']
+            )
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        sweets = await AsyncSweet.search(**params)
+
+        return jsonify({
+            'message': 'Search results',
+            'sweets': [AsyncSweet.to_dict(sweet) for sweet in sweets],
+            'count': len(sweets)
+        }), 200
+
+    except Exception:
+        logger.exception('Search sweets failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@sweets_bp.route('/<sweet_id>', methods=['GET'])
+async def get_sweet(sweet_id):
+    try:
+        sweet = await AsyncSweet.find_by_id(sweet_id)
+        if not sweet:
+            return jsonify({'error': 'Sweet not found'}), 404
+
+        return jsonify({
+            'message': 'Sweet retrieved successfully',
+            'sweet': AsyncSweet.to_dict(sweet)
+        }), 200
+    except Exception:
+        logger.exception('Get sweet failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@sweets_bp.route('/<sweet_id>', methods=['PUT'])
+@admin_required()
+async def update_sweet(sweet_id):
+    try:
+        sweet = await AsyncSweet.find_by_id(sweet_id, primary=True)
+        if not sweet:
+            return jsonify({'error': 'Sweet not found'}), 404
+
+        try:
+            update_data = parse_sweet_changes(await request.get_json())
+            version = parse_if_match(request.headers.get('If-Match'))
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if version is not None and version != sweet.get('version', 0):
+            return version_conflict(sweet)
+
+        if 'quantity' in update_data and sweet.get('stock_shards'):
+            return jsonify({'error': 'Stock of a sharded sweet can only be changed by restocking'}), 400
+
+        new_name = update_data.get('name')
+        if new_name == sweet['name']:
+            del update_data['name']
+        elif new_name:
+            existing = await AsyncSweet.find_by_name(new_name)
+            if existing and existing['id'] != sweet_id:
+                return jsonify({'error': 'Sweet with this name already exists'}), 400
+
+        if update_data:
+            try:
+                updated_sweet = await AsyncSweet.update(sweet_id, update_data, version)
+            except ValidationError as e:
+                return jsonify({'error': str(e)}), 400
+            if not updated_sweet:
+                current = await AsyncSweet.find_by_id(sweet_id, primary=True)
+                if not current:
+                    return jsonify({'error': 'Sweet not found'}), 404
+                return version_conflict(current)
+
+            if 'quantity' in update_data:
+                ledger.record(sweet_id, updated_sweet['adjustment'], get_jwt().get('sub'), 'adjustment')
+            return jsonify({
+                'message': 'Sweet updated successfully',
+                'sweet': AsyncSweet.to_dict(updated_sweet)
+            }), 200
+
+        return jsonify({
+            'message': 'No changes detected',
+            'sweet': AsyncSweet.to_dict(sweet)
+        }), 200
+
+    except Exception:
+        logger.exception('Update sweet failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@sweets_bp.route('/<sweet_id>', methods=['DELETE'])
+@admin_required()
+async def delete_sweet(sweet_id):
+    try:
+        if not await AsyncSweet.find_by_id(sweet_id, primary=True):
+            return jsonify({'error': 'Sweet not found'}), 404
+
+        if not await AsyncSweet.delete(sweet_id):
+            return jsonify({'error': 'Failed to delete sweet'}), 400
+
+        return jsonify({'message': 'Sweet deleted successfully'}), 200
+
+    except Exception:
+        logger.exception('Delete sweet failed')
+        return jsonify({'error': 'Internal server error'}), 500
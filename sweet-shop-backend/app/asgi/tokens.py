@@ -0,0 +1,120 @@
+import uuid
+import logging
+from functools import wraps
+from datetime import datetime, timezone
+import jwt
+from pymongo.errors import PyMongoError
+from quart import current_app, g, jsonify, request
+from app.cache import NullCache
+from app.tokens import Blocklist, blocklist, create_token_cache, remember, token_key
+from app.asgi.models import mongo
+
+logger = logging.getLogger(__name__)
+
+# Tokens and error bodies match flask_jwt_extended, so a token issued by
+# either app is accepted by the other and clients see the same 401/422s
+
+# Verified claims by token hash, see app.tokens.TokenManager
+verified = NullCache()
+
+def init_app(app):
+    global verified
+    verified = create_token_cache(app.config)
+    blocklist.init_app(app)
+
+def _algorithm():
+    return current_app.config.get('JWT_ALGORITHM', 'HS256')
+
+def _encode(token_type, identity, expires, additional_claims=None):
+    config = current_app.config
+    now = datetime.now(timezone.utc)
+    claims = {
+        'fresh': False,
+        'iat': now,
+        'jti': str(uuid.uuid4()),
+        'type': token_type,
+        'sub': identity,
+        'nbf': now
+    }
+    if expires:
+        claims['exp'] = now + expires
+    claims.update(additional_claims or {})
+    return jwt.encode(claims, config['JWT_SECRET_KEY'], algorithm=_algorithm())
+
+def create_access_token(identity, additional_claims=None):
+    return _encode('access', identity, current_app.config['JWT_ACCESS_TOKEN_EXPIRES'], additional_claims)
+
+def create_refresh_token(identity):
+    return _encode('refresh', identity, current_app.config['JWT_REFRESH_TOKEN_EXPIRES'])
+
+def decode_token(token):
+    claims = verified.get(token_key(token))
+    if claims is None:
+        claims = jwt.decode(token, current_app.config['JWT_SECRET_KEY'], algorithms=[_algorithm()])
+        remember(verified, token, claims)
+    return dict(claims)
+
+async def is_revoked(jti):
+    if blocklist.refresh_due():
+        try:
+            cursor = mongo.db.revoked_tokens.find(blocklist.query())
+            blocklist.merge(await cursor.to_list(length=None))
+        except PyMongoError:
+            logger.warning('Token blocklist refresh failed', exc_info=True)
+    return jti in blocklist
+
+async def revoke(claims):
+    document = Blocklist.document(claims)
+    await mongo.db.revoked_tokens.replace_one({'_id': document['_id']}, document, upsert=True)
+    blocklist.add(document)
+
+def get_jwt():
+    """Claims of the token that authorized the current request"""
+    return g.get('jwt_claims', {})
+
+def jwt_required(refresh=False):
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            header = request.headers.get('Authorization')
+            if not header:
+                return jsonify({'msg': 'Missing Authorization Header'}), 401
+
+            scheme, _, token = header.partition(' ')
+            if scheme != 'Bearer' or not token:
+                return jsonify({
+                    'msg': "Missing 'Bearer' type in 'Authorization' header. "
+                           "Expected 'Authorization: Bearer <JWT>'"
+                }), 401
+
+            try:
+                claims = decode_token(token)
+            except jwt.ExpiredSignatureError:
+                return jsonify({'msg': 'Token has expired'}), 401
+            except jwt.InvalidTokenError as e:
+                return jsonify({'msg': str(e)}), 422
+
+            if refresh and claims.get('type') != 'refresh':
+                return jsonify({'msg': 'Only refresh tokens are allowed'}), 422
+            if not refresh and claims.get('type') != 'access':
+                return jsonify({'msg': 'Only non-refresh tokens are allowed'}), 422
+
+            if await is_revoked(claims['jti']):
+                return jsonify({'msg': 'Token has been revoked'}), 401
+
+            g.jwt_claims = claims
+            return await view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def admin_required():
+    """jwt_required for admin-only views; other roles get a 403"""
+    def decorator(view):
+        @wraps(view)
+        @jwt_required()
+        async def wrapper(*args, **kwargs):
+            if get_jwt().get('role') != 'admin':
+                return jsonify({'error': 'Admin access required'}), 403
+            return await view(*args, **kwargs)
+        return wrapper
+    return decorator
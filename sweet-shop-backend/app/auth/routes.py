@@ -1,158 +1,156 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token
+from jwt import InvalidTokenError
+from flask_jwt_extended import (
+    create_access_token, create_refresh_token, decode_token, jwt_required, get_jwt
+)
+from flask_jwt_extended.exceptions import JWTExtendedException
 from app.models import User
-from datetime import datetime
-import re
+from app.tokens import revoke
+from app.ratelimit import rate_limited
+from app.passwords import HasherBusy
+from app.validation import ValidationError, parse_registration, parse_login
+import logging
 
 auth_bp = Blueprint('auth', __name__)
+logger = logging.getLogger(__name__)
 
-def validate_email(email):
-    """Simple email validation"""
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return re.match(pattern, email) is not None
+def busy_response(error):
+    """503 telling the client when to retry a shed login or registration"""
+    response = jsonify({'error': 'Server is busy, please try again shortly'})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+def user_token(user):
+    """Access token carrying the claims the API authorizes on"""
+    return create_access_token(
+        identity=str(user['id']),
+        additional_claims={
+            'email': user['email'],
+            'role': user['role'],
+            'name': user['name']
+        }
+    )
 
 @auth_bp.route('/register', methods=['POST'])
+@rate_limited
 def register():
     try:
-        print("Registration endpoint hit")
-        
-        # Get request data
-        data = request.get_json()
-        print(f"Received data: {data}")
-        
-        if not data:
-            print("No data provided")
-            return jsonify({'error': 'No data provided'}), 400
-        
-        # Validate required fields
-        required_fields = ['name', 'email', 'password']
-        missing_fields = []
-        for field in required_fields:
-            if field not in data or not data[field]:
-                missing_fields.append(field)
-        
-        if missing_fields:
-            print(f"Missing fields: {missing_fields}")
-            return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
-        
-        # Extract and clean data
-        name = data['name'].strip()
-        email = data['email'].strip().lower()
-        password = data['password'].strip()
-        
-        # Get role with default to 'customer'
-        role = data.get('role', 'customer').strip().lower()
-        
-        # Validate role
-        if role not in ['admin', 'customer']:
-            print(f"Invalid role: {role}")
-            return jsonify({'error': 'Role must be either "admin" or "customer"'}), 400
-        
-        # Validate email format
-        if not validate_email(email):
-            print(f"Invalid email format: {email}")
-            return jsonify({'error': 'Invalid email format'}), 400
-        
-        # Validate password length
-        if len(password) < 6:
-            print("Password too short")
-            return jsonify({'error': 'Password must be at least 6 characters'}), 400
+        try:
+            fields = parse_registration(request.get_json())
+        except ValidationError as e:
+            logger.info('Registration rejected', extra={'reason': e.reason, **e.details})
+            return jsonify({'error': str(e)}), 400
+        email = fields['email']
         
         # Check if user already exists
         existing_user = User.find_by_email(email)
         if existing_user:
-            print(f"User already exists: {email}")
+            logger.info('Registration rejected', extra={'reason': 'duplicate email'})
             return jsonify({'error': 'User with this email already exists'}), 400
         
         # Create new user
-        print(f"Creating user: {email}, role: {role}")
-        user = User.create(
-            email=email,
-            password=password,
-            name=name,
-            role=role
-        )
+        user = User.create(**fields)
         
         if not user:
-            print("User creation failed")
+            logger.error('User creation failed', extra={'email': email})
             return jsonify({'error': 'Failed to create user'}), 500
         
-        print(f"User created successfully: {user['id']}")
-        
-        # Create access token
-        access_token = create_access_token(
-            identity=str(user['id']),
-            additional_claims={
-                'email': user['email'],
-                'role': user['role'],
-                'name': user['name']
-            }
-        )
-        
         response_data = {
             'message': 'User registered successfully',
-            'token': access_token,
+            'token': user_token(user),
+            'refresh_token': create_refresh_token(identity=str(user['id'])),
             'user': User.to_dict(user)
         }
         
-        print(f"Registration successful: {response_data['user']['email']}")
+        logger.info('User registered', extra={'user_id': user['id'], 'role': user['role']})
         return jsonify(response_data), 201
         
+    except HasherBusy as e:
+        return busy_response(e)
     except Exception as e:
-        print(f"Registration error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('Registration failed')
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
 @auth_bp.route('/login', methods=['POST'])
+@rate_limited
 def login():
     try:
-        print("Login endpoint hit")
-        data = request.get_json()
-        print(f"Login data: {data}")
-        
-        if not data:
-            return jsonify({'error': 'No data provided'}), 400
-        
-        email = data.get('email', '').strip().lower()
-        password = data.get('password', '').strip()
-        
-        if not email or not password:
-            return jsonify({'error': 'Missing email or password'}), 400
+        try:
+            email, password = parse_login(request.get_json())
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Find user
         user = User.find_by_email(email)
         
         if not user:
-            print(f"User not found: {email}")
+            logger.info('Login failed', extra={'reason': 'unknown email'})
             return jsonify({'error': 'Invalid credentials'}), 401
         
         # Verify password
         if not User.verify_password(user['password'], password):
-            print(f"Invalid password for: {email}")
+            logger.info('Login failed', extra={'reason': 'invalid password', 'user_id': user['id']})
             return jsonify({'error': 'Invalid credentials'}), 401
         
-        # Create access token
-        access_token = create_access_token(
-            identity=str(user['id']),
-            additional_claims={
-                'email': user['email'],
-                'role': user['role'],
-                'name': user['name']
-            }
-        )
-        
         response_data = {
             'message': 'Login successful',
-            'token': access_token,
+            'token': user_token(user),
+            'refresh_token': create_refresh_token(identity=str(user['id'])),
             'user': User.to_dict(user)
         }
         
-        print(f"Login successful: {email}")
+        logger.info('Login successful', extra={'user_id': user['id']})
         return jsonify(response_data), 200
         
-    except Exception as e:
-        print(f"Login error: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({'error': 'Internal server error'}), 500
\ No newline at end of file
+    except HasherBusy as e:
+        return busy_response(e)
+    except Exception:
+        logger.exception('Login failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@auth_bp.route('/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+@rate_limited
+def refresh():
+    try:
+        # Re-read the user so role changes and deletions apply at renewal;
+        # no password check, just one lookup by _id
+        user = User.find_by_id(get_jwt()['sub'])
+        if not user:
+            return jsonify({'error': 'User no longer exists'}), 401
+        
+        return jsonify({
+            'message': 'Token refreshed',
+            'token': user_token(user)
+        }), 200
+        
+    except Exception:
+        logger.exception('Token refresh failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@auth_bp.route('/logout', methods=['POST'])
+@jwt_required()
+def logout():
+    try:
+        claims = get_jwt()
+        revoked = [claims]
+        
+        # Revoke the session's refresh token too when the client sends it
+        refresh_token = (request.get_json(silent=True) or {}).get('refresh_token')
+        if refresh_token:
+            try:
+                refresh_claims = decode_token(refresh_token)
+            except (InvalidTokenError, JWTExtendedException):
+                refresh_claims = {}
+            if refresh_claims.get('type') != 'refresh' or refresh_claims.get('sub') != claims['sub']:
+                return jsonify({'error': 'Invalid refresh token'}), 400
+            revoked.append(refresh_claims)
+        
+        for token_claims in revoked:
+            revoke(token_claims)
+        logger.info('User logged out', extra={'user_id': claims['sub']})
+        return jsonify({'message': 'Logged out successfully'}), 200
+        
+    except Exception:
+        logger.exception('Logout failed')
+        return jsonify({'error': 'Internal server error'}), 500
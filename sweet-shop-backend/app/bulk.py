@@ -0,0 +1,106 @@
+import csv
+import json
+from app.validation import ValidationError, parse_new_sweet
+
+CSV_MIMETYPE = 'text/csv'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+JSON_MIMETYPE = 'application/json'
+MIMETYPES = (JSON_MIMETYPE, CSV_MIMETYPE, NDJSON_MIMETYPE)
+
+DUPLICATE_KEY = 11000
+
+def json_records(data):
+    """Rows of a JSON upload: a bare array or {"sweets": [...]}"""
+    rows = data.get('sweets') if isinstance(data, dict) else data
+    if not isinstance(rows, list):
+        raise ValidationError('Expected a JSON array of sweets')
+    return rows
+
+def csv_records(lines):
+    """Rows of a CSV upload with a header line; empty cells count as missing"""
+    for row in csv.DictReader(lines):
+        yield {field: value for field, value in row.items() if field and value not in (None, '')}
+
+def ndjson_records(lines):
+    """One JSON object per line; blank lines are skipped"""
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield ValidationError('Invalid JSON')
+
+def records(mimetype, lines):
+    if mimetype == CSV_MIMETYPE:
+        return csv_records(lines)
+    return ndjson_records(lines)
+
+def validated_batches(rows, batch_size, report):
+    """Yield lists of (row number, fields) to upsert, numbering rows from 1.
+
+    Rows that fail parse_new_sweet are added to report instead.
+    """
+    batch = []
+    for number, row in enumerate(rows, start=1):
+        try:
+            if isinstance(row, ValidationError):
+                raise row
+            if not isinstance(row, dict):
+                raise ValidationError('Row must be an object')
+            batch.append((number, parse_new_sweet(row)))
+        except ValidationError as e:
+            report.error(number, str(e))
+        report.received = number
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class ImportReport:
+    """Counts and per-row errors for one bulk upload"""
+
+    def __init__(self, max_errors=1000):
+        self.max_errors = max_errors
+        self.received = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+        # (sweet id, quantity) of each created sweet and (sweet id, change)
+        # of each existing one whose stock a row changed, for the stock ledger
+        self.created = []
+        self.adjusted = []
+
+    def error(self, row, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row, 'error': message})
+
+    def add_batch(self, batch, result):
+        """Fold one Sweet.upsert_many result into the report"""
+        inserted, updated, failed, adjusted = result
+        self.inserted += len(inserted)
+        self.updated += updated
+        for index, (number, fields) in enumerate(batch):
+            if index in inserted:
+                self.created.append((inserted[index], fields['quantity']))
+            elif index in adjusted:
+                self.adjusted.append(adjusted[index])
+            elif index in failed:
+                if failed[index].get('sharded'):
+                    self.error(number, 'Stock of a sharded sweet can only be changed by restocking')
+                elif failed[index].get('code') == DUPLICATE_KEY:
+                    self.error(number, 'Conflicting write for this name, please retry')
+                else:
+                    self.error(number, 'Could not be saved')
+
+    def to_dict(self):
+        return {
+            'received': self.received,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors
+        }
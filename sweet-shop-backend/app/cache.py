@@ -0,0 +1,126 @@
+import time
+import threading
+from collections import OrderedDict
+
+class NullCache:
+    """Cache that never stores anything, used when caching is disabled"""
+
+    def get_or_load(self, key, loader, ttl=None):
+        return loader()
+
+    def get(self, key, default=None):
+        return default
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def invalidate(self, namespace):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {'enabled': False}
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a TTL.
+
+    Keys are tuples whose first element is a namespace, so a whole family of
+    entries (every search result, say) can be dropped with invalidate().
+    """
+
+    def __init__(self, maxsize=1024, ttl=30, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation so loads that raced a write are not stored
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None, generation=None):
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader, ttl=None):
+        """Return the cached value for key, calling loader() on a miss"""
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+        with self._lock:
+            generation = self._generation
+        value = loader()
+        if value is not None:
+            self.set(key, value, ttl, generation)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._generation += 1
+            self._data.pop(key, None)
+
+    def invalidate(self, namespace):
+        """Drop every entry whose key starts with namespace"""
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._data if key[0] == namespace]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': True,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+def create_cache(config):
+    """Build the catalogue cache described by the app config"""
+    if not config['CATALOGUE_CACHE_ENABLED']:
+        return NullCache()
+    return TTLCache(
+        maxsize=config['CATALOGUE_CACHE_MAXSIZE'],
+        ttl=config['CATALOGUE_CACHE_TTL']
+    )
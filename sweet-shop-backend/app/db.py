@@ -0,0 +1,245 @@
+import os
+import time
+import threading
+from flask_pymongo import PyMongo, BSONObjectIdConverter
+from pymongo import MongoClient, monitoring, uri_parser
+from pymongo.read_preferences import (
+    Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+)
+from app.metrics import registry
+
+pool_wait = registry.histogram(
+    'mongo_pool_wait_seconds', 'Time spent waiting to check a connection out of the pool',
+    labels=('address',)
+)
+pool_checkout_failures = registry.counter(
+    'mongo_pool_checkout_failures_total', 'Connection check-outs that failed, by reason',
+    labels=('address', 'reason')
+)
+
+def _address(event):
+    host, port = event.address
+    return f'{host}:{port}'
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection counts and check-out wait times for this process's pools.
+
+    Wait time is measured between check-out started and checked out, which
+    the driver reports on the requesting thread. A high p99 or any timeouts
+    mean requests are queuing for connections: raise MONGO_MAX_POOL_SIZE or
+    run fewer threads per worker.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.open = {}
+            self.in_use = {}
+            self.checkouts = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+
+    def _adjust(self, counts, event, delta):
+        address = _address(event)
+        with self._lock:
+            counts[address] = max(0, counts.get(address, 0) + delta)
+
+    def open_connections(self):
+        """Open connections in the largest pool (the primary's, normally)"""
+        with self._lock:
+            return max(self.open.values(), default=0)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'open': dict(self.open),
+                'in_use': dict(self.in_use),
+                'checkouts': self.checkouts,
+                'wait_avg_ms': round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                'wait_max_ms': round(self.wait_max * 1000, 3)
+            }
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        started = getattr(self._local, 'started', None)
+        self._local.started = None
+        self._adjust(self.in_use, event, 1)
+        if started is None:
+            return
+        waited = time.perf_counter() - started
+        pool_wait.observe(waited, _address(event))
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def connection_check_out_failed(self, event):
+        self._local.started = None
+        pool_checkout_failures.inc(_address(event), event.reason)
+
+    def connection_checked_in(self, event):
+        self._adjust(self.in_use, event, -1)
+
+    def connection_created(self, event):
+        self._adjust(self.open, event, 1)
+
+    def connection_closed(self, event):
+        self._adjust(self.open, event, -1)
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.in_use.pop(_address(event), None)
+
+    def pool_closed(self, event):
+        with self._lock:
+            self.open.pop(_address(event), None)
+            self.in_use.pop(_address(event), None)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+pool_stats = PoolStats()
+
+def pool_metrics():
+    """Pool connection gauges, read at scrape time"""
+    snapshot = pool_stats.snapshot()
+    lines = ['# TYPE mongo_pool_connections gauge']
+    for state in ('open', 'in_use'):
+        for address, count in sorted(snapshot[state].items()):
+            lines.append(f'mongo_pool_connections{{address="{address}",state="{state}"}} {count}')
+    return lines
+
+registry.add_collector(pool_metrics)
+
+def client_options(config, event_listeners=()):
+    """MongoClient keyword arguments from the MONGO_* settings"""
+    options = {
+        'event_listeners': [pool_stats, *event_listeners],
+        'maxPoolSize': config['MONGO_MAX_POOL_SIZE'],
+        'minPoolSize': config['MONGO_MIN_POOL_SIZE'],
+        'waitQueueTimeoutMS': config['MONGO_WAIT_QUEUE_TIMEOUT_MS'] or None,
+        'readPreference': config['MONGO_READ_PREFERENCE']
+    }
+    if config['MONGO_COMPRESSORS']:
+        options['compressors'] = config['MONGO_COMPRESSORS']
+    return options
+
+READ_PREFERENCES = {
+    'primary': Primary,
+    'primaryPreferred': PrimaryPreferred,
+    'secondary': Secondary,
+    'secondaryPreferred': SecondaryPreferred,
+    'nearest': Nearest
+}
+
+# The driver rejects smaller maxStalenessSeconds at server selection time
+MIN_MAX_STALENESS_SECONDS = 90
+
+def read_preference(mode, max_staleness=-1):
+    """ReadPreference for a mode name, bounded by max_staleness seconds.
+
+    -1 means no staleness bound. Raises ValueError for an unknown mode or a
+    bound the driver would refuse, so bad settings fail at startup rather
+    than on the first read.
+    """
+    if mode not in READ_PREFERENCES:
+        raise ValueError(f'Unknown read preference: {mode}')
+    if mode == 'primary':
+        return Primary()
+    if max_staleness != -1 and max_staleness < MIN_MAX_STALENESS_SECONDS:
+        raise ValueError(f'maxStalenessSeconds must be -1 or at least {MIN_MAX_STALENESS_SECONDS}')
+    return READ_PREFERENCES[mode](max_staleness=max_staleness)
+
+def catalogue_read_preference(config):
+    """Read preference for catalogue browsing, see Sweet.catalogue"""
+    return read_preference(
+        config['CATALOGUE_READ_PREFERENCE'], config['CATALOGUE_MAX_STALENESS_SECONDS']
+    )
+
+class ForkSafeMongo(PyMongo):
+    """PyMongo whose MongoClient is created lazily, once per process.
+
+    create_app may run in a pre-forking master (gunicorn --preload). The
+    client, with its pool and monitor threads, is only built on first use,
+    and a forked worker builds its own instead of touching the parent's.
+    """
+
+    def __init__(self):
+        self._uri = None
+        self._options = {}
+        self._database = None
+        self.warm_up_timeout = 0
+        self._client = None
+        self._db = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app, uri=None, **kwargs):
+        self.close()
+        self._uri = uri or app.config['MONGO_URI']
+        self._database = uri_parser.parse_uri(self._uri)['database']
+        self._options = client_options(app.config, kwargs.pop('event_listeners', ()))
+        self._options.update(kwargs)
+        self.warm_up_timeout = app.config['MONGO_WARM_UP_TIMEOUT']
+        app.url_map.converters['ObjectId'] = BSONObjectIdConverter
+
+    def _connect(self):
+        with self._lock:
+            if self._client is None or self._pid != os.getpid():
+                if self._uri is None:
+                    raise RuntimeError('ForkSafeMongo.init_app has not been called')
+                # The parent's client is abandoned, not closed: its sockets
+                # and threads belong to the parent process
+                pool_stats.reset()
+                self._client = MongoClient(self._uri, connect=False, **self._options)
+                self._db = self._client[self._database] if self._database else None
+                self._pid = os.getpid()
+            return self._client
+
+    @property
+    def cx(self):
+        if self._client is None or self._pid != os.getpid():
+            return self._connect()
+        return self._client
+
+    @property
+    def db(self):
+        if self._client is None or self._pid != os.getpid():
+            self._connect()
+        return self._db
+
+    def warm_up(self):
+        """Connect and open minPoolSize connections before taking traffic.
+
+        Returns False if the pool did not reach its minimum within
+        MONGO_WARM_UP_TIMEOUT seconds. Does nothing before init_app.
+        """
+        if self._uri is None:
+            return False
+        self.cx.admin.command('ping')
+
+        # The driver's background task tops the pool up to minPoolSize
+        target = self._options.get('minPoolSize') or 0
+        deadline = time.monotonic() + self.warm_up_timeout
+        while pool_stats.open_connections() < target and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return pool_stats.open_connections() >= target
+
+    def close(self):
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                self._client.close()
+            self._client = None
+            self._db = None
@@ -0,0 +1,159 @@
+import os
+import atexit
+import logging
+import threading
+import click
+from datetime import timedelta
+from bson import ObjectId
+from pymongo import UpdateOne
+from app.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+holds_released = registry.counter(
+    'stock_holds_released_total', 'Cart holds whose stock went back on sale', labels=('reason',)
+)
+
+def hold_document(user_id, results, ttl, now):
+    """The holds document for a successful reservation.
+
+    Each line keeps the name and price it was held at, so confirming never
+    has to read the sweets again.
+    """
+    return {
+        'user_id': user_id,
+        'items': [
+            {
+                'sweet_id': ObjectId(result['sweet_id']),
+                'name': result['name'],
+                'price': result['price'],
+                'quantity': result['quantity']
+            }
+            for result in results
+        ],
+        'created_at': now,
+        'expires_at': now + timedelta(seconds=ttl)
+    }
+
+def held_quantities(hold):
+    """{sweet ObjectId: units held}; repeated lines are added together"""
+    quantities = {}
+    for item in hold['items']:
+        quantities[item['sweet_id']] = quantities.get(item['sweet_id'], 0) + item['quantity']
+    return quantities
+
+def active_holds(user_id, now):
+    return {'user_id': user_id, 'expires_at': {'$gt': now}}
+
+def too_many_holds(max_active):
+    return f'At most {max_active} open holds per customer; confirm or release one first'
+
+def without_deleted(hold, found):
+    """hold with only the lines whose sweet is in found (ObjectIds still in the catalogue)"""
+    return {**hold, 'items': [item for item in hold['items'] if item['sweet_id'] in found]}
+
+def confirm_updates(hold, now):
+    """Turn held units into sold ones: they leave reserved, and on-hand with it"""
+    return [
+        UpdateOne(
+            {'_id': sweet_id, 'reserved': {'$gte': quantity}},
+            {'$inc': {'reserved': -quantity, 'version': 1}, '$set': {'updated_at': now}}
+        )
+        for sweet_id, quantity in held_quantities(hold).items()
+    ]
+
+def release_updates(holds, now):
+    """Put the units of cancelled or expired holds back on sale"""
+    quantities = {}
+    for hold in holds:
+        for sweet_id, quantity in held_quantities(hold).items():
+            quantities[sweet_id] = quantities.get(sweet_id, 0) + quantity
+    return [
+        UpdateOne(
+            {'_id': sweet_id, 'reserved': {'$gte': quantity}},
+            {'$inc': {'quantity': quantity, 'reserved': -quantity, 'version': 1}, '$set': {'updated_at': now}}
+        )
+        for sweet_id, quantity in quantities.items()
+    ]
+
+def total(hold):
+    return round(sum(item['price'] * item['quantity'] for item in hold['items']), 2)
+
+class HoldSweeper:
+    """Background release of expired cart holds.
+
+    A hold takes its units out of the sweet's quantity (what is on sale)
+    and into reserved, so they stay on hand but cannot be bought by anyone
+    else. A TTL index could delete an expired hold but not give its stock
+    back, so a thread in each worker calls sweep() every interval seconds
+    instead. Holds are claimed one at a time with find_one_and_delete,
+    which lets every worker sweep without releasing a hold twice.
+
+    The thread is started in each gunicorn worker after the fork (or by
+    the first request, or before serving on ASGI), never in a preloading
+    master, and stops at exit.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.ttl = 600
+        self.interval = 30.0
+        self.batch_size = 500
+        self.max_active = 5
+        self._sweep = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app, sweep):
+        """sweep() releases the expired holds; it is called on the sweeper thread"""
+        self.close()
+        self.enabled = app.config['HOLD_SWEEPER_ENABLED']
+        self.ttl = app.config['HOLD_TTL_SECONDS']
+        self.interval = app.config['HOLD_SWEEP_INTERVAL']
+        self.batch_size = app.config['HOLD_SWEEP_BATCH_SIZE']
+        self.max_active = app.config['HOLD_MAX_ACTIVE_PER_USER']
+        self._sweep = sweep
+
+    def start(self):
+        if not self.enabled or (self._thread is not None and self._pid == os.getpid()):
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._stop = threading.Event()
+                self._thread = threading.Thread(target=self._run, name='hold-sweeper', daemon=True)
+                self._thread.start()
+
+    def close(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None or self._pid != os.getpid():
+                return
+        self._stop.set()
+        thread.join(self.interval)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._sweep()
+            except Exception:
+                logger.exception('Releasing expired holds failed')
+
+sweeper = HoldSweeper()
+
+def init_cli(app, release_expired):
+    """Register the release-expired-holds command, e.g. for a cron job"""
+    @app.cli.command('release-expired-holds')
+    def release_expired_holds_command():
+        """Put the stock of expired cart holds back on sale."""
+        click.echo(f'Released {release_expired()} expired holds')
+
+def _reset_in_child():
+    # The sweeper thread does not survive a fork; the child starts its own
+    # in post_fork or with its first request
+    sweeper._thread = None
+
+atexit.register(sweeper.close)
+os.register_at_fork(after_in_child=_reset_in_child)
@@ -0,0 +1,42 @@
+import hashlib
+from functools import wraps
+from flask import request, current_app, make_response
+
+def compute_etag(*parts):
+    """Strong ETag over the given parts and the requested representation"""
+    raw = ':'.join(str(part) for part in parts)
+    raw += f':{request.full_path}:{request.headers.get("Accept", "")}'
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def apply_cache_headers(response, etag):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = current_app.config['CACHE_CONTROL'].get(
+        request.endpoint, current_app.config['CACHE_CONTROL_DEFAULT']
+    )
+    response.vary.add('Accept')
+    return response
+
+def conditional(version_source):
+    """Answer If-None-Match with 304 before the view runs.
+    
+    version_source receives the view arguments and returns a cheap value
+    that changes whenever the response would, or None if the resource does
+    not exist (the view then runs normally and reports the error).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            version = version_source(*args, **kwargs)
+            if version is None:
+                return view(*args, **kwargs)
+
+            etag = compute_etag(version)
+            if request.if_none_match.contains(etag):
+                return apply_cache_headers(make_response('', 304), etag)
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                apply_cache_headers(response, etag)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,165 @@
+import click
+from datetime import datetime
+from bson import ObjectId
+from pymongo import ASCENDING, TEXT, IndexModel, UpdateOne
+from app.models import mongo, Sweet
+
+class IndexVerificationError(RuntimeError):
+    """Raised when a hot query would fall back to a collection scan"""
+
+# Indexes every deployment needs, keyed by collection
+INDEXES = {
+    'users': [
+        IndexModel([('email', ASCENDING)], name='email_unique', unique=True)
+    ],
+    'sweets': [
+        IndexModel([('name', ASCENDING)], name='name_unique', unique=True),
+        # Keyset pagination and name-sorted listings
+        IndexModel([('name', ASCENDING), ('_id', ASCENDING)], name='name_id'),
+        # Prefix/autocomplete search on the normalized name
+        IndexModel([('name_lower', ASCENDING)], name='name_lower'),
+        # Whole-word search on name and category
+        IndexModel([('name', TEXT), ('category', TEXT)], name='name_category_text'),
+        # Category filters with price ranges in Sweet.search
+        IndexModel([('category_lower', ASCENDING), ('price', ASCENDING)], name='category_price'),
+        IndexModel([('price', ASCENDING)], name='price'),
+        # Low-stock report, emptiest first
+        IndexModel([('quantity', ASCENDING), ('name', ASCENDING)], name='quantity_name'),
+        # Sharded sweets, which the low-stock report checks whatever their pool
+        IndexModel([('stock_shards', ASCENDING)], name='stock_shards', sparse=True),
+        # Latest write, half of Sweet.catalogue_version
+        IndexModel([('updated_at', ASCENDING), ('_id', ASCENDING)], name='updated_at_id')
+    ],
+    'revoked_tokens': [
+        # Revocations are only needed until the token would expire anyway
+        IndexModel([('expires_at', ASCENDING)], name='expires_at_ttl', expireAfterSeconds=0),
+        # Incremental blocklist refreshes in each worker
+        IndexModel([('revoked_at', ASCENDING)], name='revoked_at')
+    ],
+    'inventory_movements': [
+        # Per-sweet stock history, oldest first
+        IndexModel([('sweet_id', ASCENDING), ('_id', ASCENDING)], name='sweet_id_id')
+    ],
+    'stock_shards': [
+        # One counter per shard of a sweet; purchases and totals look them up
+        IndexModel([('sweet_id', ASCENDING), ('shard', ASCENDING)], name='sweet_id_shard', unique=True)
+    ],
+    'holds': [
+        # Expired holds for the sweeper. Not a TTL index: deleting a hold
+        # without releasing it would leave its units reserved for good
+        IndexModel([('expires_at', ASCENDING)], name='expires_at'),
+        # A customer's open holds, counted against HOLD_MAX_ACTIVE_PER_USER
+        IndexModel([('user_id', ASCENDING), ('expires_at', ASCENDING)], name='user_id_expires_at')
+    ],
+    'rate_limits': [
+        # Buckets idle long enough to be full again carry no state
+        IndexModel([('expires_at', ASCENDING)], name='expires_at_ttl', expireAfterSeconds=0)
+    ]
+}
+
+# (description, collection, filter, sort) for the queries the API runs on
+# every request, each of which must be served by an index
+HOT_QUERIES = [
+    ('User.find_by_email', 'users', {'email': 'probe@example.com'}, None),
+    ('Sweet.create duplicate check', 'sweets', {'name': 'probe'}, None),
+    ('Sweet.get_all sort', 'sweets', {}, [('name', ASCENDING)]),
+    ('Sweet.catalogue_version latest write', 'sweets', {}, Sweet.LATEST_WRITE),
+    ('Sweet.get_page keyset', 'sweets',
+     {'$or': [{'name': {'$gt': 'probe'}}, {'name': 'probe', '_id': {'$gt': ObjectId('0' * 24)}}]},
+     [('name', ASCENDING), ('_id', ASCENDING)]),
+    ('Sweet.search name prefix', 'sweets',
+     {'name_lower': {'$regex': '^probe'}}, [('name', ASCENDING)]),
+    ('Sweet.search name text', 'sweets',
+     {'$or': [{'name_lower': {'$regex': '^probe'}}, {'$text': {'$search': 'probe'}}]},
+     [('name', ASCENDING)]),
+    ('Sweet.search category and price', 'sweets',
+     {'category_lower': 'probe', 'price': {'$gte': 1.0, '$lte': 2.0}}, [('name', ASCENDING)]),
+    ('Sweet.search price range', 'sweets',
+     {'price': {'$gte': 1.0, '$lte': 2.0}}, None),
+    ('Low stock report', 'sweets', {'quantity': {'$lt': 10}}, [('quantity', ASCENDING), ('name', ASCENDING)]),
+    ('Price histogram range', 'sweets', {}, [('price', ASCENDING)]),
+    ('Low stock report, sharded sweets', 'sweets', {'stock_shards': {'$exists': True}}, None),
+    ('Sharded stock purchase', 'stock_shards',
+     {'sweet_id': ObjectId('0' * 24), 'shard': 0, 'quantity': {'$gte': 1}}, None),
+    ('Hold sweeper', 'holds', {'expires_at': {'$lte': datetime(2000, 1, 1)}}, None),
+    ('Hold.create open holds', 'holds', {'user_id': '0' * 24, 'expires_at': {'$gt': datetime(2000, 1, 1)}}, None),
+    ('Token blocklist refresh', 'revoked_tokens',
+     {'revoked_at': {'$gte': datetime(2000, 1, 1)}}, None)
+]
+
+def backfill_search_fields(db=None, batch_size=1000):
+    """Populate name_lower/category_lower on sweets created before they existed"""
+    db = db if db is not None else mongo.db
+    missing = db.sweets.find(
+        {'$or': [{'name_lower': {'$exists': False}}, {'category_lower': {'$exists': False}}]},
+        {'name': 1, 'category': 1}
+    )
+    batch = []
+    updated = 0
+    for sweet in missing:
+        batch.append(UpdateOne(
+            {'_id': sweet['_id']},
+            {'$set': Sweet.search_fields(sweet.get('name', ''), sweet.get('category', ''))}
+        ))
+        if len(batch) == batch_size:
+            updated += db.sweets.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += db.sweets.bulk_write(batch, ordered=False).modified_count
+    return updated
+
+def ensure_indexes(db=None):
+    """Create any missing indexes, return {collection: [index names]}"""
+    db = db if db is not None else mongo.db
+    backfill_search_fields(db)
+    created = {}
+    for collection, indexes in INDEXES.items():
+        created[collection] = db[collection].create_indexes(indexes)
+    return created
+
+def plan_stages(plan):
+    """Collect every stage name in an explain() plan tree"""
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(plan_stages(item))
+    return stages
+
+def verify_indexes(db=None):
+    """Explain each hot query and raise if any winning plan scans the collection"""
+    db = db if db is not None else mongo.db
+    failures = []
+    for description, collection, query, sort in HOT_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning_plan = cursor.explain()['queryPlanner']['winningPlan']
+        stages = plan_stages(winning_plan)
+        if 'COLLSCAN' in stages or 'IXSCAN' not in stages:
+            failures.append(f'{description} ({collection}): {" -> ".join(stages)}')
+
+    if failures:
+        raise IndexVerificationError(
+            'Hot queries are not using an index: ' + '; '.join(failures)
+        )
+
+def init_app(app):
+    """Bootstrap indexes at startup and register the CLI commands"""
+    if app.config['MONGO_CREATE_INDEXES']:
+        with app.app_context():
+            ensure_indexes()
+            if app.config['MONGO_VERIFY_INDEXES']:
+                verify_indexes()
+
+    @app.cli.command('create-indexes')
+    def create_indexes_command():
+        """Create MongoDB indexes and verify the hot query plans."""
+        for collection, names in ensure_indexes().items():
+            click.echo(f"{collection}: {', '.join(names)}")
+        verify_indexes()
+        click.echo("All hot queries use an index")
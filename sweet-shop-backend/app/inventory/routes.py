@@ -1,85 +1,237 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt
-from app.models import Sweet
+import logging
+from flask import Blueprint, current_app, request, jsonify
+from flask_jwt_extended import get_jwt_identity, jwt_required
+from app.ledger import ledger
+from app.ratelimit import rate_limited
+from app.models import Hold, Sweet, to_object_id
+from app.tokens import admin_required
+from app.sweets.routes import version_conflict
+from app.validation import ValidationError, parse_checkout, parse_if_match, parse_quantity, parse_shards
 
 inventory_bp = Blueprint('inventory', __name__)
-
-def check_admin():
-    """Check if current user is admin"""
-    claims = get_jwt()
-    return claims.get('role') == 'admin'
+logger = logging.getLogger(__name__)
 
 @inventory_bp.route('/<sweet_id>/purchase', methods=['POST'])
 @jwt_required()
+@rate_limited
 def purchase_sweet(sweet_id):
     try:
-        sweet = Sweet.find_by_id(sweet_id)
-        if not sweet:
-            return jsonify({'error': 'Sweet not found'}), 404
-        
-        data = request.get_json()
-        quantity = int(data.get('quantity', 1))
+        try:
+            quantity = parse_quantity(request.get_json(), default=1)
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
         
-        if quantity <= 0:
-            return jsonify({'error': 'Quantity must be greater than 0'}), 400
+        updated_sweet = Sweet.purchase(sweet_id, quantity)
         
-        if sweet['quantity'] < quantity:
+        if not updated_sweet:
+            # Only the failure path pays for a second lookup to explain why
+            sweet = Sweet.find_by_id(sweet_id, cached=False)
+            if not sweet:
+                return jsonify({'error': 'Sweet not found'}), 404
             return jsonify({'error': f'Not enough stock. Available: {sweet["quantity"]}'}), 400
         
-        # Update quantity
-        new_quantity = sweet['quantity'] - quantity
-        update_data = {'quantity': new_quantity}
+        ledger.record(updated_sweet['id'], -quantity, get_jwt_identity(), 'purchase')
+        return jsonify({
+            'message': f'Purchased {quantity} {updated_sweet["name"]}(s) successfully',
+            'sweet': Sweet.to_dict(updated_sweet)
+        }), 200
         
-        updated_sweet = Sweet.update(sweet_id, update_data)
+    except Exception:
+        logger.exception('Purchase failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@inventory_bp.route('/checkout', methods=['POST'])
+@jwt_required()
+@rate_limited
+def checkout():
+    try:
+        try:
+            lines = parse_checkout(request.get_json(), to_object_id)
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        success, results = Sweet.checkout(lines)
+        
+        if not success:
+            return jsonify({
+                'error': 'Checkout failed, no items were purchased',
+                'items': results
+            }), 400
+        
+        for result in results:
+            ledger.record(result['sweet_id'], -result['quantity'], get_jwt_identity(), 'checkout')
+        total = sum(result['price'] * result['quantity'] for result in results)
+        return jsonify({
+            'message': 'Checkout successful',
+            'items': results,
+            'total': round(total, 2)
+        }), 200
         
-        if not updated_sweet:
-            return jsonify({'error': 'Failed to process purchase'}), 400
+    except Exception:
+        logger.exception('Checkout failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@inventory_bp.route('/holds', methods=['POST'])
+@jwt_required()
+@rate_limited
+def create_hold():
+    """Reserve a cart's items while the customer checks out"""
+    try:
+        try:
+            lines = parse_checkout(request.get_json(), to_object_id, action='Hold')
+            hold, results = Hold.create(get_jwt_identity(), lines)
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if not hold:
+            return jsonify({
+                'error': 'Hold failed, no items were reserved',
+                'items': results
+            }), 400
         
         return jsonify({
-            'message': f'Purchased {quantity} {sweet["name"]}(s) successfully',
-            'sweet': Sweet.to_dict(updated_sweet)
+            'message': 'Items held',
+            'hold': Hold.to_dict(hold),
+            'items': results
+        }), 201
+        
+    except Exception:
+        logger.exception('Hold failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@inventory_bp.route('/holds/<hold_id>/confirm', methods=['POST'])
+@jwt_required()
+def confirm_hold(hold_id):
+    try:
+        hold = Hold.confirm(hold_id, get_jwt_identity())
+        
+        if not hold:
+            if Hold.find(hold_id, get_jwt_identity()):
+                return jsonify({'error': 'Hold has expired'}), 410
+            return jsonify({'error': 'Hold not found'}), 404
+        if not hold['items']:
+            return jsonify({'error': 'The held sweets no longer exist'}), 410
+        
+        for item in hold['items']:
+            ledger.record(item['sweet_id'], -item['quantity'], get_jwt_identity(), 'checkout')
+        data = Hold.to_dict(hold)
+        return jsonify({
+            'message': 'Checkout successful',
+            'items': data['items'],
+            'total': data['total']
         }), 200
         
-    except ValueError:
-        return jsonify({'error': 'Invalid quantity value'}), 400
-    except Exception as e:
-        print(f"Purchase error: {e}")
+    except Exception:
+        logger.exception('Confirming hold failed')
         return jsonify({'error': 'Internal server error'}), 500
 
-@inventory_bp.route('/<sweet_id>/restock', methods=['POST'])
+@inventory_bp.route('/holds/<hold_id>', methods=['DELETE'])
 @jwt_required()
-def restock_sweet(sweet_id):
+def release_hold(hold_id):
     try:
-        # Check if user is admin
-        if not check_admin():
-            return jsonify({'error': 'Admin access required'}), 403
+        hold = Hold.release(hold_id, get_jwt_identity())
+        if not hold:
+            return jsonify({'error': 'Hold not found'}), 404
         
-        sweet = Sweet.find_by_id(sweet_id)
-        if not sweet:
-            return jsonify({'error': 'Sweet not found'}), 404
+        return jsonify({'message': 'Hold released', 'hold': Hold.to_dict(hold)}), 200
         
-        data = request.get_json()
-        quantity = int(data.get('quantity', 0))
+    except Exception:
+        logger.exception('Releasing hold failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@inventory_bp.route('/restock', methods=['POST'])
+@admin_required()
+def restock_many():
+    """Restock several sweets at once, e.g. after a delivery"""
+    try:
+        try:
+            lines = parse_checkout(request.get_json(), to_object_id, action='Restock')
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
         
-        if quantity <= 0:
-            return jsonify({'error': 'Quantity must be greater than 0'}), 400
+        results = Sweet.restock_many(lines)
         
-        # Update quantity
-        new_quantity = sweet['quantity'] + quantity
-        update_data = {'quantity': new_quantity}
+        restocked = [result for result in results if result['status'] == 'restocked']
+        for result in restocked:
+            ledger.record(result['sweet_id'], result['quantity'], get_jwt_identity(), 'restock')
+        return jsonify({
+            'message': 'Restock finished',
+            'restocked': len(restocked),
+            'not_found': len(results) - len(restocked),
+            'items': results
+        }), 200
         
-        updated_sweet = Sweet.update(sweet_id, update_data)
+    except Exception:
+        logger.exception('Bulk restock failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@inventory_bp.route('/<sweet_id>/restock', methods=['POST'])
+@admin_required()
+def restock_sweet(sweet_id):
+    try:
+        try:
+            quantity = parse_quantity(request.get_json(), default=0)
+            version = parse_if_match(request.headers.get('If-Match'))
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        updated_sweet = Sweet.restock(sweet_id, quantity, version)
         
         if not updated_sweet:
-            return jsonify({'error': 'Failed to restock'}), 400
+            sweet = Sweet.find_by_id(sweet_id, cached=False)
+            if not sweet:
+                return jsonify({'error': 'Sweet not found'}), 404
+            return version_conflict(sweet)
         
+        ledger.record(updated_sweet['id'], quantity, get_jwt_identity(), 'restock')
         return jsonify({
-            'message': f'Restocked {quantity} {sweet["name"]}(s) successfully',
+            'message': f'Restocked {quantity} {updated_sweet["name"]}(s) successfully',
             'sweet': Sweet.to_dict(updated_sweet)
         }), 200
         
-    except ValueError:
-        return jsonify({'error': 'Invalid quantity value'}), 400
-    except Exception as e:
-        print(f"Restock error: {e}")
+    except Exception:
+        logger.exception('Restock failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@inventory_bp.route('/<sweet_id>/shards', methods=['PUT'])
+@admin_required()
+def shard_stock(sweet_id):
+    """Spread a sweet's stock over several counters ahead of a flash sale"""
+    try:
+        try:
+            shards = parse_shards(request.get_json(silent=True), current_app.config['STOCK_DEFAULT_SHARDS'],
+                                  current_app.config['STOCK_MAX_SHARDS'])
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        sweet = Sweet.shard_stock(sweet_id, shards)
+        if not sweet:
+            return jsonify({'error': 'Sweet not found'}), 404
+        
+        return jsonify({
+            'message': f'Stock of {sweet["name"]} split over {shards} counters',
+            'sweet': Sweet.to_dict(sweet),
+            'shards': shards
+        }), 200
+        
+    except Exception:
+        logger.exception('Sharding stock failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@inventory_bp.route('/<sweet_id>/shards', methods=['DELETE'])
+@admin_required()
+def unshard_stock(sweet_id):
+    try:
+        sweet = Sweet.unshard_stock(sweet_id)
+        if not sweet:
+            return jsonify({'error': 'Sweet not found'}), 404
+        
+        return jsonify({
+            'message': f'Stock of {sweet["name"]} folded back into one counter',
+            'sweet': Sweet.to_dict(sweet),
+            'shards': 0
+        }), 200
+        
+    except Exception:
+        logger.exception('Unsharding stock failed')
         return jsonify({'error': 'Internal server error'}), 500
\ No newline at end of file
@@ -0,0 +1,235 @@
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+import click
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
+from app.metrics import registry
+from app.serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+movements_written = registry.counter(
+    'ledger_movements_written_total', 'Stock movements written to inventory_movements'
+)
+movements_dropped = registry.counter(
+    'ledger_movements_dropped_total', 'Stock movements lost to a full queue or failed writes',
+    labels=('reason',)
+)
+
+DUPLICATE_KEY = 11000
+
+class Ledger:
+    """Write-behind log of stock movements in inventory_movements.
+
+    record() only enqueues, so purchases never wait on the ledger. A writer
+    thread drains the queue in insert_many batches of at most batch_size,
+    written no later than flush_interval seconds after their first
+    movement. The queue is bounded: when it is full a movement is dropped
+    and counted rather than blocking the request. close() (also run at
+    exit) writes whatever is still queued, waiting at most shutdown_timeout.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.batch_size = 500
+        self.flush_interval = 1.0
+        self.shutdown_timeout = 10.0
+        self.retries = 3
+        self._write = None
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app, write):
+        """write(documents) inserts one batch; it is called on the writer thread"""
+        self.close()
+        self.enabled = app.config['LEDGER_ENABLED']
+        self.batch_size = app.config['LEDGER_BATCH_SIZE']
+        self.flush_interval = app.config['LEDGER_FLUSH_INTERVAL']
+        self.shutdown_timeout = app.config['LEDGER_SHUTDOWN_TIMEOUT']
+        self._queue = queue.Queue(maxsize=app.config['LEDGER_QUEUE_SIZE'])
+        self._write = write
+
+    @staticmethod
+    def movement(sweet_id, delta, user_id=None, reason=None):
+        return {
+            # Assigned here so a retried batch cannot insert a movement twice
+            '_id': ObjectId(),
+            'sweet_id': ObjectId(sweet_id),
+            'delta': int(delta),
+            'user_id': user_id,
+            'reason': reason,
+            'recorded_at': datetime.utcnow()
+        }
+
+    def record(self, sweet_id, delta, user_id=None, reason=None):
+        """Queue one stock change (negative delta for sales)"""
+        if not self.enabled or not delta:
+            return
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(self.movement(sweet_id, delta, user_id, reason))
+        except queue.Full:
+            movements_dropped.inc('queue_full')
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far is written; False on timeout"""
+        if self._thread is None or self._pid != os.getpid():
+            return self._queue.empty()
+        marker = threading.Event()
+        timeout = self.shutdown_timeout if timeout is None else timeout
+        try:
+            self._queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return False
+        return marker.wait(timeout)
+
+    def close(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None or self._pid != os.getpid():
+                return
+        try:
+            self._queue.put(None, timeout=self.shutdown_timeout)
+        except queue.Full:
+            logger.error('Ledger queue still full at shutdown', extra={'queued': self._queue.qsize()})
+            return
+        thread.join(self.shutdown_timeout)
+        if thread.is_alive():
+            logger.error('Ledger did not finish writing before shutdown', extra={'queued': self._queue.qsize()})
+
+    def _ensure_writer(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                if self._pid is not None and self._pid != os.getpid():
+                    # Movements queued before a fork are the parent's to write
+                    self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='ledger-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, markers, stopping = self._next_batch()
+            if batch:
+                self._write_batch(batch)
+            for marker in markers:
+                marker.set()
+
+    def _next_batch(self):
+        """Collect up to batch_size movements, returning early on flush or stop"""
+        batch, markers = [], []
+        item = self._queue.get()
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            if item is None:
+                return batch, markers, True
+            if isinstance(item, threading.Event):
+                markers.append(item)
+                return batch, markers, False
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                return batch, markers, False
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return batch, markers, False
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                return batch, markers, False
+
+    def _write_batch(self, batch):
+        for attempt in range(self.retries):
+            try:
+                self._write(batch)
+                movements_written.inc(amount=len(batch))
+                return
+            except BulkWriteError as e:
+                # Movements that already made it in on an earlier attempt
+                # come back as duplicate keys; only retry the rest
+                failed = {error['index'] for error in e.details['writeErrors'] if error['code'] != DUPLICATE_KEY}
+                movements_written.inc(amount=len(batch) - len(failed))
+                batch = [movement for index, movement in enumerate(batch) if index in failed]
+                if not batch:
+                    return
+            except PyMongoError:
+                logger.warning('Ledger write failed', exc_info=True, extra={'attempt': attempt + 1})
+            time.sleep(min(2 ** attempt * 0.1, 1))
+        movements_dropped.inc('write_failed', amount=len(batch))
+        logger.error('Dropped ledger movements after retries', extra={'movements': len(batch)})
+
+ledger = Ledger()
+
+def tail(collection, after=None, poll_interval=1.0, overlap=timedelta(seconds=10)):
+    """Yield movements as they are written, oldest first, after the given _id.
+
+    On a replica set or sharded cluster this follows a change stream, which
+    delivers inserts in commit order. A standalone server has none, so the
+    ledger (never the sweets collection) is polled by _id instead. Writers
+    in other workers can commit a little out of _id order, so each poll
+    re-reads the last overlap of ids and skips the ones already yielded.
+    """
+    try:
+        stream = collection.watch([{'$match': {'operationType': 'insert'}}])
+    except OperationFailure:
+        stream = None
+
+    if stream is None:
+        yield from _poll(collection, after, poll_interval, overlap)
+        return
+
+    with stream:
+        # Catch up on what was written before the stream opened
+        seen = set()
+        query = {'_id': {'$gt': after}} if after else {}
+        for movement in collection.find(query).sort('_id', 1):
+            seen.add(movement['_id'])
+            yield movement
+        for change in stream:
+            movement = change['fullDocument']
+            if movement['_id'] not in seen:
+                yield movement
+
+def _poll(collection, after, poll_interval, overlap):
+    seen = set()
+    floor = after
+    while True:
+        query = {'_id': {'$gt': floor}} if floor else {}
+        newest = None
+        for movement in collection.find(query).sort('_id', 1):
+            newest = movement['_id']
+            if newest not in seen:
+                seen.add(newest)
+                yield movement
+        if newest is not None:
+            settled = ObjectId.from_datetime(newest.generation_time - overlap)
+            if floor is None or settled > floor:
+                floor = settled
+            seen = {movement_id for movement_id in seen if movement_id > floor}
+        time.sleep(poll_interval)
+
+def init_cli(app, collection):
+    """Register the tail-ledger command; collection returns the PyMongo collection"""
+    @app.cli.command('tail-ledger')
+    @click.option('--after', default=None, help='Only movements after this _id')
+    def tail_ledger_command(after):
+        """Print stock movements as NDJSON as they are written."""
+        for movement in tail(collection(), ObjectId(after) if after else None):
+            click.echo(dumps(movement))
+
+def _reset_in_child():
+    # The writer thread does not survive a fork; the child starts its own
+    # on first use
+    ledger._thread = None
+
+atexit.register(ledger.close)
+os.register_at_fork(after_in_child=_reset_in_child)
@@ -0,0 +1,190 @@
+import os
+import sys
+import uuid
+import queue
+import atexit
+import random
+import contextvars
+import logging
+import traceback
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, request, has_request_context
+from app.serialization import dumps
+
+REDACTED = '[REDACTED]'
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+_listener = None
+
+# Request id for servers without a Flask request context (the ASGI app)
+current_request_id = contextvars.ContextVar('request_id', default='-')
+
+class RequestIdFilter(logging.Filter):
+    """Stamp each record with the id of the request that produced it"""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id', '-')
+        else:
+            record.request_id = current_request_id.get()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of records per level, e.g. {'DEBUG': 0.01}.
+
+    Levels that are not listed are always kept.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = {logging.getLevelName(level): rate for level, rate in rates.items()}
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno)
+        return rate is None or random.random() < rate
+
+class RedactingFilter(logging.Filter):
+    """Mask sensitive keys in dict arguments and extra= fields"""
+
+    def __init__(self, fields):
+        super().__init__()
+        self.fields = {field.lower() for field in fields}
+
+    def redact(self, value):
+        if isinstance(value, dict):
+            return {
+                key: REDACTED if str(key).lower() in self.fields else self.redact(item)
+                for key, item in value.items()
+            }
+        if isinstance(value, (list, tuple)):
+            return type(value)(self.redact(item) for item in value)
+        return value
+
+    def filter(self, record):
+        if record.args:
+            record.args = self.redact(record.args)
+        for key in set(vars(record)) - _RECORD_ATTRS:
+            if key.lower() in self.fields:
+                setattr(record, key, REDACTED)
+            else:
+                setattr(record, key, self.redact(getattr(record, key)))
+        return True
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, including any extra= fields"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-')
+        }
+        for key in set(vars(record)) - _RECORD_ATTRS - {'request_id'}:
+            entry[key] = getattr(record, key)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        try:
+            return dumps(entry).decode('utf-8')
+        except TypeError:
+            return dumps({key: str(value) for key, value in entry.items()}).decode('utf-8')
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hand records to the listener thread, dropping them if the queue is full.
+
+    Only the cheap work (message interpolation, traceback text) happens on the
+    request thread; JSON formatting and the stdout write happen on the
+    listener thread.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = ''.join(traceback.format_exception(*record.exc_info)).rstrip()
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def _restart_listener_in_child():
+    # A forked worker inherits the listener but not its thread; without a
+    # new one its records would sit in the queue forever. Records already
+    # queued are the parent's to write
+    if _listener is not None:
+        while True:
+            try:
+                _listener.queue.get_nowait()
+            except queue.Empty:
+                break
+        _listener._thread = None
+        _listener.start()
+
+def request_id(headers):
+    """Id for a request: the caller's X-Request-ID or a fresh one"""
+    return headers.get('X-Request-ID', '')[:64] or uuid.uuid4().hex
+
+def configure(config):
+    """Route the app's loggers through a queue to a JSON stdout handler"""
+    global _listener
+    _stop_listener()
+
+    log_queue = queue.Queue(maxsize=config['LOG_QUEUE_SIZE'])
+
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(config['LOG_SAMPLE_RATES']))
+    queue_handler.addFilter(RequestIdFilter())
+    queue_handler.addFilter(RedactingFilter(config['LOG_REDACT_FIELDS']))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if config['LOG_JSON']:
+        stream_handler.setFormatter(JSONFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(
+            '%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'
+        ))
+
+    # Flask names app.logger after the package, so this also covers app.logger
+    logger = logging.getLogger('app')
+    logger.handlers = [queue_handler]
+    logger.setLevel(config['LOG_LEVEL'])
+    logger.propagate = False
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+def init_app(app):
+    """Configure logging and tag each request with an id"""
+    configure(app.config)
+
+    @app.before_request
+    def assign_request_id():
+        g.request_id = request_id(request.headers)
+
+    @app.after_request
+    def echo_request_id(response):
+        if 'request_id' in g:
+            response.headers['X-Request-ID'] = g.request_id
+        return response
+
+atexit.register(_stop_listener)
+os.register_at_fork(after_in_child=_restart_listener_in_child)
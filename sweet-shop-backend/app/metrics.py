@@ -0,0 +1,176 @@
+import time
+import bisect
+import threading
+from flask import Response, g, request
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {value}')
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = sorted((key, list(series)) for key, series in self._values.items())
+        for label_values, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labels, label_values, ('le', bound))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {series[-1]}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+class Registry:
+    """Process-local metrics rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = []
+        # Callables returning extra lines, for values owned elsewhere
+        self._collectors = []
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        if collector not in self._collectors:
+            self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+http_requests = registry.counter(
+    'http_requests_total', 'HTTP requests by route, method and status',
+    labels=('method', 'route', 'status')
+)
+http_errors = registry.counter(
+    'http_request_errors_total', 'HTTP requests that ended in a 5xx response',
+    labels=('method', 'route')
+)
+http_latency = registry.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route',
+    labels=('method', 'route')
+)
+mongo_latency = registry.histogram(
+    'mongo_command_duration_seconds', 'MongoDB command latency by command',
+    labels=('command', 'outcome')
+)
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Times every MongoDB command the driver sends"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_latency.observe(event.duration_micros / 1e6, event.command_name, 'ok')
+
+    def failed(self, event):
+        mongo_latency.observe(event.duration_micros / 1e6, event.command_name, 'error')
+
+mongo_listener = MongoCommandListener()
+
+def cache_metrics():
+    """Catalogue cache counters, read at scrape time"""
+    from app.models import Sweet
+    stats = Sweet.cache.stats()
+    if not stats.get('enabled'):
+        return []
+    lines = []
+    for key in ('hits', 'misses', 'evictions', 'expirations'):
+        name = f'catalogue_cache_{key}_total'
+        lines += [f'# TYPE {name} counter', f'{name} {stats[key]}']
+    lines += ['# TYPE catalogue_cache_size gauge', f'catalogue_cache_size {stats["size"]}']
+    return lines
+
+registry.add_collector(cache_metrics)
+
+def init_app(app):
+    """Time every request and serve the registry at /api/metrics"""
+    if not app.config['METRICS_ENABLED']:
+        return
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        # Label by URL rule, not path, so /<sweet_id>/purchase is one series
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        http_latency.observe(time.perf_counter() - start, request.method, route)
+        http_requests.inc(request.method, route, str(response.status_code))
+        if response.status_code >= 500:
+            http_errors.inc(request.method, route)
+        return response
+
+    @app.route('/api/metrics')
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
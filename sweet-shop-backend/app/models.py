@@ -1,12 +1,28 @@
+import re
+import json
+import base64
+from contextlib import contextmanager
 from datetime import datetime
-from flask_pymongo import PyMongo
 from flask_bcrypt import Bcrypt
+from pymongo import ReadPreference, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from bson import ObjectId
 from bson.errors import InvalidId
+from app.cache import NullCache
+from app.db import ForkSafeMongo
+from app.serialization import dumps
+from app.passwords import PasswordHasher
+from app.stock import STOCK_FIELDS, stock
+from app.validation import ValidationError
+from app.holds import (
+    active_holds, confirm_updates, hold_document, held_quantities, holds_released, release_updates, sweeper, too_many_holds,
+    total, without_deleted
+)
 
 # Initialize extensions
-mongo = PyMongo()
+mongo = ForkSafeMongo()
 bcrypt = Bcrypt()
+passwords = PasswordHasher()
 
 def to_object_id(id_str):
     """Convert string to ObjectId, return None if invalid"""
@@ -15,26 +31,31 @@ def to_object_id(id_str):
     except (InvalidId, TypeError):
         return None
 
+def supports_transactions():
+    """Multi-document transactions need a replica set or sharded cluster"""
+    topology = mongo.cx.topology_description.topology_type_name
+    return topology in ('ReplicaSetWithPrimary', 'Sharded')
+
 class User:
     @staticmethod
     def create(email, password, name, role='customer'):
         users = mongo.db.users
         
-        # Check if user already exists
-        if users.find_one({'email': email}):
-            return None
-        
         # Create user document
         user_data = {
             'email': email,
-            'password': bcrypt.generate_password_hash(password).decode('utf-8'),
+            'password': passwords.hash(password),
             'name': name,
             'role': role,
             'created_at': datetime.utcnow(),
             'updated_at': datetime.utcnow()
         }
         
-        result = users.insert_one(user_data)
+        # The unique email index rejects existing users in the same round trip
+        try:
+            result = users.insert_one(user_data)
+        except DuplicateKeyError:
+            return None
         user_data['id'] = str(result.inserted_id)
         return user_data
     
@@ -61,7 +82,7 @@ class User:
     
     @staticmethod
     def verify_password(stored_password, provided_password):
-        return bcrypt.check_password_hash(stored_password, provided_password)
+        return passwords.check(stored_password, provided_password)
     
     @staticmethod
     def to_dict(user):
@@ -76,68 +97,818 @@ class User:
         }
 
 class Sweet:
+    # Read-through cache for catalogue reads, replaced in create_app
+    cache = NullCache()
+    
+    # Read preference for catalogue browsing, replaced in create_app
+    catalogue_reads = ReadPreference.PRIMARY
+    
+    # Fields exposed through to_dict, in response order. quantity is what is
+    # on sale; on_hand also counts the units held in carts
+    FIELDS = ('id', 'name', 'category', 'price', 'quantity', 'on_hand', 'version', 'created_at', 'updated_at')
+    
+    # Lowest price a bulk price change can leave behind
+    MIN_PRICE = 0.01
+    
+    # Keyset order for paginated listings
+    PAGE_ORDER = [('name', 1), ('_id', 1)]
+    
+    # Search modes: prefix on the normalized name, whole words via the text
+    # index, or auto which matches either
+    SEARCH_MODES = ('auto', 'prefix', 'text')
+    
+    # Most recently written sweet first, served by the updated_at index
+    LATEST_WRITE = [('updated_at', -1), ('_id', -1)]
+    
+    @staticmethod
+    def catalogue_version(session=None):
+        """Version that moves with every write to the sweets collection.
+        
+        Catalogue edits (create, update, reprice, import, delete, sharding)
+        bump a counter document. Stock writes leave it alone, so purchases
+        share no hot document; they move their own sweet's version and
+        updated_at, and the most recently written sweet stands for those.
+        """
+        counter = mongo.db.counters.find_one({'_id': 'sweets'}, session=session)
+        latest = mongo.db.sweets.find_one(
+            {}, {'updated_at': 1, 'version': 1}, sort=Sweet.LATEST_WRITE, session=session
+        )
+        return Sweet.version_of(counter, latest)
+    
+    @staticmethod
+    def version_of(counter, latest):
+        """(edit counter, latest write) from the two documents catalogue_version reads"""
+        stamp = (latest.get('updated_at'), latest['_id'], latest.get('version', 0)) if latest else None
+        return counter['version'] if counter else 0, stamp
+    
+    @staticmethod
+    def stock_version(session=None):
+        """Catalogue version plus the units in stock counters, see StockShards.units"""
+        return Sweet.catalogue_version(session), stock.units(mongo.db, session)
+    
+    @staticmethod
+    def catalogue():
+        """The sweets collection as catalogue browsing reads it.
+        
+        Listing, search and cached single-sweet reads tolerate a little
+        staleness, so they follow CATALOGUE_READ_PREFERENCE and may be served
+        by a secondary. Writes, and the reads that precede them, use
+        mongo.db.sweets and stay on the primary.
+        """
+        return mongo.db.sweets.with_options(read_preference=Sweet.catalogue_reads)
+    
+    @staticmethod
+    @contextmanager
+    def catalogue_snapshot():
+        """Yield (session, version) for reading through Sweet.catalogue().
+        
+        The version is read on the primary inside a causally consistent
+        session, and secondary reads in that session wait until their member
+        has replicated at least that far. A result is therefore never older
+        than the version it is cached or tagged under.
+        """
+        with mongo.cx.start_session(causal_consistency=True) as session:
+            yield session, Sweet.catalogue_version(session)
+    
+    @staticmethod
+    def mark_changed(*sweet_ids):
+        """Record a catalogue edit: bump the catalogue version and drop stale cache entries"""
+        mongo.db.counters.update_one({'_id': 'sweets'}, {'$inc': {'version': 1}}, upsert=True)
+        Sweet.mark_stock_changed(*sweet_ids)
+    
+    @staticmethod
+    def mark_stock_changed(*sweet_ids):
+        """Record a stock write, which already moved the sweets' updated_at.
+        
+        Only this worker's cached copies are dropped; other workers see the
+        new catalogue_version on their next read.
+        """
+        for sweet_id in sweet_ids:
+            Sweet.cache.delete(('sweet', str(sweet_id)))
+        Sweet.cache.invalidate('list')
+        Sweet.cache.invalidate('list-json')
+        Sweet.cache.invalidate('search')
+    
+    @staticmethod
+    def search_fields(name=None, category=None):
+        """Lowercased copies of name/category that back the search indexes"""
+        fields = {}
+        if name is not None:
+            fields['name_lower'] = name.lower()
+        if category is not None:
+            fields['category_lower'] = category.lower()
+        return fields
+    
     @staticmethod
     def create(name, category, price, quantity=0):
         sweets = mongo.db.sweets
         
-        # Check if sweet already exists
-        if sweets.find_one({'name': name}):
-            return None
-        
         # Create sweet document
         sweet_data = {
             'name': name,
             'category': category,
             'price': float(price),
             'quantity': int(quantity),
+            'version': 1,
             'created_at': datetime.utcnow(),
             'updated_at': datetime.utcnow()
         }
+        sweet_data.update(Sweet.search_fields(name, category))
         
-        result = sweets.insert_one(sweet_data)
+        # The unique name index rejects duplicates in the same round trip
+        try:
+            result = sweets.insert_one(sweet_data)
+        except DuplicateKeyError:
+            return None
         sweet_data['id'] = str(result.inserted_id)
+        Sweet.mark_changed()
         return sweet_data
     
     @staticmethod
     def get_all():
-        sweets = mongo.db.sweets.find().sort('name', 1)
-        result = []
-        for sweet in sweets:
-            sweet['id'] = str(sweet['_id'])
-            del sweet['_id']
-            result.append(sweet)
-        return result
+        with Sweet.catalogue_snapshot() as (session, version):
+            # Keying on the catalogue version keeps workers coherent: a write
+            # in any process moves every reader on to a fresh entry
+            key = ('list', version)
+            
+            def load():
+                sweets = Sweet.catalogue().find(session=session).sort('name', 1)
+                result = []
+                for sweet in sweets:
+                    sweet['id'] = str(sweet['_id'])
+                    del sweet['_id']
+                    result.append(sweet)
+                return result
+            
+            # Hand out copies so callers cannot mutate the cached documents
+            sweets = [dict(sweet) for sweet in Sweet.cache.get_or_load(key, load)]
+        return stock.with_totals(mongo.db, sweets)
     
     @staticmethod
-    def find_by_id(sweet_id):
-        sweets = mongo.db.sweets
+    def public_shape(fields=None):
+        """$project stage that builds to_dict's output inside Mongo"""
+        shape = {'_id': 0}
+        for field in fields or Sweet.FIELDS:
+            if field == 'id':
+                shape['id'] = {'$toString': '$_id'}
+            elif field == 'version':
+                shape['version'] = {'$ifNull': ['$version', 0]}
+            elif field == 'on_hand':
+                shape['on_hand'] = {'$add': [{'$ifNull': ['$quantity', 0]}, {'$ifNull': ['$reserved', 0]}]}
+            else:
+                shape[field] = {'$ifNull': [f'${field}', None]}
+        return shape
+    
+    @staticmethod
+    def get_all_json(fields=None):
+        """The sorted catalogue as a ready-to-send JSON array (bytes).
+        
+        Documents are shaped by the server and encoded in one batch, skipping
+        the per-document to_dict dicts and isoformat calls entirely.
+        """
+        fields = tuple(fields) if fields else Sweet.FIELDS
+        with Sweet.catalogue_snapshot() as (session, version):
+            key = ('list-json', version, fields)
+            
+            def load():
+                documents = list(Sweet.catalogue().aggregate([
+                    {'$sort': {'name': 1}},
+                    {'$project': {**Sweet.public_shape(fields), '_id': 1, 'stock_shards': 1}}
+                ], session=session))
+                # Positions of sharded sweets, whose counters change without
+                # a catalogue version bump and are added per request
+                sharded = {}
+                for index, document in enumerate(documents):
+                    if document.pop('stock_shards', None):
+                        sharded[index] = document['_id']
+                    del document['_id']
+                return dumps(documents), sharded
+            
+            body, sharded = Sweet.cache.get_or_load(key, load)
+        if not sharded or not set(STOCK_FIELDS) & set(fields):
+            return body
+        documents = json.loads(body)
+        totals = stock.totals(mongo.db, list(sharded.values()))
+        for index, obj_id in sharded.items():
+            for field in STOCK_FIELDS:
+                if field in documents[index]:
+                    documents[index][field] += totals.get(str(obj_id), 0)
+        return dumps(documents)
+    
+    @staticmethod
+    def iter_all(batch_size, fields=None):
+        """Yield sweets sorted by name without materializing the collection"""
+        projection = Sweet.page_projection(fields, need_name=False)
+        
+        with Sweet.catalogue_snapshot() as (session, _):
+            cursor = Sweet.catalogue().find({}, projection, session=session)
+            cursor = cursor.sort('name', 1).batch_size(batch_size)
+            try:
+                for sweet in cursor:
+                    sweet['id'] = str(sweet['_id'])
+                    del sweet['_id']
+                    yield stock.with_totals(mongo.db, [sweet])[0]
+            finally:
+                cursor.close()
+    
+    @staticmethod
+    def get_page(limit, after=None, fields=None, with_total=True):
+        """Keyset page of sweets ordered by (name, _id).
+        
+        Returns (sweets, next_cursor, total). next_cursor is None on the last
+        page and total is None when with_total is False. Raises ValueError for
+        a malformed cursor.
+        """
+        sweets = Sweet.catalogue()
+        query = Sweet.page_query(after)
+        
+        # Fetch one extra document to learn whether another page exists
+        with Sweet.catalogue_snapshot() as (session, _):
+            cursor = sweets.find(query, Sweet.page_projection(fields), session=session)
+            cursor = cursor.sort(Sweet.PAGE_ORDER).limit(limit + 1)
+            page = []
+            for sweet in cursor:
+                sweet['id'] = str(sweet['_id'])
+                del sweet['_id']
+                page.append(sweet)
+        page, next_cursor = Sweet.split_page(page, limit)
+        stock.with_totals(mongo.db, page)
+        
+        total = sweets.estimated_document_count() if with_total else None
+        return page, next_cursor, total
+    
+    @staticmethod
+    def page_query(after=None):
+        """Filter selecting sweets after the given cursor in (name, _id) order"""
+        if not after:
+            return {}
+        name, obj_id = Sweet.decode_cursor(after)
+        return {'$or': [
+            {'name': {'$gt': name}},
+            {'name': name, '_id': {'$gt': obj_id}}
+        ]}
+    
+    @staticmethod
+    def page_projection(fields=None, need_name=True):
+        if not fields:
+            return None
+        projection = {field: 1 for field in fields if field not in ('id', 'on_hand')}
+        if 'on_hand' in fields:
+            projection.update(quantity=1, reserved=1)
+        if need_name:
+            # name is always needed to build the next cursor
+            projection['name'] = 1
+        if 'quantity' in projection:
+            # Sharded sweets hold only part of their stock in quantity
+            projection['stock_shards'] = 1
+        return projection
+    
+    @staticmethod
+    def split_page(documents, limit):
+        """Trim a limit + 1 fetch to (page, next_cursor)"""
+        if len(documents) > limit:
+            documents = documents[:limit]
+            return documents, Sweet.encode_cursor(documents[-1])
+        return documents, None
+    
+    @staticmethod
+    def encode_cursor(sweet):
+        """Opaque cursor pointing just past the given sweet"""
+        raw = json.dumps([sweet['name'], sweet['id']]).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+    
+    @staticmethod
+    def decode_cursor(cursor):
+        """Inverse of encode_cursor, returns (name, ObjectId)"""
+        try:
+            name, sweet_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except (ValueError, TypeError):
+            raise ValueError('Invalid cursor')
+        obj_id = to_object_id(sweet_id)
+        if not isinstance(name, str) or not obj_id:
+            raise ValueError('Invalid cursor')
+        return name, obj_id
+    
+    @staticmethod
+    def find_by_id(sweet_id, cached=True):
+        """Look up one sweet; pass cached=False before read-modify-write.
+        
+        Cached lookups are catalogue reads and may come from a secondary,
+        uncached ones always read the primary.
+        """
         obj_id = to_object_id(sweet_id)
         if not obj_id:
             return None
-        sweet = sweets.find_one({'_id': obj_id})
+        
+        def load(sweets, session=None):
+            sweet = sweets.find_one({'_id': obj_id}, session=session)
+            if sweet:
+                sweet['id'] = str(sweet['_id'])
+                del sweet['_id']
+            return sweet
+        
+        def load_catalogue():
+            with Sweet.catalogue_snapshot() as (session, _):
+                return load(Sweet.catalogue(), session)
+        
+        if not cached:
+            sweet = load(mongo.db.sweets)
+        else:
+            sweet = Sweet.cache.get_or_load(('sweet', str(obj_id)), load_catalogue)
+            sweet = dict(sweet) if sweet else None
+        return stock.with_totals(mongo.db, [sweet])[0] if sweet else None
+    
+    @staticmethod
+    def find_by_name(name):
+        """Exact name lookup on the primary, served by the unique name index"""
+        sweet = mongo.db.sweets.find_one({'name': name})
         if sweet:
             sweet['id'] = str(sweet['_id'])
             del sweet['_id']
         return sweet
     
     @staticmethod
-    def update(sweet_id, update_data):
+    def version_query(obj_id, version=None):
+        """Filter for one sweet, optionally only while it is at version.
+        
+        Sweets written before versioning have no version field and count
+        as version 0.
+        """
+        query = {'_id': obj_id}
+        if version == 0:
+            query['version'] = {'$in': [0, None]}
+        elif version is not None:
+            query['version'] = version
+        return query
+    
+    @staticmethod
+    def update(sweet_id, update_data, version=None):
+        """Set fields and return the updated sweet, or None.
+        
+        With a version the write only applies if nobody else has written the
+        sweet since that version was read (compare-and-set), so None means
+        either the sweet is gone or the version is stale. The sweet carries
+        adjustment, see applied_update. Raises ValidationError when a rename
+        collides with another sweet's name.
+        """
         sweets = mongo.db.sweets
         obj_id = to_object_id(sweet_id)
         if not obj_id:
             return None
             
         update_data['updated_at'] = datetime.utcnow()
+        update_data.update(Sweet.search_fields(update_data.get('name'), update_data.get('category')))
         
-        result = sweets.update_one(
-            {'_id': obj_id},
-            {'$set': update_data}
+        try:
+            before = sweets.find_one_and_update(
+                Sweet.version_query(obj_id, version),
+                {'$set': update_data, '$inc': {'version': 1}},
+                return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            # Renamed to a name taken after the route checked it
+            raise ValidationError('Sweet with this name already exists')
+        if not before:
+            return None
+        Sweet.mark_changed(obj_id)
+        return stock.with_totals(mongo.db, [Sweet.applied_update(before, update_data)])[0]
+    
+    @staticmethod
+    def applied_update(before, update_data):
+        """The sweet as update() left it, built from the document it replaced.
+        
+        adjustment is what the write did to quantity. It comes from the same
+        round trip, so purchases made since the caller last read the sweet
+        are not counted in it.
+        """
+        sweet = {**before, **update_data, 'version': before.get('version', 0) + 1}
+        sweet['adjustment'] = sweet.get('quantity', 0) - before.get('quantity', 0)
+        sweet['id'] = str(sweet.pop('_id'))
+        return sweet
+    
+    @staticmethod
+    def restock(sweet_id, quantity, version=None):
+        """Atomically add quantity to stock, return updated sweet or None.
+        
+        The increment happens in Mongo, so concurrent restocks and purchases
+        never lose each other's changes. version works as for update.
+        """
+        sweets = mongo.db.sweets
+        obj_id = to_object_id(sweet_id)
+        if not obj_id:
+            return None
+        
+        sweet = sweets.find_one_and_update(
+            Sweet.version_query(obj_id, version),
+            {
+                '$inc': {'quantity': quantity, 'version': 1},
+                '$set': {'updated_at': datetime.utcnow()}
+            },
+            return_document=ReturnDocument.AFTER
         )
+        if not sweet:
+            return None
+        Sweet.mark_stock_changed(obj_id)
+        sweet['id'] = str(sweet['_id'])
+        del sweet['_id']
+        return stock.with_totals(mongo.db, [sweet])[0]
+    
+    @staticmethod
+    def purchase(sweet_id, quantity):
+        """Atomically take quantity from stock, return updated sweet or None"""
+        sweets = mongo.db.sweets
+        obj_id = to_object_id(sweet_id)
+        if not obj_id:
+            return None
         
-        if result.modified_count > 0:
-            return Sweet.find_by_id(sweet_id)
+        shards = stock.hint(obj_id)
+        if shards:
+            sweet = Sweet._purchase_sharded(obj_id, shards, quantity)
+            if sweet:
+                return sweet
+        
+        # Stock check and decrement happen in a single round trip, so two
+        # concurrent buyers can never both pass the check and oversell
+        sweet = sweets.find_one_and_update(
+            {'_id': obj_id, 'quantity': {'$gte': quantity}},
+            {
+                '$inc': {'quantity': -quantity, 'version': 1},
+                '$set': {'updated_at': datetime.utcnow()}
+            },
+            return_document=ReturnDocument.AFTER
+        )
+        if sweet:
+            Sweet.mark_stock_changed(obj_id)
+            sweet['id'] = str(sweet['_id'])
+            del sweet['_id']
+            return stock.with_totals(mongo.db, [sweet])[0]
+        
+        # Out of stock, or sharded without this worker knowing yet
+        current = sweets.find_one({'_id': obj_id}, {'stock_shards': 1})
+        stock.remember(obj_id, current and current.get('stock_shards'))
+        if current and current.get('stock_shards') and current['stock_shards'] != shards:
+            return Sweet._purchase_sharded(obj_id, current['stock_shards'], quantity)
         return None
     
+    @staticmethod
+    def _purchase_sharded(obj_id, shards, quantity):
+        """Take stock from one counter, see app.stock.StockShards.
+        
+        Only a rebalance that touched the sweet's own quantity writes the
+        sweet; plain counter decrements leave it alone.
+        """
+        purchased, pool_changed = stock.purchase(mongo.db, obj_id, shards, quantity)
+        if pool_changed:
+            Sweet.mark_stock_changed(obj_id)
+        if not purchased:
+            return None
+        return Sweet.find_by_id(str(obj_id))
+    
+    @staticmethod
+    def shard_stock(sweet_id, shards):
+        """Split a hot sweet's stock over shards counters (again, to resize)"""
+        obj_id = to_object_id(sweet_id)
+        if not obj_id or not stock.enable(mongo.db, obj_id, shards):
+            return None
+        Sweet.mark_changed(obj_id)
+        return Sweet.find_by_id(sweet_id, cached=False)
+    
+    @staticmethod
+    def unshard_stock(sweet_id):
+        """Fold a sweet's counters back into its quantity"""
+        obj_id = to_object_id(sweet_id)
+        if not obj_id or not stock.disable(mongo.db, obj_id):
+            return None
+        Sweet.mark_changed(obj_id)
+        return Sweet.find_by_id(sweet_id, cached=False)
+    
+    @staticmethod
+    def checkout(items, hold=False):
+        """Purchase every (sweet_id, quantity) line or none of them.
+        
+        Returns (success, results) with one result per line, in order. With
+        hold the units move to reserved instead of being sold; see Hold.
+        """
+        sweets = mongo.db.sweets
+        wanted = Sweet.checkout_quantities(items)
+        reserve = Sweet._checkout_transaction if supports_transactions() else Sweet._checkout_bulk
+        
+        # Checkout reserves from the sweet's own quantity, so move the units
+        # of sharded sweets there from their counters first
+        for obj_id, quantity in wanted.items():
+            if stock.hint(obj_id):
+                stock.gather(mongo.db, obj_id, quantity)
+        docs, failed = reserve(sweets, wanted, hold)
+        
+        unhinted = [obj_id for obj_id in failed
+                    if docs.get(obj_id, {}).get('stock_shards') and not stock.hint(obj_id)]
+        if unhinted:
+            for obj_id in unhinted:
+                stock.remember(obj_id, docs[obj_id]['stock_shards'])
+                stock.gather(mongo.db, obj_id, wanted[obj_id])
+            docs, failed = reserve(sweets, wanted, hold)
+        Sweet.mark_stock_changed(*wanted)
+        stock.with_totals(mongo.db, list(docs.values()), key='_id')
+        return not failed, Sweet.checkout_results(items, docs, failed, 'held' if hold else 'purchased')
+    
+    @staticmethod
+    def checkout_quantities(items):
+        """{ObjectId: total quantity}; repeated lines are reserved together"""
+        wanted = {}
+        for sweet_id, quantity in items:
+            obj_id = to_object_id(sweet_id)
+            wanted[obj_id] = wanted.get(obj_id, 0) + quantity
+        return wanted
+    
+    @staticmethod
+    def checkout_results(items, docs, failed, status='purchased'):
+        """One status per checkout line from the documents read back"""
+        results = []
+        for sweet_id, quantity in items:
+            obj_id = to_object_id(sweet_id)
+            doc = docs.get(obj_id)
+            result = {'sweet_id': sweet_id, 'quantity': quantity}
+            if not doc:
+                result['status'] = 'not_found'
+            elif obj_id in failed:
+                result['status'] = 'insufficient_stock'
+                result['available'] = doc['quantity']
+            elif failed:
+                result['status'] = 'rolled_back'
+            else:
+                result['status'] = status
+                result['name'] = doc['name']
+                result['price'] = doc['price']
+                result['remaining'] = doc['quantity']
+            results.append(result)
+        return results
+    
+    @staticmethod
+    def reservation_inc(quantity, hold=False):
+        """$inc taking quantity off sale, into reserved when it is only held"""
+        inc = {'quantity': -quantity, 'version': 1}
+        if hold:
+            inc['reserved'] = quantity
+        return inc
+    
+    @staticmethod
+    def _checkout_transaction(sweets, wanted, hold=False):
+        """Reserve all lines inside one transaction, aborting on any shortfall"""
+        def reserve(session):
+            docs, failed = {}, set()
+            now = datetime.utcnow()
+            for obj_id, quantity in wanted.items():
+                doc = sweets.find_one_and_update(
+                    {'_id': obj_id, 'quantity': {'$gte': quantity}},
+                    {'$inc': Sweet.reservation_inc(quantity, hold), '$set': {'updated_at': now}},
+                    return_document=ReturnDocument.AFTER,
+                    session=session
+                )
+                if doc:
+                    docs[obj_id] = doc
+                else:
+                    failed.add(obj_id)
+            
+            if failed:
+                for doc in sweets.find({'_id': {'$in': list(failed)}}, session=session):
+                    docs[doc['_id']] = doc
+                session.abort_transaction()
+            return docs, failed
+        
+        with mongo.cx.start_session() as session:
+            return session.with_transaction(reserve)
+    
+    @staticmethod
+    def _checkout_bulk(sweets, wanted, hold=False):
+        """Reserve all lines with one bulk_write, compensating on any shortfall.
+        
+        Each applied update tags the sweet with the order id so the follow-up
+        read can tell which lines went through without per-line round trips.
+        """
+        order_id = ObjectId()
+        now = datetime.utcnow()
+        
+        sweets.bulk_write(Sweet.reservation_updates(wanted, order_id, now, hold), ordered=False)
+        
+        docs = {doc['_id']: doc for doc in sweets.find({'_id': {'$in': list(wanted)}})}
+        applied = Sweet.applied_reservations(wanted, docs, order_id)
+        failed = set(wanted) - set(applied)
+        
+        if not failed:
+            sweets.update_many(
+                {'_id': {'$in': applied}},
+                {'$pull': {'pending_checkouts': order_id}}
+            )
+        elif applied:
+            sweets.bulk_write(Sweet.compensating_updates(wanted, applied, order_id, now, hold), ordered=False)
+        return docs, failed
+    
+    @staticmethod
+    def reservation_updates(wanted, order_id, now, hold=False):
+        return [
+            UpdateOne(
+                {'_id': obj_id, 'quantity': {'$gte': quantity}},
+                {
+                    '$inc': Sweet.reservation_inc(quantity, hold),
+                    '$set': {'updated_at': now},
+                    '$addToSet': {'pending_checkouts': order_id}
+                }
+            )
+            for obj_id, quantity in wanted.items()
+        ]
+    
+    @staticmethod
+    def applied_reservations(wanted, docs, order_id):
+        """Lines whose reservation went through, judged by the order tag"""
+        return [obj_id for obj_id in wanted
+                if obj_id in docs and order_id in docs[obj_id].get('pending_checkouts', [])]
+    
+    @staticmethod
+    def compensating_updates(wanted, applied, order_id, now, hold=False):
+        """Give back the stock taken by applied lines of a failed checkout"""
+        return [
+            UpdateOne(
+                {'_id': obj_id, 'pending_checkouts': order_id},
+                {
+                    '$inc': Sweet.reservation_inc(-wanted[obj_id], hold),
+                    '$set': {'updated_at': now},
+                    '$pull': {'pending_checkouts': order_id}
+                }
+            )
+            for obj_id in applied
+        ]
+    
+    @staticmethod
+    def price_update(percent=None, amount=None, now=None):
+        """Pipeline update moving price by percent or by amount, rounded to cents"""
+        if percent is not None:
+            price = {'$multiply': ['$price', 1 + percent / 100]}
+        else:
+            price = {'$add': ['$price', amount]}
+        return [{'$set': {
+            'price': {'$max': [Sweet.MIN_PRICE, {'$round': [price, 2]}]},
+            'version': {'$add': [{'$ifNull': ['$version', 0]}, 1]},
+            'updated_at': now or datetime.utcnow()
+        }}]
+    
+    @staticmethod
+    def reprice(query, percent=None, amount=None):
+        """Change the price of every sweet matching query in one update_many.
+        
+        A cut by amount never takes a price to zero or below: sweets priced
+        at or under the cut are left alone and counted as skipped.
+        Returns (matched, modified, skipped).
+        """
+        sweets = mongo.db.sweets
+        guarded, skipped = query, 0
+        if amount is not None and amount < 0:
+            price = query.get('price', {})
+            guarded = {**query, 'price': {**price, '$gt': -amount}}
+            skipped = sweets.count_documents({**query, 'price': {**price, '$lte': -amount}})
+        
+        result = sweets.update_many(guarded, Sweet.price_update(percent, amount))
+        # Which sweets changed is not known by id, so drop every cached one
+        Sweet.mark_changed()
+        Sweet.cache.invalidate('sweet')
+        return result.matched_count, result.modified_count, skipped
+    
+    @staticmethod
+    def restock_many(lines):
+        """Add stock to several sweets with one bulk_write.
+        
+        lines is [(sweet_id, quantity), ...]; repeated ids are summed.
+        Returns one result per distinct sweet, in request order, with its
+        new stock level or a not_found status.
+        """
+        sweets = mongo.db.sweets
+        wanted = Sweet.checkout_quantities(lines)
+        now = datetime.utcnow()
+        sweets.bulk_write([
+            UpdateOne(
+                {'_id': obj_id},
+                {'$inc': {'quantity': quantity, 'version': 1}, '$set': {'updated_at': now}}
+            )
+            for obj_id, quantity in wanted.items()
+        ], ordered=False)
+        Sweet.mark_stock_changed(*wanted)
+        
+        docs = {doc['_id']: doc for doc in sweets.find(
+            {'_id': {'$in': list(wanted)}}, {'name': 1, 'quantity': 1, 'stock_shards': 1}
+        )}
+        stock.with_totals(mongo.db, list(docs.values()), key='_id')
+        return Sweet.restock_results(wanted, docs)
+    
+    @staticmethod
+    def restock_results(wanted, docs):
+        results = []
+        for obj_id, quantity in wanted.items():
+            result = {'sweet_id': str(obj_id), 'quantity': quantity}
+            doc = docs.get(obj_id)
+            if doc:
+                result.update(status='restocked', name=doc['name'], stock=doc['quantity'])
+            else:
+                result['status'] = 'not_found'
+            results.append(result)
+        return results
+    
+    @staticmethod
+    def upsert_operations(rows, now, batch_id):
+        """One upsert per validated row, matched on the unique name.
+        
+        Pipeline updates, so each sweet also records what the row did to its
+        quantity under pending_import, for the stock ledger. Sharded sweets
+        are not matched: setting quantity would only replace their pool, so
+        the row's insert fails on the unique name instead.
+        """
+        operations = []
+        for row in rows:
+            quantity = int(row['quantity'])
+            fields = {
+                'category': row['category'],
+                'price': float(row['price']),
+                'quantity': quantity,
+                'updated_at': now
+            }
+            fields.update(Sweet.search_fields(row['name'], row['category']))
+            operations.append(UpdateOne(
+                {'name': row['name'], 'stock_shards': {'$exists': False}},
+                [{'$set': {
+                    # Values from the upload must never be read as field paths
+                    **{field: {'$literal': value} for field, value in fields.items()},
+                    'version': {'$add': [{'$ifNull': ['$version', 0]}, 1]},
+                    'created_at': {'$ifNull': ['$created_at', now]},
+                    # $quantity is still the stored value within this stage
+                    'pending_import': {
+                        'batch': batch_id,
+                        'delta': {'$subtract': [quantity, {'$ifNull': ['$quantity', 0]}]}
+                    }
+                }}],
+                upsert=True
+            ))
+        return operations
+    
+    @staticmethod
+    def mark_sharded(rows, failed, docs):
+        """Flag the failed rows that name a sharded sweet, from docs of those sweets"""
+        sharded = {doc['name'] for doc in docs}
+        for index, error in failed.items():
+            if rows[index]['name'] in sharded:
+                error['sharded'] = True
+        return failed
+    
+    @staticmethod
+    def sharded_query(rows, failed):
+        """Filter for the sharded sweets named by failed rows"""
+        return {'name': {'$in': [rows[index]['name'] for index in failed]}, 'stock_shards': {'$exists': True}}
+    
+    @staticmethod
+    def import_adjustments(rows, inserted, failed, docs):
+        """{row index: (sweet id, quantity change)} for existing sweets a batch changed"""
+        changed = {doc['name']: doc for doc in docs if doc['pending_import']['delta']}
+        return {
+            index: (str(changed[row['name']]['_id']), changed[row['name']]['pending_import']['delta'])
+            for index, row in enumerate(rows)
+            if row['name'] in changed and index not in inserted and index not in failed
+        }
+    
+    @staticmethod
+    def upsert_many(rows):
+        """Create or update a batch of sweets by name in one unordered bulk_write.
+        
+        Returns (inserted, updated, failed, adjusted): {row index: new id}
+        for created sweets, the number of existing sweets changed, {row
+        index: write error} for rows the server rejected, with sharded set
+        when the row named a sharded sweet, and {row index: (sweet id,
+        quantity change)} for existing sweets whose stock the row changed.
+        Other rows are unaffected by a rejected one.
+        """
+        if not rows:
+            return {}, 0, {}, {}
+        sweets = mongo.db.sweets
+        batch_id = ObjectId()
+        try:
+            result = sweets.bulk_write(
+                Sweet.upsert_operations(rows, datetime.utcnow(), batch_id), ordered=False
+            ).bulk_api_result
+        except BulkWriteError as e:
+            result = e.details
+        inserted = {upsert['index']: str(upsert['_id']) for upsert in result.get('upserted', [])}
+        failed = {error['index']: error for error in result.get('writeErrors', [])}
+        if failed:
+            Sweet.mark_sharded(rows, failed, sweets.find(Sweet.sharded_query(rows, failed), {'name': 1}))
+        
+        adjusted = {}
+        if result.get('nMatched'):
+            query = {'name': {'$in': [row['name'] for row in rows]}, 'pending_import.batch': batch_id}
+            docs = sweets.find(query, {'name': 1, 'pending_import': 1})
+            adjusted = Sweet.import_adjustments(rows, inserted, failed, docs)
+            sweets.update_many(query, {'$unset': {'pending_import': ''}})
+        
+        # Updated sweets are not known by id, so drop every cached one
+        Sweet.mark_changed()
+        Sweet.cache.invalidate('sweet')
+        return inserted, result.get('nModified', 0), failed, adjusted
+    
     @staticmethod
     def delete(sweet_id):
         sweets = mongo.db.sweets
@@ -145,18 +916,50 @@ class Sweet:
         if not obj_id:
             return False
         result = sweets.delete_one({'_id': obj_id})
+        mongo.db.stock_shards.delete_many({'sweet_id': obj_id})
+        stock.remember(obj_id, None)
+        Sweet.mark_changed(obj_id)
         return result.deleted_count > 0
     
     @staticmethod
-    def search(name=None, category=None, min_price=None, max_price=None):
-        sweets = mongo.db.sweets
+    def search(name=None, category=None, min_price=None, max_price=None, mode='auto'):
+        with Sweet.catalogue_snapshot() as (session, version):
+            key = ('search', version, name, category, min_price, max_price, mode)
+            sweets = [dict(sweet) for sweet in Sweet.cache.get_or_load(
+                key, lambda: Sweet._search(session, name, category, min_price, max_price, mode)
+            )]
+        return stock.with_totals(mongo.db, sweets)
+    
+    @staticmethod
+    def _search(session, name, category, min_price, max_price, mode):
+        sweets = Sweet.catalogue()
+        query = Sweet.search_query(name, category, min_price, max_price, mode)
+        results = sweets.find(query, session=session).sort('name', 1)
+        sweet_list = []
+        for sweet in results:
+            sweet['id'] = str(sweet['_id'])
+            del sweet['_id']
+            sweet_list.append(sweet)
+        return sweet_list
+    
+    @staticmethod
+    def search_query(name=None, category=None, min_price=None, max_price=None, mode='auto'):
         query = {}
         
         if name:
-            query['name'] = {'$regex': name, '$options': 'i'}
+            # User input is escaped and anchored so the regex is a plain,
+            # index-bounded prefix scan on the lowercased name
+            prefix = {'name_lower': {'$regex': '^' + re.escape(name.lower())}}
+            text = {'$text': {'$search': name}}
+            if mode == 'prefix':
+                query.update(prefix)
+            elif mode == 'text':
+                query.update(text)
+            else:
+                query['$or'] = [prefix, text]
         
         if category:
-            query['category'] = {'$regex': category, '$options': 'i'}
+            query['category_lower'] = category.lower()
         
         if min_price is not None or max_price is not None:
             query['price'] = {}
@@ -165,27 +968,136 @@ class Sweet:
             if max_price is not None:
                 query['price']['$lte'] = float(max_price)
         
-        results = sweets.find(query).sort('name', 1)
-        sweet_list = []
-        for sweet in results:
-            sweet['id'] = str(sweet['_id'])
-            del sweet['_id']
-            sweet_list.append(sweet)
-        return sweet_list
+        return query
     
     @staticmethod
-    def to_dict(sweet):
+    def to_dict(sweet, fields=None):
         if not sweet:
             return None
-        return {
+        data = {
             'id': sweet.get('id'),
             'name': sweet.get('name'),
             'category': sweet.get('category'),
             'price': sweet.get('price'),
             'quantity': sweet.get('quantity'),
+            'on_hand': (sweet.get('quantity') or 0) + sweet.get('reserved', 0),
+            'version': sweet.get('version', 0),
             'created_at': sweet.get('created_at').isoformat() if sweet.get('created_at') else None,
             'updated_at': sweet.get('updated_at').isoformat() if sweet.get('updated_at') else None
         }
+        if fields:
+            return {field: data[field] for field in fields}
+        return data
+
+class Hold:
+    """Stock reserved for a customer's cart until checkout or expiry.
+    
+    Creating a hold moves the units from the sweet's quantity (on sale) to
+    reserved (still on hand), all lines or none, exactly as checkout does.
+    Confirming deletes the hold and drops the units from reserved in one
+    bulk write, reading neither the sweets nor anything but the hold.
+    Cancelled and expired holds put their units back on sale.
+    """
+    
+    @staticmethod
+    def create(user_id, items):
+        """Hold every (sweet_id, quantity) line: (hold or None, results)
+        
+        Raises ValidationError when the customer already has the most open
+        holds allowed.
+        """
+        now = datetime.utcnow()
+        if mongo.db.holds.count_documents(active_holds(user_id, now), limit=sweeper.max_active) >= sweeper.max_active:
+            raise ValidationError(too_many_holds(sweeper.max_active))
+        success, results = Sweet.checkout(items, hold=True)
+        if not success:
+            return None, results
+        hold = hold_document(user_id, results, sweeper.ttl, now)
+        mongo.db.holds.insert_one(hold)
+        return hold, results
+    
+    @staticmethod
+    def find(hold_id, user_id):
+        obj_id = to_object_id(hold_id)
+        if not obj_id:
+            return None
+        return mongo.db.holds.find_one({'_id': obj_id, 'user_id': user_id})
+    
+    @staticmethod
+    def confirm(hold_id, user_id):
+        """Sell the held units; None if the hold is unknown or has expired.
+        
+        Lines whose sweet was deleted while held are not sold and are left
+        out of the returned hold.
+        """
+        obj_id = to_object_id(hold_id)
+        if not obj_id:
+            return None
+        now = datetime.utcnow()
+        hold = mongo.db.holds.find_one_and_delete({'_id': obj_id, 'user_id': user_id, 'expires_at': {'$gt': now}})
+        if not hold:
+            return None
+        updates = confirm_updates(hold, now)
+        result = mongo.db.sweets.bulk_write(updates, ordered=False)
+        Sweet.mark_stock_changed(*held_quantities(hold))
+        if result.matched_count < len(updates):
+            found = mongo.db.sweets.find({'_id': {'$in': list(held_quantities(hold))}}, {'_id': 1})
+            hold = without_deleted(hold, {sweet['_id'] for sweet in found})
+        return hold
+    
+    @staticmethod
+    def release(hold_id, user_id):
+        """Cancel a hold, putting its units back on sale"""
+        obj_id = to_object_id(hold_id)
+        if not obj_id:
+            return None
+        hold = mongo.db.holds.find_one_and_delete({'_id': obj_id, 'user_id': user_id})
+        if not hold:
+            return None
+        Hold._put_back([hold])
+        holds_released.inc('cancelled')
+        return hold
+    
+    @staticmethod
+    def release_expired(now=None):
+        """Put the stock of every expired hold back on sale; returns how many"""
+        now = now or datetime.utcnow()
+        expired = mongo.db.holds.find({'expires_at': {'$lte': now}}, {'_id': 1}).limit(sweeper.batch_size)
+        released = []
+        for candidate in expired:
+            # Another worker's sweeper may have claimed it meanwhile
+            hold = mongo.db.holds.find_one_and_delete({'_id': candidate['_id'], 'expires_at': {'$lte': now}})
+            if hold:
+                released.append(hold)
+        if released:
+            Hold._put_back(released, now)
+            holds_released.inc('expired', amount=len(released))
+        return len(released)
+    
+    @staticmethod
+    def _put_back(holds, now=None):
+        mongo.db.sweets.bulk_write(release_updates(holds, now or datetime.utcnow()), ordered=False)
+        Sweet.mark_stock_changed(*{sweet_id for hold in holds for sweet_id in held_quantities(hold)})
+    
+    @staticmethod
+    def to_dict(hold):
+        if not hold:
+            return None
+        return {
+            'id': str(hold['_id']),
+            'items': [
+                {
+                    'sweet_id': str(item['sweet_id']),
+                    'name': item['name'],
+                    'price': item['price'],
+                    'quantity': item['quantity']
+                }
+                for item in hold['items']
+            ],
+            'total': total(hold),
+            'created_at': hold['created_at'].isoformat(),
+            'expires_at': hold['expires_at'].isoformat()
+        }
 
-# Export mongo and bcrypt
-__all__ = ['mongo', 'bcrypt', 'User', 'Sweet']
\ No newline at end of file
+# Export extensions and models
+__all__ = ['mongo', 'bcrypt', 'passwords', 'User', 'Sweet', 'Hold']
\ No newline at end of file
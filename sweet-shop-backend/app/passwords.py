@@ -0,0 +1,118 @@
+import os
+import asyncio
+import threading
+import bcrypt as _bcrypt
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+class HasherBusy(Exception):
+    """Raised when the password pool cannot take or finish work in time"""
+
+    def __init__(self, retry_after):
+        super().__init__('Password hashing capacity exhausted')
+        self.retry_after = retry_after
+
+def hash_password(password, rounds):
+    """bcrypt hash in the same format Flask-Bcrypt produces"""
+    return _bcrypt.hashpw(password.encode('utf-8'), _bcrypt.gensalt(rounds)).decode('utf-8')
+
+def check_password(pw_hash, password):
+    try:
+        return _bcrypt.checkpw(password.encode('utf-8'), pw_hash.encode('utf-8'))
+    except ValueError:
+        # Malformed stored hash
+        return False
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded worker pool instead of the request thread.
+
+    At most PASSWORD_POOL_MAX_PENDING hashes may be running or queued. Beyond
+    that, or when a result takes longer than PASSWORD_POOL_TIMEOUT seconds,
+    callers get HasherBusy so the route can answer 503 instead of queuing
+    forever. The pool is created lazily and rebuilt after a fork, so
+    pre-forking servers never inherit a parent's worker threads.
+    """
+
+    def __init__(self, app=None):
+        self.rounds = 12
+        self.workers = 2
+        self.max_pending = 16
+        self.timeout = 5.0
+        self.retry_after = 1
+        self.executor_type = 'thread'
+        self._executor = None
+        self._slots = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.shutdown()
+        self.rounds = app.config['BCRYPT_LOG_ROUNDS']
+        self.workers = app.config['PASSWORD_POOL_WORKERS']
+        self.max_pending = app.config['PASSWORD_POOL_MAX_PENDING']
+        self.timeout = app.config['PASSWORD_POOL_TIMEOUT']
+        self.retry_after = app.config['PASSWORD_POOL_RETRY_AFTER']
+        self.executor_type = app.config['PASSWORD_POOL_EXECUTOR']
+
+    def hash(self, password):
+        return self._run(hash_password, password, self.rounds)
+
+    def check(self, pw_hash, password):
+        return self._run(check_password, pw_hash, password)
+
+    async def hash_async(self, password):
+        return await self._run_async(hash_password, password, self.rounds)
+
+    async def check_async(self, pw_hash, password):
+        return await self._run_async(check_password, pw_hash, password)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                if self.executor_type == 'process':
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix='bcrypt'
+                    )
+                self._slots = threading.BoundedSemaphore(self.max_pending)
+                self._pid = os.getpid()
+            return self._executor, self._slots
+
+    def _submit(self, func, *args):
+        executor, slots = self._pool()
+        if not slots.acquire(blocking=False):
+            raise HasherBusy(self.retry_after)
+
+        try:
+            future = executor.submit(func, *args)
+        except Exception:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    def _run(self, func, *args):
+        future = self._submit(func, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise HasherBusy(self.retry_after)
+
+    async def _run_async(self, func, *args):
+        # Same pool and limits, but the event loop keeps serving while it waits
+        future = self._submit(func, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            raise HasherBusy(self.retry_after)
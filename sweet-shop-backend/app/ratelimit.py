@@ -0,0 +1,196 @@
+import math
+import time
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+from functools import wraps
+from flask import jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import InvalidTokenError
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from app.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+rate_limited_requests = registry.counter(
+    'http_rate_limited_total', 'Requests rejected by the rate limiter', labels=('endpoint',)
+)
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+# A bucket holds up to capacity tokens and refills at rate tokens per second
+Limit = namedtuple('Limit', ['rate', 'capacity'])
+
+def parse_limit(value):
+    """'10/minute' -> Limit allowing bursts of 10, refilling 10 per minute"""
+    try:
+        count, period = value.split('/')
+        count = int(count)
+        seconds = PERIODS[period.strip()]
+    except (ValueError, KeyError):
+        raise ValueError(f'Invalid rate limit: {value!r}')
+    if count < 1:
+        raise ValueError(f'Invalid rate limit: {value!r}')
+    return Limit(rate=count / seconds, capacity=count)
+
+class MemoryBackend:
+    """Token buckets in this process, least recently used dropped past maxsize"""
+
+    def __init__(self, maxsize=100000, clock=time.monotonic):
+        self.maxsize = maxsize
+        self._clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, limit, cost=1):
+        """Take cost tokens; returns 0 if allowed, else seconds until it would be"""
+        now = self._clock()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (limit.capacity, now))
+            tokens = min(limit.capacity, tokens + (now - updated_at) * limit.rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (cost - tokens) / limit.rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+    async def consume_async(self, key, limit, cost=1):
+        return self.consume(key, limit, cost)
+
+class MongoBackend:
+    """Token buckets shared by every worker, in the rate_limits collection.
+
+    Refill and take happen in one findOneAndUpdate with a pipeline update,
+    timed by the server's clock, so concurrent workers cannot overspend a
+    bucket. Idle buckets are removed by a TTL index once they would be full.
+    collection is a callable returning a PyMongo or Motor collection.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    @staticmethod
+    def bucket_update(limit, cost=1):
+        elapsed = {'$divide': [{'$subtract': ['$$NOW', {'$ifNull': ['$updated_at', '$$NOW']}]}, 1000]}
+        refilled = {'$add': [{'$ifNull': ['$tokens', limit.capacity]}, {'$multiply': [elapsed, limit.rate]}]}
+        return [
+            {'$set': {'tokens': {'$min': [limit.capacity, refilled]}, 'updated_at': '$$NOW'}},
+            {'$set': {'allowed': {'$gte': ['$tokens', cost]}}},
+            {'$set': {
+                'tokens': {'$cond': ['$allowed', {'$subtract': ['$tokens', cost]}, '$tokens']},
+                'expires_at': {'$add': ['$$NOW', math.ceil(limit.capacity / limit.rate * 1000)]}
+            }}
+        ]
+
+    @staticmethod
+    def wait(bucket, limit, cost=1):
+        if bucket['allowed']:
+            return 0.0
+        return (cost - bucket['tokens']) / limit.rate
+
+    def consume(self, key, limit, cost=1):
+        bucket = self.collection().find_one_and_update(
+            {'_id': key}, self.bucket_update(limit, cost),
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return self.wait(bucket, limit, cost)
+
+    async def consume_async(self, key, limit, cost=1):
+        bucket = await self.collection().find_one_and_update(
+            {'_id': key}, self.bucket_update(limit, cost),
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return self.wait(bucket, limit, cost)
+
+class RateLimiter:
+    """Per-endpoint token-bucket limits from RATELIMITS.
+
+    Endpoints without a configured limit are never checked. If the shared
+    backend is unreachable, requests are let through rather than failed.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.limits = {}
+        self.backend = MemoryBackend()
+
+    def init_app(self, app, shared_backend=None):
+        self.enabled = app.config['RATELIMIT_ENABLED']
+        self.limits = {endpoint: parse_limit(value) for endpoint, value in app.config['RATELIMITS'].items()}
+        if app.config['RATELIMIT_BACKEND'] == 'mongo':
+            self.backend = shared_backend
+        elif app.config['RATELIMIT_BACKEND'] == 'memory':
+            self.backend = MemoryBackend()
+        else:
+            raise ValueError(f"Unknown rate limit backend: {app.config['RATELIMIT_BACKEND']}")
+
+    def limit_for(self, endpoint):
+        return self.limits.get(endpoint) if self.enabled else None
+
+    def check(self, endpoint, client):
+        """Seconds the client must wait before endpoint accepts it, 0 if now"""
+        limit = self.limit_for(endpoint)
+        if limit is None:
+            return 0
+        try:
+            wait = self.backend.consume(f'{endpoint}:{client}', limit)
+        except PyMongoError:
+            logger.warning('Rate limit check failed, allowing request', exc_info=True)
+            return 0
+        if wait:
+            rate_limited_requests.inc(endpoint)
+        return wait
+
+    async def check_async(self, endpoint, client):
+        limit = self.limit_for(endpoint)
+        if limit is None:
+            return 0
+        try:
+            wait = await self.backend.consume_async(f'{endpoint}:{client}', limit)
+        except PyMongoError:
+            logger.warning('Rate limit check failed, allowing request', exc_info=True)
+            return 0
+        if wait:
+            rate_limited_requests.inc(endpoint)
+        return wait
+
+limiter = RateLimiter()
+
+def too_many_requests(wait):
+    response = jsonify({'error': 'Too many requests, please try again later'})
+    response.headers['Retry-After'] = str(math.ceil(wait))
+    return response, 429
+
+def client_key():
+    """The JWT identity when the request carries a valid token, else its IP.
+
+    Behind a reverse proxy, wrap the app in werkzeug's ProxyFix so
+    remote_addr is the client rather than the proxy.
+    """
+    try:
+        # Already verified by an outer jwt_required (access or refresh)
+        identity = get_jwt_identity()
+    except RuntimeError:
+        try:
+            verify_jwt_in_request(optional=True)
+            identity = get_jwt_identity()
+        except (InvalidTokenError, JWTExtendedException):
+            identity = None
+    return f'user:{identity}' if identity else f'ip:{request.remote_addr}'
+
+def rate_limited(view):
+    """Answer 429 with Retry-After once the caller exhausts the endpoint's bucket"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if limiter.limit_for(request.endpoint):
+            wait = limiter.check(request.endpoint, client_key())
+            if wait:
+                return too_many_requests(wait)
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,272 @@
+import math
+import time
+import bisect
+import threading
+from datetime import datetime
+from app.models import mongo, Sweet
+from app.stock import stock
+
+def with_counters():
+    """Stages adding the units held in stock counters to quantity (app/stock.py).
+
+    A $lookup per document, so only for pipelines that have already
+    narrowed the catalogue down; see counters_pipeline for whole-catalogue
+    reports.
+    """
+    return [
+        {'$lookup': {'from': 'stock_shards', 'localField': '_id', 'foreignField': 'sweet_id', 'as': 'counters'}},
+        {'$set': {'quantity': {'$add': ['$quantity', {'$sum': '$counters.quantity'}]}}},
+        {'$project': {'counters': 0}}
+    ]
+
+def stock_value_pipeline():
+    """Items, units and stock value per category, most valuable first"""
+    return [
+        # Walks the category_price index instead of sorting in memory
+        {'$sort': {'category_lower': 1}},
+        {'$group': {
+            '_id': '$category_lower',
+            'category': {'$first': '$category'},
+            'items': {'$sum': 1},
+            'units': {'$sum': '$quantity'},
+            'out_of_stock': {'$sum': {'$cond': [{'$lte': ['$quantity', 0]}, 1, 0]}},
+            'value': {'$sum': {'$multiply': ['$price', '$quantity']}}
+        }},
+        {'$sort': {'value': -1, '_id': 1}}
+    ]
+
+def low_stock_match(threshold):
+    """Sweets with fewer than threshold units, counters included.
+
+    Only sweets already under it or sharded can be, so only those are
+    looked up in stock_shards.
+    """
+    return [
+        {'$match': {'$or': [{'quantity': {'$lt': threshold}}, {'stock_shards': {'$exists': True}}]}},
+        *with_counters(),
+        {'$match': {'quantity': {'$lt': threshold}}}
+    ]
+
+def low_stock_pipeline(threshold, limit):
+    """Sweets with fewer than threshold units, emptiest first"""
+    return [
+        *low_stock_match(threshold),
+        {'$sort': {'quantity': 1, 'name': 1}},
+        {'$limit': limit},
+        {'$project': Sweet.public_shape()}
+    ]
+
+def histogram_boundaries(low, high, buckets):
+    """buckets equal-width price ranges covering [low, high]"""
+    width = (high - low) / buckets
+    boundaries = [low + width * index for index in range(buckets)] if width else [low]
+    # $bucket upper bounds are exclusive; nudge the last one past the top price
+    boundaries.append(math.nextafter(high, math.inf))
+    return boundaries
+
+def price_histogram_pipeline(boundaries):
+    return [
+        {'$sort': {'price': 1}},
+        {'$bucket': {
+            'groupBy': '$price',
+            'boundaries': boundaries,
+            'output': {'count': {'$sum': 1}, 'units': {'$sum': '$quantity'}}
+        }}
+    ]
+
+def counters_pipeline():
+    """Units in stock counters per sharded sweet, with its pool, price and category.
+
+    Runs on stock_shards and looks up only the sweets found there, so it
+    costs the same however large the catalogue is.
+    """
+    return [
+        {'$group': {'_id': '$sweet_id', 'counters': {'$sum': '$quantity'}}},
+        {'$lookup': {'from': 'sweets', 'localField': '_id', 'foreignField': '_id', 'as': 'sweet'}},
+        {'$unwind': '$sweet'},
+        {'$project': {
+            'counters': 1,
+            'pool': '$sweet.quantity',
+            'price': '$sweet.price',
+            'category_lower': '$sweet.category_lower'
+        }}
+    ]
+
+def add_counters_to_groups(groups, counters):
+    """stock_value_pipeline groups with counters_pipeline's units folded in"""
+    by_category = {group['_id']: group for group in groups}
+    for sweet in counters:
+        group = by_category.get(sweet.get('category_lower'))
+        if not group or not sweet['counters']:
+            continue
+        group['units'] += sweet['counters']
+        group['value'] += sweet['price'] * sweet['counters']
+        # Counted as out of stock from an empty pool alone
+        if sweet['pool'] <= 0:
+            group['out_of_stock'] -= 1
+    return sorted(groups, key=lambda group: (-group['value'], group['_id'] or ''))
+
+def add_counters_to_buckets(boundaries, rows, counters):
+    """price_histogram_pipeline rows with counters_pipeline's units folded in"""
+    by_lower = {row['_id']: row for row in rows}
+    for sweet in counters:
+        index = bisect.bisect_right(boundaries, sweet['price']) - 1
+        if 0 <= index < len(boundaries) - 1 and boundaries[index] in by_lower:
+            by_lower[boundaries[index]]['units'] += sweet['counters']
+    return rows
+
+def stock_value_report(groups):
+    categories = [{
+        'category': group['category'],
+        'items': group['items'],
+        'units': group['units'],
+        'out_of_stock': group['out_of_stock'],
+        'value': round(group['value'], 2)
+    } for group in groups]
+    return {
+        'categories': categories,
+        'total_items': sum(category['items'] for category in categories),
+        'total_units': sum(category['units'] for category in categories),
+        'out_of_stock': sum(category['out_of_stock'] for category in categories),
+        'total_value': round(sum(group['value'] for group in groups), 2),
+        'generated_at': datetime.utcnow()
+    }
+
+def low_stock_report(threshold, sweets, count):
+    return {'threshold': threshold, 'count': count, 'sweets': sweets, 'generated_at': datetime.utcnow()}
+
+def price_histogram_report(boundaries, rows):
+    """One entry per range, including the empty ones $bucket leaves out"""
+    counts = {row['_id']: row for row in rows}
+    buckets = []
+    for index, lower in enumerate(boundaries[:-1]):
+        upper = boundaries[index + 1]
+        row = counts.get(lower, {})
+        buckets.append({
+            'min': round(lower, 2),
+            'max': round(upper, 2),
+            'count': row.get('count', 0),
+            'units': row.get('units', 0)
+        })
+    return {'buckets': buckets, 'generated_at': datetime.utcnow()}
+
+class ReportCache:
+    """Latest result of each report, tagged with Sweet.stock_version.
+
+    A report is served from memory while its version is current. After a
+    write it is recomputed on the next request, but no more often than
+    refresh_interval seconds, so a busy till cannot turn every dashboard
+    load into a full aggregation. One request recomputes a stale report;
+    the others keep getting the previous result until it is done.
+    """
+
+    def __init__(self, refresh_interval=2, clock=time.monotonic):
+        self.refresh_interval = refresh_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.clear()
+
+    def init_app(self, app):
+        self.refresh_interval = app.config['ANALYTICS_REFRESH_INTERVAL']
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            # key -> (version, computed_at, report)
+            self._reports = {}
+            # Reports being recomputed: a lock per key for threads, a set for tasks
+            self._refresh_locks = {}
+            self._refreshing = set()
+
+    def current(self, key, version):
+        """(report, refresh_needed) for what is stored under key"""
+        with self._lock:
+            entry = self._reports.get(key)
+        if entry is None:
+            return None, True
+        stored_version, computed_at, report = entry
+        if stored_version == version or self._clock() - computed_at < self.refresh_interval:
+            return report, False
+        return report, True
+
+    def store(self, key, version, report):
+        with self._lock:
+            self._reports[key] = (version, self._clock(), report)
+        return report
+
+    def get(self, key, version, compute):
+        report, refresh_needed = self.current(key, version)
+        if not refresh_needed:
+            return report
+        with self._lock:
+            lock = self._refresh_locks.setdefault(key, threading.Lock())
+        # With a previous result to fall back on, only one request waits on Mongo
+        if not lock.acquire(blocking=report is None):
+            return report
+        try:
+            report, refresh_needed = self.current(key, version)
+            if not refresh_needed:
+                return report
+            return self.store(key, version, compute())
+        finally:
+            lock.release()
+
+    async def get_async(self, key, version, compute):
+        report, refresh_needed = self.current(key, version)
+        if not refresh_needed:
+            return report
+        with self._lock:
+            if key in self._refreshing and report is not None:
+                return report
+            self._refreshing.add(key)
+        try:
+            return self.store(key, version, await compute())
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+reports = ReportCache()
+
+def stock_version(session, version):
+    """Report version: sales from stock counters do not bump the catalogue"""
+    return version, stock.units(mongo.db, session)
+
+def stock_value():
+    with Sweet.catalogue_snapshot() as (session, version):
+        def compute():
+            groups = list(Sweet.catalogue().aggregate(stock_value_pipeline(), session=session))
+            counters = mongo.db.stock_shards.aggregate(counters_pipeline(), session=session)
+            return stock_value_report(add_counters_to_groups(groups, counters))
+        return reports.get(('stock-value',), stock_version(session, version), compute)
+
+def low_stock(threshold, limit):
+    with Sweet.catalogue_snapshot() as (session, version):
+        def compute():
+            sweets = Sweet.catalogue()
+            documents = list(sweets.aggregate(low_stock_pipeline(threshold, limit), session=session))
+            counted = list(sweets.aggregate([*low_stock_match(threshold), {'$count': 'count'}], session=session))
+            return low_stock_report(threshold, documents, counted[0]['count'] if counted else 0)
+        return reports.get(('low-stock', threshold, limit), stock_version(session, version), compute)
+
+def price_range(sweets, session=None):
+    """(lowest, highest) price from the two ends of the price index"""
+    ends = []
+    for direction in (1, -1):
+        sweet = next(iter(sweets.find({}, {'price': 1}, session=session).sort('price', direction).limit(1)), None)
+        if sweet is None:
+            return None
+        ends.append(sweet['price'])
+    return tuple(ends)
+
+def price_histogram(buckets):
+    with Sweet.catalogue_snapshot() as (session, version):
+        def compute():
+            sweets = Sweet.catalogue()
+            prices = price_range(sweets, session)
+            if prices is None:
+                return price_histogram_report([], [])
+            boundaries = histogram_boundaries(*prices, buckets)
+            rows = list(sweets.aggregate(price_histogram_pipeline(boundaries), session=session))
+            counters = mongo.db.stock_shards.aggregate(counters_pipeline(), session=session)
+            return price_histogram_report(boundaries, add_counters_to_buckets(boundaries, rows, counters))
+        return reports.get(('price-histogram', buckets), stock_version(session, version), compute)
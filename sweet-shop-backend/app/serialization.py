@@ -0,0 +1,66 @@
+import json
+from datetime import datetime
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+def _default(obj):
+    """Types the fast encoders do not handle natively"""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+def dumps(obj):
+    """Serialize obj to compact JSON bytes, using orjson when available.
+
+    Naive datetimes come out exactly as datetime.isoformat() would write them,
+    so documents straight from PyMongo match Sweet.to_dict output.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, default=_default, separators=(',', ':')).encode('utf-8')
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, falling back to the stdlib.
+
+    Keeps Flask's own encoding of datetimes, dates and UUIDs so existing
+    responses do not change shape, and writes bytes straight into the
+    response without an intermediate str.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self._options())
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+    def _options(self):
+        # Flask's default encoding turns datetimes into HTTP dates
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if self._app.debug:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+def init_app(app):
+    """Install the JSON provider selected by JSON_PROVIDER"""
+    if app.config['JSON_PROVIDER'] == 'fast':
+        app.json = FastJSONProvider(app)
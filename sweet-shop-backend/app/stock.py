@@ -0,0 +1,257 @@
+import random
+from datetime import datetime
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from app.metrics import registry
+
+rebalances = registry.counter(
+    'stock_shard_rebalances_total', 'Sharded purchases that had to move stock between counters',
+    labels=('outcome',)
+)
+
+def split(quantity, shards):
+    """quantity spread over shards counters as evenly as whole units allow"""
+    share, extra = divmod(quantity, shards)
+    return [share + (1 if shard < extra else 0) for shard in range(shards)]
+
+def shard_query(sweet_id, shard, at_least=None):
+    query = {'sweet_id': sweet_id, 'shard': shard}
+    if at_least is not None:
+        query['quantity'] = {'$gte': at_least}
+    return query
+
+def take_update(limit, now=None):
+    """Pipeline update taking up to limit units, never going below zero.
+
+    With return_document=BEFORE, min(before, limit) is what was taken. Pass
+    now when taking from a sweet's pool, to move its version and updated_at.
+    """
+    fields = {'quantity': {'$max': [0, {'$subtract': ['$quantity', limit]}]}}
+    if now:
+        fields['version'] = {'$add': [{'$ifNull': ['$version', 0]}, 1]}
+        fields['updated_at'] = {'$literal': now}
+    return [{'$set': fields}]
+
+def sweet_update(fields=None, inc=None, unset=None):
+    """Update of a sweet document that, like every write to one, moves its
+    version and updated_at (see Sweet.catalogue_version)"""
+    update = {
+        '$set': {**(fields or {}), 'updated_at': datetime.utcnow()},
+        '$inc': {**(inc or {}), 'version': 1}
+    }
+    if unset:
+        update['$unset'] = unset
+    return update
+
+def pool_update(quantity):
+    """Add quantity to a sweet's pool"""
+    return sweet_update(inc={'quantity': quantity})
+
+def taken(before, limit):
+    return min(before['quantity'], limit) if before else 0
+
+def pool_query(sweet_id):
+    """The sweet while it is still sharded; stock only moves for sharded sweets"""
+    return {'_id': sweet_id, 'stock_shards': {'$exists': True}, 'quantity': {'$gt': 0}}
+
+def totals_pipeline(sweet_ids):
+    return [
+        {'$match': {'sweet_id': {'$in': list(sweet_ids)}}},
+        {'$group': {'_id': '$sweet_id', 'quantity': {'$sum': '$quantity'}}}
+    ]
+
+def units_pipeline():
+    return [{'$group': {'_id': None, 'quantity': {'$sum': '$quantity'}}}]
+
+# Fields that count the units in a sweet's counters
+STOCK_FIELDS = ('quantity', 'on_hand')
+
+def needs_total(sweet):
+    return bool(sweet.get('stock_shards')) and any(field in sweet for field in STOCK_FIELDS)
+
+def add_totals(sweets, totals, key='id'):
+    """Add shard totals to the pool quantity of each sharded sweet, in place"""
+    for sweet in sweets:
+        if needs_total(sweet):
+            for field in STOCK_FIELDS:
+                if field in sweet:
+                    sweet[field] += totals.get(str(sweet[key]), 0)
+    return sweets
+
+class StockShards:
+    """Sharded stock counters for sweets under flash-sale contention.
+
+    A hot sweet keeps part of its stock in its own quantity field (the
+    pool) and the rest in stock_shards, one document per counter. A
+    purchase takes from one counter picked at random, so concurrent
+    buyers write different documents instead of queueing on the sweet,
+    and it leaves the sweet document alone. On-hand stock is always the
+    pool plus every counter; moving units between them never changes it.
+
+    When the picked counter is short the purchase tries the others, then
+    rebalances: it takes up to refill units from the pool (a restock lands
+    there) or drains other counters, keeps what it needs and spreads the
+    rest back. Units in flight during a move are briefly invisible to
+    other buyers, so one can be refused near sell-out, never oversold.
+
+    Workers learn that a sweet is sharded the first time a plain purchase
+    misses; hints are only an optimisation and are dropped when stale.
+    """
+
+    def __init__(self, refill=100, max_shards=64):
+        self.refill = refill
+        self.max_shards = max_shards
+        # sweet id -> number of counters, as last seen by this worker
+        self._hints = {}
+
+    def init_app(self, app):
+        self.refill = app.config['STOCK_SHARD_REFILL']
+        self.max_shards = app.config['STOCK_MAX_SHARDS']
+        self._hints = {}
+
+    def hint(self, sweet_id):
+        return self._hints.get(sweet_id)
+
+    def remember(self, sweet_id, shards):
+        if shards:
+            self._hints[sweet_id] = shards
+        else:
+            self._hints.pop(sweet_id, None)
+
+    # Synchronous operations, taking the PyMongo database. app.asgi.stock
+    # has the Motor versions.
+
+    def totals(self, db, sweet_ids, session=None):
+        """{str(sweet id): units held in counters} for the given sweets"""
+        if not sweet_ids:
+            return {}
+        rows = db.stock_shards.aggregate(totals_pipeline(sweet_ids), session=session)
+        return {str(row['_id']): row['quantity'] for row in rows}
+
+    def units(self, db, session=None):
+        """Units held in every counter together.
+
+        Sales from counters leave the sweet document alone. Within one
+        catalogue version the counters only ever go down, since whatever
+        moves units into them also writes the sweet, so (catalogue version,
+        units) changes with every sale.
+        """
+        rows = list(db.stock_shards.aggregate(units_pipeline(), session=session))
+        return rows[0]['quantity'] if rows else 0
+
+    def with_totals(self, db, sweets, key='id', session=None):
+        """Sweets with on-hand quantities; costs a query only if one is sharded"""
+        sharded = [sweet[key] for sweet in sweets if needs_total(sweet)]
+        if not sharded:
+            return sweets
+        ids = [sweet_id if key == '_id' else ObjectId(sweet_id) for sweet_id in sharded]
+        return add_totals(sweets, self.totals(db, ids, session), key)
+
+    def enable(self, db, sweet_id, shards):
+        """Split a sweet's stock over shards counters; returns the sweet or None"""
+        sweet = db.sweets.find_one_and_update(
+            {'_id': sweet_id},
+            sweet_update({'stock_shards': shards}),
+            return_document=ReturnDocument.BEFORE
+        )
+        if not sweet:
+            return None
+        # Fewer counters than before: fold the surplus ones into the pool
+        self._fold(db, sweet_id, {'sweet_id': sweet_id, 'shard': {'$gte': shards}})
+        before = db.sweets.find_one_and_update(
+            {'_id': sweet_id}, sweet_update({'quantity': 0}),
+            return_document=ReturnDocument.BEFORE
+        )
+        db.stock_shards.bulk_write([
+            UpdateOne(shard_query(sweet_id, shard), {'$inc': {'quantity': amount}}, upsert=True)
+            for shard, amount in enumerate(split(before['quantity'] if before else 0, shards))
+        ], ordered=False)
+        self.remember(sweet_id, shards)
+        return sweet
+
+    def disable(self, db, sweet_id):
+        """Fold every counter back into the sweet's own quantity"""
+        sweet = db.sweets.find_one_and_update(
+            {'_id': sweet_id},
+            sweet_update(unset={'stock_shards': ''})
+        )
+        self.remember(sweet_id, None)
+        if not sweet:
+            return None
+        self._fold(db, sweet_id, {'sweet_id': sweet_id})
+        return sweet
+
+    def _fold(self, db, sweet_id, query):
+        """Delete the matching counters, adding their units to the pool"""
+        moved = 0
+        for counter in db.stock_shards.find(query, {'_id': 1}):
+            deleted = db.stock_shards.find_one_and_delete({'_id': counter['_id']})
+            moved += deleted['quantity'] if deleted else 0
+        if moved:
+            db.sweets.update_one({'_id': sweet_id}, pool_update(moved))
+        return moved
+
+    def purchase(self, db, sweet_id, shards, quantity):
+        """Take quantity from the counters: (purchased, pool_changed)"""
+        order = random.sample(range(shards), shards)
+        for shard in order:
+            result = db.stock_shards.update_one(
+                shard_query(sweet_id, shard, at_least=quantity), {'$inc': {'quantity': -quantity}}
+            )
+            if result.modified_count:
+                return True, False
+        return self._rebalance(db, sweet_id, order, quantity)
+
+    def _rebalance(self, db, sweet_id, order, quantity):
+        limit = max(quantity, self.refill)
+        before = db.sweets.find_one_and_update(
+            pool_query(sweet_id), take_update(limit, datetime.utcnow()), return_document=ReturnDocument.BEFORE
+        )
+        gathered = from_pool = taken(before, limit)
+        for shard in order:
+            if gathered >= quantity:
+                break
+            need = quantity - gathered
+            before = db.stock_shards.find_one_and_update(
+                {**shard_query(sweet_id, shard), 'quantity': {'$gt': 0}},
+                take_update(need), return_document=ReturnDocument.BEFORE
+            )
+            gathered += taken(before, need)
+
+        if gathered < quantity:
+            # Not enough anywhere: put it all back where it is still counted
+            self._return_to_pool(db, sweet_id, gathered)
+            rebalances.inc('sold_out')
+            return False, bool(from_pool or gathered)
+
+        leftover = 0
+        for shard, amount in zip(order, split(gathered - quantity, len(order))):
+            if amount and not db.stock_shards.update_one(
+                shard_query(sweet_id, shard), {'$inc': {'quantity': amount}}
+            ).matched_count:
+                # The counter was folded away meanwhile
+                leftover += amount
+        self._return_to_pool(db, sweet_id, leftover)
+        rebalances.inc('refilled')
+        return True, bool(from_pool or leftover)
+
+    def _return_to_pool(self, db, sweet_id, quantity):
+        if quantity:
+            db.sweets.update_one({'_id': sweet_id}, pool_update(quantity))
+
+    def gather(self, db, sweet_id, quantity):
+        """Move up to quantity units from the counters into the pool"""
+        gathered = 0
+        for counter in db.stock_shards.find({'sweet_id': sweet_id, 'quantity': {'$gt': 0}}, {'_id': 1}):
+            if gathered >= quantity:
+                break
+            need = quantity - gathered
+            before = db.stock_shards.find_one_and_update(
+                {'_id': counter['_id'], 'quantity': {'$gt': 0}}, take_update(need),
+                return_document=ReturnDocument.BEFORE
+            )
+            gathered += taken(before, need)
+        self._return_to_pool(db, sweet_id, gathered)
+        return gathered
+
+stock = StockShards()
@@ -1,104 +1,238 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt
+import io
+import csv
+import logging
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
+from flask_jwt_extended import get_jwt_identity
 from app.models import Sweet
+from app import bulk
+from app.bulk import NDJSON_MIMETYPE
+from app.ledger import ledger
+from app.tokens import admin_required
+from app.http_cache import conditional
+from app.serialization import dumps
+from app.validation import (
+    ValidationError, parse_fields, parse_if_match, parse_new_sweet, parse_page_size,
+    parse_price_change, parse_search, parse_sweet_changes
+)
 
 sweets_bp = Blueprint('sweets', __name__)
+logger = logging.getLogger(__name__)
 
-def check_admin():
-    """Check if current user is admin"""
-    claims = get_jwt()
-    return claims.get('role') == 'admin'
+def sweet_version(sweet_id):
+    """ETag source for a single sweet, None when it does not exist"""
+    sweet = Sweet.find_by_id(sweet_id)
+    if not sweet:
+        return None
+    # quantity includes stock counters, whose sales leave the sweet untouched
+    return f"{sweet['id']}:{sweet.get('version', 0)}:{sweet.get('updated_at')}:{sweet['quantity']}"
+
+def version_conflict(sweet):
+    """409 for a conditional write whose If-Match version is stale.
+    
+    The current sweet is included so the client can redo its change
+    against it without another read; the server never retries.
+    """
+    return jsonify({
+        'error': 'Sweet was changed by someone else, reload and try again',
+        'sweet': Sweet.to_dict(sweet)
+    }), 409
+
+def wants_stream(args, accept_mimetypes):
+    """Return 'ndjson', 'json' or None depending on the requested export mode"""
+    stream = args.get('stream', '').lower()
+    if stream == 'json':
+        return 'json'
+    if stream in ('1', 'true', 'ndjson'):
+        return 'ndjson'
+    best = accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE])
+    if best == NDJSON_MIMETYPE:
+        return 'ndjson'
+    return None
+
+def stream_sweets(mode, fields):
+    """Stream the catalogue one record at a time so memory stays flat.
+    
+    Once the first chunk is sent the status code is fixed, so errors part way
+    through simply end the stream.
+    """
+    sweets = Sweet.iter_all(current_app.config['SWEETS_STREAM_BATCH_SIZE'], fields)
+    
+    def generate_ndjson():
+        for sweet in sweets:
+            yield dumps(Sweet.to_dict(sweet, fields)) + b'\n'
+    
+    def generate_json():
+        yield b'{"message":"Sweets retrieved successfully","sweets":['
+        separator = b''
+        for sweet in sweets:
+            yield separator + dumps(Sweet.to_dict(sweet, fields))
+            separator = b','
+        yield b']}'
+    
+    if mode == 'json':
+        return Response(stream_with_context(generate_json()), mimetype='application/json')
+    return Response(stream_with_context(generate_ndjson()), mimetype=NDJSON_MIMETYPE)
 
 @sweets_bp.route('', methods=['POST'])
-@jwt_required()
+@admin_required()
 def create_sweet():
     try:
-        # Check if user is admin
-        if not check_admin():
-            return jsonify({'error': 'Admin access required'}), 403
-        
-        data = request.get_json()
-        
-        # Validate input
-        required_fields = ['name', 'category', 'price']
-        for field in required_fields:
-            if not data.get(field):
-                return jsonify({'error': f'Missing required field: {field}'}), 400
-        
-        name = data['name'].strip()
-        category = data['category'].strip()
-        
         try:
-            price = float(data['price'])
-            if price <= 0:
-                return jsonify({'error': 'Price must be greater than 0'}), 400
-        except (ValueError, TypeError):
-            return jsonify({'error': 'Invalid price value'}), 400
-        
-        quantity = int(data.get('quantity', 0))
-        if quantity < 0:
-            return jsonify({'error': 'Quantity cannot be negative'}), 400
+            fields = parse_new_sweet(request.get_json())
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Create new sweet
-        sweet = Sweet.create(
-            name=name,
-            category=category,
-            price=price,
-            quantity=quantity
-        )
+        sweet = Sweet.create(**fields)
         
         if not sweet:
             return jsonify({'error': 'Sweet with this name already exists'}), 400
         
+        ledger.record(sweet['id'], sweet['quantity'], get_jwt_identity(), 'create')
         return jsonify({
             'message': 'Sweet added successfully',
             'sweet': Sweet.to_dict(sweet)
         }), 201
         
-    except Exception as e:
-        print(f"Create sweet error: {e}")
+    except Exception:
+        logger.exception('Create sweet failed')
         return jsonify({'error': 'Internal server error'}), 500
 
-@sweets_bp.route('', methods=['GET'])
-def get_all_sweets():
+@sweets_bp.route('/bulk', methods=['POST'])
+@admin_required()
+def bulk_upsert_sweets():
+    """Create or update many sweets by name from a JSON array, CSV or NDJSON.
+    
+    CSV and NDJSON bodies are read and written a batch at a time, so large
+    uploads never sit in memory whole. Rows are checked like create_sweet;
+    the response lists the ones that were rejected by row number.
+    """
     try:
-        sweets = Sweet.get_all()
+        if request.mimetype not in bulk.MIMETYPES:
+            return jsonify({'error': f'Content-Type must be one of: {", ".join(bulk.MIMETYPES)}'}), 415
+        
+        if request.mimetype == bulk.JSON_MIMETYPE:
+            try:
+                rows = bulk.json_records(request.get_json(silent=True))
+            except ValidationError as e:
+                return jsonify({'error': str(e)}), 400
+        else:
+            lines = io.TextIOWrapper(request.stream, encoding='utf-8-sig', newline='')
+            rows = bulk.records(request.mimetype, lines)
+        
+        report = bulk.ImportReport(current_app.config['SWEETS_BULK_MAX_ERRORS'])
+        try:
+            for batch in bulk.validated_batches(rows, current_app.config['SWEETS_BULK_BATCH_SIZE'], report):
+                report.add_batch(batch, Sweet.upsert_many([fields for _, fields in batch]))
+        except UnicodeDecodeError:
+            return jsonify({'error': 'Upload must be UTF-8 encoded', **report.to_dict()}), 400
+        except csv.Error as e:
+            return jsonify({'error': f'Invalid CSV: {e}', **report.to_dict()}), 400
+        finally:
+            for sweet_id, quantity in report.created:
+                ledger.record(sweet_id, quantity, get_jwt_identity(), 'import')
+            for sweet_id, change in report.adjusted:
+                ledger.record(sweet_id, change, get_jwt_identity(), 'import')
+        
+        return jsonify({'message': 'Bulk import finished', **report.to_dict()}), 200
+        
+    except Exception:
+        logger.exception('Bulk import failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@sweets_bp.route('/bulk/price', methods=['POST'])
+@admin_required()
+def bulk_price_change():
+    """Raise or cut prices by percent or amount for a category or search filter"""
+    try:
+        try:
+            filters, percent, amount = parse_price_change(
+                request.get_json(), Sweet.SEARCH_MODES, current_app.config['SEARCH_MAX_TERM_LENGTH']
+            )
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        matched, updated, skipped = Sweet.reprice(Sweet.search_query(**filters), percent, amount)
+        
         return jsonify({
-            'message': 'Sweets retrieved successfully',
-            'sweets': [Sweet.to_dict(sweet) for sweet in sweets]
+            'message': 'Prices updated',
+            'matched': matched,
+            'updated': updated,
+            'skipped': skipped
         }), 200
-    except Exception as e:
-        print(f"Get sweets error: {e}")
+        
+    except Exception:
+        logger.exception('Bulk price change failed')
         return jsonify({'error': 'Internal server error'}), 500
 
-@sweets_bp.route('/search', methods=['GET'])
-def search_sweets():
+@sweets_bp.route('', methods=['GET'])
+@conditional(lambda: Sweet.stock_version())
+def get_all_sweets():
     try:
-        name = request.args.get('name', '').strip()
-        category = request.args.get('category', '').strip()
-        min_price = request.args.get('min_price')
-        max_price = request.args.get('max_price')
+        try:
+            fields = parse_fields(request.args.get('fields'), Sweet.FIELDS)
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Convert price parameters
-        min_price_val = float(min_price) if min_price else None
-        max_price_val = float(max_price) if max_price else None
+        mode = wants_stream(request.args, request.accept_mimetypes)
+        if mode:
+            return stream_sweets(mode, fields)
         
-        if min_price_val is not None and min_price_val < 0:
-            return jsonify({'error': 'Minimum price cannot be negative'}), 400
+        # Old clients that send neither limit nor after get the full list,
+        # spliced from the pre-encoded catalogue array
+        if 'limit' not in request.args and 'after' not in request.args:
+            body = b''.join([
+                b'{"message":"Sweets retrieved successfully","sweets":',
+                Sweet.get_all_json(fields),
+                b'}\n'
+            ])
+            return Response(body, mimetype='application/json'), 200
         
-        if max_price_val is not None and max_price_val < 0:
-            return jsonify({'error': 'Maximum price cannot be negative'}), 400
+        try:
+            limit = parse_page_size(
+                request.args.get('limit'),
+                current_app.config['SWEETS_DEFAULT_PAGE_SIZE'],
+                current_app.config['SWEETS_MAX_PAGE_SIZE']
+            )
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
         
-        if min_price_val is not None and max_price_val is not None:
-            if min_price_val > max_price_val:
-                return jsonify({'error': 'Minimum price cannot be greater than maximum price'}), 400
+        with_total = request.args.get('count', 'true').lower() not in ('0', 'false', 'no')
         
-        sweets = Sweet.search(
-            name=name if name else None,
-            category=category if category else None,
-            min_price=min_price_val,
-            max_price=max_price_val
-        )
+        try:
+            sweets, next_cursor, total = Sweet.get_page(
+                limit,
+                after=request.args.get('after'),
+                fields=fields,
+                with_total=with_total
+            )
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        
+        response_data = {
+            'message': 'Sweets retrieved successfully',
+            'sweets': [Sweet.to_dict(sweet, fields) for sweet in sweets],
+            'next_cursor': next_cursor
+        }
+        if with_total:
+            response_data['total'] = total
+        return jsonify(response_data), 200
+    except Exception:
+        logger.exception('Get sweets failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@sweets_bp.route('/search', methods=['GET'])
+@conditional(lambda: Sweet.stock_version())
+def search_sweets():
+    try:
+        try:
+            params = parse_search(
+                request.args, Sweet.SEARCH_MODES, current_app.config['SEARCH_MAX_TERM_LENGTH']
+            )
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        sweets = Sweet.search(**params)
         
         return jsonify({
             'message': 'Search results',
@@ -106,64 +240,70 @@ def search_sweets():
             'count': len(sweets)
         }), 200
         
-    except ValueError:
-        return jsonify({'error': 'Invalid price value'}), 400
-    except Exception as e:
-        print(f"Search sweets error: {e}")
+    except Exception:
+        logger.exception('Search sweets failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+@sweets_bp.route('/<sweet_id>', methods=['GET'])
+@conditional(sweet_version)
+def get_sweet(sweet_id):
+    try:
+        sweet = Sweet.find_by_id(sweet_id)
+        if not sweet:
+            return jsonify({'error': 'Sweet not found'}), 404
+        
+        return jsonify({
+            'message': 'Sweet retrieved successfully',
+            'sweet': Sweet.to_dict(sweet)
+        }), 200
+    except Exception:
+        logger.exception('Get sweet failed')
         return jsonify({'error': 'Internal server error'}), 500
 
 @sweets_bp.route('/<sweet_id>', methods=['PUT'])
-@jwt_required()
+@admin_required()
 def update_sweet(sweet_id):
     try:
-        # Check if user is admin
-        if not check_admin():
-            return jsonify({'error': 'Admin access required'}), 403
-        
-        sweet = Sweet.find_by_id(sweet_id)
+        sweet = Sweet.find_by_id(sweet_id, cached=False)
         if not sweet:
             return jsonify({'error': 'Sweet not found'}), 404
         
-        data = request.get_json()
-        update_data = {}
+        try:
+            update_data = parse_sweet_changes(request.get_json())
+            version = parse_if_match(request.headers.get('If-Match'))
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Update fields if provided
-        if 'name' in data and data['name']:
-            new_name = data['name'].strip()
-            if new_name != sweet['name']:
-                # Check if new name already exists
-                existing = Sweet.search(name=new_name)
-                if existing and any(s['id'] != sweet_id for s in existing):
-                    return jsonify({'error': 'Sweet with this name already exists'}), 400
-                update_data['name'] = new_name
+        # A stale If-Match is refused before anything else is looked at
+        if version is not None and version != sweet.get('version', 0):
+            return version_conflict(sweet)
         
-        if 'category' in data and data['category']:
-            update_data['category'] = data['category'].strip()
+        if 'quantity' in update_data and sweet.get('stock_shards'):
+            return jsonify({'error': 'Stock of a sharded sweet can only be changed by restocking'}), 400
         
-        if 'price' in data:
-            try:
-                price = float(data['price'])
-                if price <= 0:
-                    return jsonify({'error': 'Price must be greater than 0'}), 400
-                update_data['price'] = price
-            except (ValueError, TypeError):
-                return jsonify({'error': 'Invalid price value'}), 400
-        
-        if 'quantity' in data:
-            try:
-                quantity = int(data['quantity'])
-                if quantity < 0:
-                    return jsonify({'error': 'Quantity cannot be negative'}), 400
-                update_data['quantity'] = quantity
-            except (ValueError, TypeError):
-                return jsonify({'error': 'Invalid quantity value'}), 400
+        new_name = update_data.get('name')
+        if new_name == sweet['name']:
+            del update_data['name']
+        elif new_name:
+            # Check if new name already exists
+            existing = Sweet.find_by_name(new_name)
+            if existing and existing['id'] != sweet_id:
+                return jsonify({'error': 'Sweet with this name already exists'}), 400
         
         # Only update if there are changes
         if update_data:
-            updated_sweet = Sweet.update(sweet_id, update_data)
+            try:
+                updated_sweet = Sweet.update(sweet_id, update_data, version)
+            except ValidationError as e:
+                return jsonify({'error': str(e)}), 400
             if not updated_sweet:
-                return jsonify({'error': 'Failed to update sweet'}), 400
+                current = Sweet.find_by_id(sweet_id, cached=False)
+                if not current:
+                    return jsonify({'error': 'Sweet not found'}), 404
+                return version_conflict(current)
             
+            if 'quantity' in update_data:
+                ledger.record(sweet_id, updated_sweet['adjustment'], get_jwt_identity(), 'adjustment')
             return jsonify({
                 'message': 'Sweet updated successfully',
                 'sweet': Sweet.to_dict(updated_sweet)
@@ -174,19 +314,15 @@ def update_sweet(sweet_id):
             'sweet': Sweet.to_dict(sweet)
         }), 200
         
-    except Exception as e:
-        print(f"Update sweet error: {e}")
+    except Exception:
+        logger.exception('Update sweet failed')
         return jsonify({'error': 'Internal server error'}), 500
 
 @sweets_bp.route('/<sweet_id>', methods=['DELETE'])
-@jwt_required()
+@admin_required()
 def delete_sweet(sweet_id):
     try:
-        # Check if user is admin
-        if not check_admin():
-            return jsonify({'error': 'Admin access required'}), 403
-        
-        sweet = Sweet.find_by_id(sweet_id)
+        sweet = Sweet.find_by_id(sweet_id, cached=False)
         if not sweet:
             return jsonify({'error': 'Sweet not found'}), 404
         
@@ -198,6 +334,6 @@ def delete_sweet(sweet_id):
         
         return jsonify({'message': 'Sweet deleted successfully'}), 200
         
-    except Exception as e:
-        print(f"Delete sweet error: {e}")
+    except Exception:
+        logger.exception('Delete sweet failed')
         return jsonify({'error': 'Internal server error'}), 500
\ No newline at end of file
@@ -0,0 +1,174 @@
+import time
+import hashlib
+import logging
+import threading
+from functools import wraps
+from datetime import datetime, timedelta
+from flask import jsonify
+from flask_jwt_extended import JWTManager, jwt_required, get_jwt
+from pymongo.errors import PyMongoError
+from app.cache import NullCache, TTLCache
+from app.models import mongo
+
+logger = logging.getLogger(__name__)
+
+def token_key(encoded_token):
+    """Cache key for a token: its digest, so raw bearer tokens are not kept"""
+    return ('token', hashlib.sha256(encoded_token.encode('utf-8')).digest())
+
+def create_token_cache(config):
+    """Build the verified-token cache described by the app config"""
+    if not config['JWT_VERIFY_CACHE_ENABLED']:
+        return NullCache()
+    return TTLCache(
+        maxsize=config['JWT_VERIFY_CACHE_MAXSIZE'],
+        ttl=config['JWT_VERIFY_CACHE_TTL']
+    )
+
+def remember(cache, encoded_token, claims):
+    """Cache verified claims until the token expires (or the cache TTL, if sooner)"""
+    ttl = cache.ttl if isinstance(cache, TTLCache) else None
+    if 'exp' in claims:
+        remaining = claims['exp'] - time.time()
+        if remaining <= 0:
+            return
+        ttl = min(ttl, remaining) if ttl is not None else remaining
+    cache.set(token_key(encoded_token), claims, ttl)
+
+class Blocklist:
+    """Revoked token ids (jti), mirrored from the revoked_tokens collection.
+
+    Checking a token is a dict lookup. The copy is refreshed at most every
+    refresh_interval seconds with the revocations recorded since the last
+    refresh, so revocations made by other workers apply within the interval
+    and those made by this process apply at once. Entries are dropped once
+    their token has expired anyway; a TTL index does the same in Mongo.
+    """
+
+    # Re-read revocations this far back so writes that commit late are not missed
+    OVERLAP = timedelta(seconds=60)
+
+    def __init__(self, refresh_interval=5, clock=time.monotonic):
+        self.refresh_interval = refresh_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.clear()
+
+    def init_app(self, app):
+        self.refresh_interval = app.config['JWT_BLOCKLIST_REFRESH']
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._revoked = {}
+            self._refreshed_at = None
+            self._since = None
+
+    def refresh_due(self):
+        """True for exactly one caller per refresh interval"""
+        now = self._clock()
+        with self._lock:
+            if self._refreshed_at is not None and now - self._refreshed_at < self.refresh_interval:
+                return False
+            self._refreshed_at = now
+            return True
+
+    def query(self):
+        """Filter selecting revocations the local copy may not have yet"""
+        with self._lock:
+            if self._since is None:
+                return {}
+            return {'revoked_at': {'$gte': self._since - self.OVERLAP}}
+
+    def merge(self, documents):
+        now = datetime.utcnow()
+        with self._lock:
+            for document in documents:
+                self._revoked[document['_id']] = document.get('expires_at')
+                if self._since is None or document['revoked_at'] > self._since:
+                    self._since = document['revoked_at']
+            expired = [jti for jti, expires_at in self._revoked.items()
+                       if expires_at is not None and expires_at <= now]
+            for jti in expired:
+                del self._revoked[jti]
+
+    def add(self, document):
+        with self._lock:
+            self._revoked[document['_id']] = document.get('expires_at')
+
+    def __contains__(self, jti):
+        with self._lock:
+            return jti in self._revoked
+
+    def __len__(self):
+        with self._lock:
+            return len(self._revoked)
+
+    @staticmethod
+    def document(claims):
+        """revoked_tokens document for a token's claims"""
+        expires_at = datetime.utcfromtimestamp(claims['exp']) if 'exp' in claims else None
+        return {
+            '_id': claims['jti'],
+            'user_id': claims.get('sub'),
+            'revoked_at': datetime.utcnow(),
+            'expires_at': expires_at
+        }
+
+blocklist = Blocklist()
+
+def is_revoked(jti):
+    if blocklist.refresh_due():
+        try:
+            blocklist.merge(mongo.db.revoked_tokens.find(blocklist.query()))
+        except PyMongoError:
+            # Keep serving from the last copy; the next interval retries
+            logger.warning('Token blocklist refresh failed', exc_info=True)
+    return jti in blocklist
+
+def revoke(claims):
+    """Revoke a token for every worker, effective in this one immediately"""
+    document = Blocklist.document(claims)
+    mongo.db.revoked_tokens.replace_one({'_id': document['_id']}, document, upsert=True)
+    blocklist.add(document)
+
+class TokenManager(JWTManager):
+    """JWTManager that remembers verified tokens until they expire.
+
+    A cache hit skips signature verification and claim validation. The
+    blocklist is still consulted on every request, so a revoked token is
+    refused even while its claims are cached.
+    """
+
+    def __init__(self, app=None, add_context_processor=False):
+        self.verified = NullCache()
+        super().__init__(app, add_context_processor)
+
+    def init_app(self, app, add_context_processor=False):
+        super().init_app(app, add_context_processor)
+        self.verified = create_token_cache(app.config)
+        blocklist.init_app(app)
+        self.token_in_blocklist_loader(lambda header, claims: is_revoked(claims['jti']))
+
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        if csrf_value is not None or allow_expired:
+            return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+
+        claims = self.verified.get(token_key(encoded_token))
+        if claims is None:
+            claims = super()._decode_jwt_from_config(encoded_token)
+            remember(self.verified, encoded_token, claims)
+        # Callers may add to the claims they get back
+        return dict(claims)
+
+def admin_required():
+    """jwt_required for admin-only views; other roles get a 403"""
+    def decorator(view):
+        @wraps(view)
+        @jwt_required()
+        def wrapper(*args, **kwargs):
+            if get_jwt().get('role') != 'admin':
+                return jsonify({'error': 'Admin access required'}), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
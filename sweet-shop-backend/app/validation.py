@@ -0,0 +1,273 @@
+import re
+
+class ValidationError(Exception):
+    """Request input that should be answered with a 400.
+
+    reason and details are for logging only; the message is what the
+    client sees.
+    """
+
+    def __init__(self, message, reason=None, **details):
+        super().__init__(message)
+        self.reason = reason
+        self.details = details
+
+def validate_email(email):
+    """Simple email validation"""
+    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+    return re.match(pattern, email) is not None
+
+def parse_registration(data):
+    """Return the cleaned name, email, password and role of a sign-up"""
+    if not data:
+        raise ValidationError('No data provided', reason='no data')
+
+    missing_fields = [field for field in ('name', 'email', 'password') if not data.get(field)]
+    if missing_fields:
+        raise ValidationError(f'Missing required fields: {", ".join(missing_fields)}',
+                              reason='missing fields', fields=missing_fields)
+
+    user = {
+        'name': data['name'].strip(),
+        'email': data['email'].strip().lower(),
+        'password': data['password'].strip(),
+        # Role defaults to 'customer'
+        'role': data.get('role', 'customer').strip().lower()
+    }
+
+    if user['role'] not in ['admin', 'customer']:
+        raise ValidationError('Role must be either "admin" or "customer"',
+                              reason='invalid role', role=user['role'])
+
+    if not validate_email(user['email']):
+        raise ValidationError('Invalid email format', reason='invalid email')
+
+    if len(user['password']) < 6:
+        raise ValidationError('Password must be at least 6 characters', reason='password too short')
+
+    return user
+
+def parse_login(data):
+    """Return (email, password) from a login body"""
+    if not data:
+        raise ValidationError('No data provided')
+
+    email = data.get('email', '').strip().lower()
+    password = data.get('password', '').strip()
+    if not email or not password:
+        raise ValidationError('Missing email or password')
+    return email, password
+
+def parse_price(value):
+    try:
+        price = float(value)
+    except (ValueError, TypeError):
+        raise ValidationError('Invalid price value')
+    if price <= 0:
+        raise ValidationError('Price must be greater than 0')
+    return price
+
+def parse_stock(value):
+    """Stock level for a create or update, zero allowed"""
+    try:
+        quantity = int(value)
+    except (ValueError, TypeError):
+        raise ValidationError('Invalid quantity value')
+    if quantity < 0:
+        raise ValidationError('Quantity cannot be negative')
+    return quantity
+
+def parse_new_sweet(data):
+    """Return the cleaned name, category, price and quantity of a new sweet"""
+    data = data or {}
+    if not isinstance(data, dict):
+        raise ValidationError('No data provided')
+    for field in ('name', 'category', 'price'):
+        if not data.get(field):
+            raise ValidationError(f'Missing required field: {field}')
+    for field in ('name', 'category'):
+        if not isinstance(data[field], str) or not data[field].strip():
+            raise ValidationError(f'Invalid {field} value')
+
+    return {
+        'name': data['name'].strip(),
+        'category': data['category'].strip(),
+        'price': parse_price(data['price']),
+        'quantity': parse_stock(data.get('quantity', 0))
+    }
+
+def parse_sweet_changes(data):
+    """Return the fields an update body sets, without comparing to the stored sweet"""
+    data = data or {}
+    if not isinstance(data, dict):
+        raise ValidationError('No data provided')
+    changes = {}
+    for field in ('name', 'category'):
+        if data.get(field):
+            if not isinstance(data[field], str) or not data[field].strip():
+                raise ValidationError(f'Invalid {field} value')
+            changes[field] = data[field].strip()
+    if 'price' in data:
+        changes['price'] = parse_price(data['price'])
+    if 'quantity' in data:
+        changes['quantity'] = parse_stock(data['quantity'])
+    return changes
+
+def parse_quantity(data, default):
+    """Positive quantity for a purchase or restock"""
+    try:
+        quantity = int((data or {}).get('quantity', default))
+    except (ValueError, TypeError):
+        raise ValidationError('Invalid quantity value')
+    if quantity <= 0:
+        raise ValidationError('Quantity must be greater than 0')
+    return quantity
+
+def parse_if_match(value):
+    """Sweet version from an If-Match header, None when absent or "*".
+
+    The entity tag is the version number from to_dict, quoted or bare.
+    Weak tags never match, as If-Match requires a strong comparison.
+    """
+    if value is None or value.strip() == '*':
+        return None
+    tag = value.strip()
+    if tag.startswith('"') and tag.endswith('"') and len(tag) > 1:
+        tag = tag[1:-1]
+    if not (tag.isascii() and tag.isdigit()):
+        raise ValidationError('Invalid If-Match header, expected the sweet version',
+                              reason='invalid if-match', value=value)
+    return int(tag)
+
+def parse_shards(data, default, maximum):
+    """Number of stock counters for a sweet, between 2 and maximum"""
+    try:
+        shards = int((data or {}).get('shards', default))
+    except (ValueError, TypeError):
+        raise ValidationError('Invalid shards value')
+    if not 2 <= shards <= maximum:
+        raise ValidationError(f'Shards must be between 2 and {maximum}')
+    return shards
+
+def parse_checkout(data, is_valid_id, action='Checkout'):
+    """Return [(sweet_id, quantity), ...] from a checkout (or restock) body.
+
+    Accepts either a bare list of lines or {"items": [...]}.
+    """
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        raise ValidationError(f'{action} requires a non-empty list of items')
+
+    lines = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not is_valid_id(item.get('sweet_id')):
+            raise ValidationError(f'Invalid sweet_id in item {index}')
+        try:
+            quantity = int(item.get('quantity', 1))
+        except (ValueError, TypeError):
+            raise ValidationError(f'Invalid quantity value in item {index}')
+        if quantity <= 0:
+            raise ValidationError(f'Quantity must be greater than 0 in item {index}')
+        lines.append((item['sweet_id'], quantity))
+    return lines
+
+def parse_fields(value, allowed):
+    """Field list from a comma separated fields= argument, None if absent"""
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValidationError(f'Unknown fields: {", ".join(unknown)}')
+    return fields
+
+def parse_page_size(value, default, maximum):
+    try:
+        limit = int(value if value is not None else default)
+    except ValueError:
+        raise ValidationError('Invalid limit value')
+    if limit <= 0:
+        raise ValidationError('Limit must be greater than 0')
+    return min(limit, maximum)
+
+def parse_positive_int(value, default, name, maximum=None):
+    """Positive integer query argument, capped at maximum when one is given"""
+    try:
+        number = int(value if value is not None else default)
+    except ValueError:
+        raise ValidationError(f'Invalid {name} value')
+    if number <= 0:
+        raise ValidationError(f'{name.capitalize()} must be greater than 0')
+    return min(number, maximum) if maximum is not None else number
+
+def parse_price_change(data, modes, max_term_length):
+    """Return (filters, percent, amount) for a bulk price change.
+
+    Exactly one of percent or amount is set. filters are Sweet.search
+    keyword arguments; at least one is required unless "all" is true, so
+    a forgotten filter cannot reprice the whole catalogue.
+    """
+    if not isinstance(data, dict):
+        raise ValidationError('No data provided')
+
+    changes = [field for field in ('percent', 'amount') if data.get(field) is not None]
+    if len(changes) != 1:
+        raise ValidationError('Provide either percent or amount')
+    field = changes[0]
+    try:
+        value = float(data[field])
+    except (ValueError, TypeError):
+        raise ValidationError(f'Invalid {field} value')
+    if value == 0:
+        raise ValidationError('Price change cannot be zero')
+    if field == 'percent' and value <= -100:
+        raise ValidationError('Percent must be greater than -100')
+
+    for text_field in ('name', 'category', 'mode'):
+        if text_field in data and not isinstance(data[text_field], str):
+            raise ValidationError(f'Invalid {text_field} value')
+    filters = parse_search(data, modes, max_term_length)
+    filtered = filters['name'] or filters['category'] or any(
+        filters[bound] is not None for bound in ('min_price', 'max_price')
+    )
+    if not filtered and data.get('all') is not True:
+        raise ValidationError('Specify a category or filter, or "all": true')
+
+    percent = value if field == 'percent' else None
+    amount = value if field == 'amount' else None
+    return filters, percent, amount
+
+def parse_search(args, modes, max_term_length):
+    """Return Sweet.search keyword arguments from the query string"""
+    name = args.get('name', '').strip()
+    category = args.get('category', '').strip()
+    mode = args.get('mode', 'auto').strip().lower()
+
+    if mode not in modes:
+        raise ValidationError(f'Mode must be one of: {", ".join(modes)}')
+
+    if len(name) > max_term_length:
+        raise ValidationError('Search term is too long')
+
+    try:
+        min_price = float(args['min_price']) if args.get('min_price') else None
+        max_price = float(args['max_price']) if args.get('max_price') else None
+    except ValueError:
+        raise ValidationError('Invalid price value')
+
+    if min_price is not None and min_price < 0:
+        raise ValidationError('Minimum price cannot be negative')
+
+    if max_price is not None and max_price < 0:
+        raise ValidationError('Maximum price cannot be negative')
+
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise ValidationError('Minimum price cannot be greater than maximum price')
+
+    return {
+        'name': name or None,
+        'category': category or None,
+        'min_price': min_price,
+        'max_price': max_price,
+        'mode': mode
+    }
@@ -0,0 +1,5 @@
+from app.asgi import create_asgi_app
+import os
+
+# Serve with an ASGI server, e.g. hypercorn --workers 4 asgi:app
+app = create_asgi_app(os.getenv('FLASK_ENV', 'default'))
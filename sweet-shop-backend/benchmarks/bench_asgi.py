@@ -0,0 +1,131 @@
+"""Concurrency each server sustains at a fixed p99, WSGI vs ASGI.
+
+Start both servers against the same database first, for example:
+
+    CATALOGUE_CACHE_ENABLED=false gunicorn -w 4 --threads 8 -b :5000 run:app
+    hypercorn -w 4 -b :8000 asgi:app
+
+(the WSGI catalogue cache is switched off so both serve every read from
+Mongo). The script seeds the catalogue through create_app, then drives a
+read-heavy mix of single-sweet, search and listing requests at rising
+numbers of concurrent clients. For each server it prints throughput and
+p50/p99 per level, and the highest concurrency whose p99 stayed within the
+target. Run it on a separate core from the servers.
+
+    python benchmarks/bench_asgi.py [wsgi_url] [asgi_url] [p99_ms] [seconds] [documents]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+from urllib.parse import urlsplit
+
+from common import WORDS, seed_sweets, percentile
+from app import create_app
+from app.models import mongo
+
+DEFAULT_WSGI_URL = 'http://127.0.0.1:5000'
+DEFAULT_ASGI_URL = 'http://127.0.0.1:8000'
+DEFAULT_P99_MS = 100
+DEFAULT_SECONDS = 10
+DEFAULT_DOCUMENTS = 10_000
+CONCURRENCY_LEVELS = (1, 4, 16, 32, 64, 128, 256, 512)
+
+async def request(host, path):
+    """One GET on a fresh connection, returns the status code.
+
+    Keep-alive is avoided on purpose: Hypercorn binds its sockets without
+    TCP_NODELAY, so reused connections pick up delayed-ACK stalls that say
+    nothing about the app.
+    """
+    reader, writer = await asyncio.open_connection(*host)
+    try:
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: {host[0]}\r\nConnection: close\r\n\r\n'.encode('ascii'))
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        await reader.read()
+        return status
+    finally:
+        writer.close()
+
+async def run_level(host, paths, clients, seconds):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+
+    async def client(seed):
+        nonlocal errors
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status = await request(host, rng.choice(paths))
+            except (OSError, IndexError, ValueError):
+                status = None
+            if status == 200:
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                errors += 1
+
+    await asyncio.gather(*(client(seed) for seed in range(clients)))
+    return latencies, errors
+
+def build_paths(sweet_ids, count):
+    rng = random.Random(42)
+    paths = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.6:
+            paths.append(f'/api/sweets/{rng.choice(sweet_ids)}')
+        elif roll < 0.9:
+            paths.append(f'/api/sweets/search?mode=prefix&name={rng.choice(WORDS)[:4].lower()}')
+        else:
+            paths.append('/api/sweets?limit=20')
+    return paths
+
+def benchmark(label, url, paths, target_ms, seconds):
+    parts = urlsplit(url)
+    host = (parts.hostname, parts.port or 80)
+    best = 0
+    print(f"\n{label} {url}")
+    for clients in CONCURRENCY_LEVELS:
+        latencies, errors = asyncio.run(run_level(host, paths, clients, seconds))
+        if not latencies:
+            print(f"  {clients:4d} clients  no successful requests ({errors} errors)")
+            break
+        p99 = percentile(latencies, 99)
+        print(f"  {clients:4d} clients  {len(latencies) / seconds:8.1f} req/s  "
+              f"p50 {percentile(latencies, 50):7.1f} ms  p99 {p99:7.1f} ms  errors {errors}")
+        if p99 > target_ms:
+            break
+        best = clients
+    return best
+
+def main():
+    wsgi_url = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_WSGI_URL
+    asgi_url = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_ASGI_URL
+    target_ms = float(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_P99_MS
+    seconds = float(sys.argv[4]) if len(sys.argv) > 4 else DEFAULT_SECONDS
+    count = int(sys.argv[5]) if len(sys.argv) > 5 else DEFAULT_DOCUMENTS
+
+    app = create_app(os.getenv('FLASK_ENV', 'default'))
+    with app.app_context():
+        print(f"Seeding {count} sweets...")
+        seed_sweets(count)
+        sweet_ids = [str(doc['_id']) for doc in mongo.db.sweets.find({}, {'_id': 1}).limit(1000)]
+
+    paths = build_paths(sweet_ids, 5000)
+    results = {
+        label: benchmark(label, url, paths, target_ms, seconds)
+        for label, url in (('wsgi', wsgi_url), ('asgi', asgi_url))
+    }
+
+    print(f"\nHighest concurrency with p99 <= {target_ms:.0f} ms")
+    for label, clients in results.items():
+        print(f"  {label}: {clients} clients")
+
+    with app.app_context():
+        mongo.db.sweets.delete_many({})
+
+if __name__ == '__main__':
+    main()
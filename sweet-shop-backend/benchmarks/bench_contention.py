@@ -0,0 +1,99 @@
+"""Concurrent writers on one sweet: lost updates and throughput.
+
+Many threads add one unit of stock to the same sweet for a fixed duration,
+in three ways:
+
+    read-modify-write  read quantity, write back quantity + 1 (the old restock)
+    conditional        the same, but as an If-Match write on the version read;
+                       a conflict re-reads after a short random backoff
+    increment          Sweet.restock, a single $inc in Mongo
+
+Each mode reports writes per second, p99 write latency, conflicts, and
+whether the final stock equals the starting stock plus the writes that
+reported success. Only read-modify-write should lose updates.
+
+    python benchmarks/bench_contention.py [threads] [seconds]
+"""
+import sys
+import time
+import random
+import threading
+
+from common import percentile
+from app import create_app
+from app.models import mongo, Sweet
+
+DEFAULT_THREADS = 16
+DEFAULT_SECONDS = 5
+# Upper bound on the backoff after a conflict, in seconds
+MAX_BACKOFF = 0.002
+
+def read_modify_write(sweet_id):
+    sweet = Sweet.find_by_id(sweet_id, cached=False)
+    return Sweet.update(sweet_id, {'quantity': sweet['quantity'] + 1}) is not None
+
+def conditional(sweet_id):
+    sweet = Sweet.find_by_id(sweet_id, cached=False)
+    return Sweet.update(sweet_id, {'quantity': sweet['quantity'] + 1}, sweet['version']) is not None
+
+def increment(sweet_id):
+    return Sweet.restock(sweet_id, 1) is not None
+
+MODES = [('read-modify-write', read_modify_write), ('conditional', conditional), ('increment', increment)]
+
+def run(app, write, sweet_id, threads, seconds):
+    """(applied, conflicts, latencies in ms) after threads call write until the deadline"""
+    counts = {'applied': 0, 'conflicts': 0}
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        applied = conflicts = 0
+        samples = []
+        with app.app_context():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                ok = write(sweet_id)
+                samples.append((time.perf_counter() - start) * 1000)
+                if ok:
+                    applied += 1
+                else:
+                    conflicts += 1
+                    # Back off instead of hammering the document again at once
+                    time.sleep(random.uniform(0, MAX_BACKOFF))
+        with lock:
+            counts['applied'] += applied
+            counts['conflicts'] += conflicts
+            latencies.extend(samples)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return counts['applied'], counts['conflicts'], latencies
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_THREADS
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_SECONDS
+
+    app = create_app('testing')
+    print(f"{threads} threads, {seconds:.0f}s per mode")
+
+    for label, write in MODES:
+        with app.app_context():
+            mongo.db.sweets.delete_many({'name': 'Bench Contention'})
+            sweet = Sweet.create('Bench Contention', 'Bench', 1.0, 0)
+
+        applied, conflicts, latencies = run(app, write, sweet['id'], threads, seconds)
+
+        with app.app_context():
+            final = Sweet.find_by_id(sweet['id'], cached=False)['quantity']
+            mongo.db.sweets.delete_many({'name': 'Bench Contention'})
+        lost = applied - final
+        print(f"{label:<18} {applied / seconds:10,.0f} writes/s  p99 {percentile(latencies, 99):6.2f} ms  "
+              f"{conflicts:8d} conflicts  {lost:6d} lost  {'ok' if lost == 0 else 'LOST UPDATES'}")
+
+if __name__ == '__main__':
+    main()
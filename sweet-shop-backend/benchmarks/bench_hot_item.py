@@ -0,0 +1,81 @@
+"""Flash sale on one sweet: plain versus sharded stock.
+
+Many threads buy one unit at a time of the same sweet until it sells out
+or the duration ends, first with its stock in the sweet document and then
+split over stock_shards counters. Each run reports purchases per second,
+p99 purchase latency, refusals, and whether the final stock equals the
+starting stock minus the purchases that reported success.
+
+    python benchmarks/bench_hot_item.py [threads] [seconds] [shards]
+"""
+import sys
+import time
+import threading
+
+from common import percentile
+from app import create_app
+from app.models import mongo, Sweet
+
+DEFAULT_THREADS = 32
+DEFAULT_SECONDS = 5
+DEFAULT_SHARDS = 16
+# Enough stock that the runs measure contention rather than selling out
+STOCK = 10_000_000
+
+def run(app, sweet_id, threads, seconds):
+    """(purchased, refused, latencies in ms) after threads buy until the deadline"""
+    counts = {'purchased': 0, 'refused': 0}
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        purchased = refused = 0
+        samples = []
+        with app.app_context():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                ok = Sweet.purchase(sweet_id, 1) is not None
+                samples.append((time.perf_counter() - start) * 1000)
+                if ok:
+                    purchased += 1
+                else:
+                    refused += 1
+        with lock:
+            counts['purchased'] += purchased
+            counts['refused'] += refused
+            latencies.extend(samples)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return counts['purchased'], counts['refused'], latencies
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_THREADS
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_SECONDS
+    shards = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_SHARDS
+
+    app = create_app('testing')
+    print(f"{threads} threads, {seconds:.0f}s per mode")
+
+    for label, counters in (('plain', 0), (f'{shards} shards', shards)):
+        with app.app_context():
+            mongo.db.sweets.delete_many({'name': 'Bench Hot Item'})
+            sweet = Sweet.create('Bench Hot Item', 'Bench', 1.0, STOCK)
+            if counters:
+                Sweet.shard_stock(sweet['id'], counters)
+
+        purchased, refused, latencies = run(app, sweet['id'], threads, seconds)
+
+        with app.app_context():
+            final = Sweet.find_by_id(sweet['id'], cached=False)['quantity']
+            Sweet.delete(sweet['id'])
+        drift = STOCK - purchased - final
+        print(f"{label:<10} {purchased / seconds:10,.0f} purchases/s  p99 {percentile(latencies, 99):6.2f} ms  "
+              f"{refused:6d} refused  {'ok' if drift == 0 else f'STOCK OFF BY {drift}'}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Catalogue onboarding: one POST /api/sweets per row vs the bulk endpoint.
+
+Generates a synthetic supplier file, then loads a sample of it through
+Sweet.create one row at a time and the whole file as CSV through
+POST /api/sweets/bulk, twice (the second run updates every row). Reports
+rows per second for each.
+
+    python benchmarks/bench_import.py [rows] [batch_size]
+"""
+import io
+import sys
+import csv
+import time
+from datetime import datetime
+
+from common import synthetic_sweet
+from app import create_app
+from app.indexes import ensure_indexes
+from app.models import mongo, User, Sweet
+
+DEFAULT_ROWS = 100_000
+DEFAULT_BATCH_SIZE = 1000
+SINGLE_ROW_SAMPLE = 2000
+
+def supplier_csv(rows):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['name', 'category', 'price', 'quantity'])
+    now = datetime.utcnow()
+    for index in range(rows):
+        sweet = synthetic_sweet(index, now)
+        writer.writerow([sweet['name'], sweet['category'], sweet['price'], sweet['quantity']])
+    return out.getvalue().encode('utf-8')
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_BATCH_SIZE
+
+    app = create_app('testing')
+    app.config['SWEETS_BULK_BATCH_SIZE'] = batch_size
+    client = app.test_client()
+    body = supplier_csv(rows)
+
+    with app.app_context():
+        mongo.db.sweets.delete_many({})
+        ensure_indexes()
+        mongo.db.users.delete_many({'email': 'bench-admin@example.com'})
+        User.create('bench-admin@example.com', 'password123', 'Bench Admin', 'admin')
+
+        now = datetime.utcnow()
+        sample = [synthetic_sweet(index, now) for index in range(SINGLE_ROW_SAMPLE)]
+        start = time.perf_counter()
+        for sweet in sample:
+            Sweet.create(sweet['name'], sweet['category'], sweet['price'], sweet['quantity'])
+        elapsed = time.perf_counter() - start
+        print(f"{'single':<8} {len(sample) / elapsed:10,.0f} rows/s  ({len(sample)} rows)")
+        mongo.db.sweets.delete_many({})
+
+    token = client.post('/api/auth/login', json={
+        'email': 'bench-admin@example.com', 'password': 'password123'
+    }).get_json()['token']
+
+    for label in ('insert', 'update'):
+        start = time.perf_counter()
+        response = client.post('/api/sweets/bulk', data=body, content_type='text/csv',
+                               headers={'Authorization': f'Bearer {token}'})
+        elapsed = time.perf_counter() - start
+        result = response.get_json()
+        print(f"{label:<8} {rows / elapsed:10,.0f} rows/s  ({result['inserted']} inserted, "
+              f"{result['updated']} updated, {result['failed']} failed)")
+
+    with app.app_context():
+        mongo.db.sweets.delete_many({})
+        mongo.db.users.delete_many({'email': 'bench-admin@example.com'})
+
+if __name__ == '__main__':
+    main()
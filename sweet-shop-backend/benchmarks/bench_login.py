@@ -0,0 +1,72 @@
+"""Login throughput under a storm of concurrent clients.
+
+Creates one user, then has many threads log in repeatedly through the Flask
+test client for a fixed duration. Reports successful logins per second and
+per core, shed (503) responses and latency percentiles.
+
+    python benchmarks/bench_login.py [clients] [seconds] [bcrypt_rounds]
+"""
+import os
+import sys
+import time
+import threading
+
+from common import percentile
+from app import create_app
+from app.models import mongo, passwords, User
+
+DEFAULT_CLIENTS = 32
+DEFAULT_SECONDS = 10
+DEFAULT_ROUNDS = 12
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_CLIENTS
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_SECONDS
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_ROUNDS
+
+    app = create_app('testing')
+    app.config['BCRYPT_LOG_ROUNDS'] = rounds
+    passwords.init_app(app)
+
+    with app.app_context():
+        mongo.db.users.delete_many({'email': 'bench@example.com'})
+        User.create('bench@example.com', 'password123', 'Bench User')
+
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client_loop():
+        with app.test_client() as client:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                response = client.post('/api/auth/login',
+                                       json={'email': 'bench@example.com', 'password': 'password123'})
+                elapsed = (time.perf_counter() - start) * 1000
+                with lock:
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                    if response.status_code == 200:
+                        latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client_loop) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    cores = os.cpu_count() or 1
+    ok = statuses.get(200, 0)
+    print(f"{clients} clients, {seconds:.0f}s, bcrypt rounds {rounds}, "
+          f"{passwords.workers} {passwords.executor_type} workers, {cores} cores")
+    print(f"logins/s {ok / seconds:8.1f}  per core {ok / seconds / cores:8.1f}")
+    print(f"status counts {dict(sorted(statuses.items()))}")
+    if latencies:
+        print(f"latency p50 {percentile(latencies, 50):.1f} ms  p99 {percentile(latencies, 99):.1f} ms")
+
+    with app.app_context():
+        mongo.db.users.delete_many({'email': 'bench@example.com'})
+    passwords.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Per-request overhead of the metrics hooks.
+
+Times many GET /api/health requests through the Flask test client with
+METRICS_ENABLED off and on, and reports the difference per request.
+Needs no database.
+
+    python benchmarks/bench_metrics.py [requests] [rounds]
+"""
+import sys
+import time
+
+from common import percentile
+from app import create_app
+from config import config
+from app.metrics import http_latency, http_requests
+
+DEFAULT_REQUESTS = 5_000
+DEFAULT_ROUNDS = 5
+
+def time_requests(client, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        client.get('/api/health')
+    return (time.perf_counter() - start) / count * 1e6
+
+def build_client(enabled):
+    # Hooks are attached in create_app, so the flag has to be set via config
+    config[f'bench-metrics-{enabled}'] = type(
+        'BenchConfig', (config['testing'],), {'METRICS_ENABLED': enabled}
+    )
+    return create_app(f'bench-metrics-{enabled}').test_client()
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REQUESTS
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_ROUNDS
+
+    plain = build_client(False)
+    instrumented = build_client(True)
+
+    baseline, measured = [], []
+    for _ in range(rounds):
+        baseline.append(time_requests(plain, count))
+        measured.append(time_requests(instrumented, count))
+
+    base = percentile(baseline, 50)
+    with_metrics = percentile(measured, 50)
+    print(f"{count} requests x {rounds} rounds (median round)")
+    print(f"without metrics {base:8.1f} us/request")
+    print(f"with metrics    {with_metrics:8.1f} us/request")
+    print(f"overhead        {with_metrics - base:8.1f} us/request ({(with_metrics / base - 1) * 100:.1f}%)")
+
+    # Raw cost of the two recording calls, without Flask around them
+    start = time.perf_counter()
+    for _ in range(count):
+        http_latency.observe(0.001, 'GET', '/bench')
+        http_requests.inc('GET', '/bench', '200')
+    print(f"record cost     {(time.perf_counter() - start) / count * 1e6:8.2f} us/request")
+
+if __name__ == '__main__':
+    main()
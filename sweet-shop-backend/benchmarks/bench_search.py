@@ -0,0 +1,58 @@
+"""Compare search latency of the legacy $regex path and Sweet.search.
+
+Seeds a synthetic catalogue, creates the indexes, then times a mix of
+name searches through the old unanchored case-insensitive regex and
+through the prefix, text and auto modes, reporting p50/p99.
+
+    python benchmarks/bench_search.py [document_count] [queries]
+"""
+import sys
+import time
+import random
+
+from common import WORDS, seed_sweets, percentile
+from app import create_app
+from app.indexes import ensure_indexes
+from app.models import mongo, Sweet
+
+DEFAULT_DOCUMENTS = 100_000
+DEFAULT_QUERIES = 500
+
+def legacy_search(name):
+    """The pre-index search: unanchored, case-insensitive regex on name"""
+    return list(mongo.db.sweets.find({'name': {'$regex': name, '$options': 'i'}}).sort('name', 1))
+
+def time_queries(search, terms):
+    samples = []
+    for term in terms:
+        start = time.perf_counter()
+        search(term)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+def report(label, samples):
+    print(f"{label:<8} p50 {percentile(samples, 50):8.2f} ms  p99 {percentile(samples, 99):8.2f} ms")
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_DOCUMENTS
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_QUERIES
+    app = create_app('testing')
+
+    with app.app_context():
+        print(f"Seeding {count} sweets...")
+        seed_sweets(count)
+        ensure_indexes()
+
+        rng = random.Random(42)
+        prefixes = [rng.choice(WORDS)[:rng.randint(2, 6)].lower() for _ in range(queries)]
+        words = [rng.choice(WORDS) for _ in range(queries)]
+
+        report('regex', time_queries(legacy_search, prefixes))
+        report('prefix', time_queries(lambda term: Sweet.search(name=term, mode='prefix'), prefixes))
+        report('text', time_queries(lambda term: Sweet.search(name=term, mode='text'), words))
+        report('auto', time_queries(lambda term: Sweet.search(name=term), words))
+
+        mongo.db.sweets.delete_many({})
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Compare catalogue serialization paths without touching MongoDB.
+
+    legacy   Sweet.to_dict per document + Flask's default JSON provider
+    provider Sweet.to_dict per document + FastJSONProvider
+    batch    documents already shaped by the $project stage, encoded in one
+             serialization.dumps call (the Sweet.get_all_json path)
+
+    python benchmarks/bench_serialization.py [document_count] [rounds]
+"""
+import sys
+import time
+from datetime import datetime
+
+from common import synthetic_sweet
+from flask.json.provider import DefaultJSONProvider
+from app import create_app
+from app.models import Sweet
+from app.serialization import FastJSONProvider, dumps
+
+DEFAULT_DOCUMENTS = 10_000
+DEFAULT_ROUNDS = 20
+
+def best_of(rounds, func):
+    """Fastest wall time of func over several rounds, in milliseconds"""
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_DOCUMENTS
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_ROUNDS
+    app = create_app('testing')
+
+    now = datetime.utcnow()
+    model_docs = []
+    shaped_docs = []
+    for index in range(count):
+        sweet = synthetic_sweet(index, now)
+        sweet['id'] = f'{index:024x}'
+        model_docs.append(sweet)
+        shaped_docs.append({field: sweet[field] for field in Sweet.FIELDS})
+
+    default_provider = DefaultJSONProvider(app)
+    fast_provider = FastJSONProvider(app)
+
+    def legacy():
+        return default_provider.dumps({
+            'message': 'Sweets retrieved successfully',
+            'sweets': [Sweet.to_dict(sweet) for sweet in model_docs]
+        })
+
+    def provider():
+        return fast_provider.dumps({
+            'message': 'Sweets retrieved successfully',
+            'sweets': [Sweet.to_dict(sweet) for sweet in model_docs]
+        })
+
+    def batch():
+        return b'{"message":"Sweets retrieved successfully","sweets":' + dumps(shaped_docs) + b'}'
+
+    print(f"Serializing {count} sweets, best of {rounds} rounds")
+    baseline = best_of(rounds, legacy)
+    for label, func in (('legacy', legacy), ('provider', provider), ('batch', batch)):
+        elapsed = baseline if func is legacy else best_of(rounds, func)
+        print(f"{label:<9} {elapsed:8.2f} ms  {baseline / elapsed:5.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Compare the buffered and streaming catalogue exports.
+
+Seeds the testing database with synthetic sweets, then requests the full
+catalogue through the Flask test client in both modes, reporting peak
+Python memory, time to first byte and total time.
+
+    python benchmarks/bench_stream.py [document_count]
+"""
+import sys
+import time
+import tracemalloc
+
+from common import seed_sweets
+from app import create_app
+from app.models import mongo
+
+DEFAULT_DOCUMENTS = 100_000
+
+def measure(client, url, **kwargs):
+    """Return (peak bytes, seconds to first byte, total seconds, body bytes)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    response = client.get(url, buffered=False, **kwargs)
+    first_byte = None
+    size = 0
+    for chunk in response.iter_encoded():
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        size += len(chunk)
+    total = time.perf_counter() - start
+    response.close()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, first_byte, total, size
+
+def report(label, peak, first_byte, total, size):
+    print(f"{label:<10} peak {peak / 1024 / 1024:8.1f} MiB  "
+          f"ttfb {first_byte * 1000:8.1f} ms  total {total:6.2f} s  body {size / 1024 / 1024:6.1f} MiB")
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_DOCUMENTS
+    app = create_app('testing')
+
+    with app.app_context():
+        print(f"Seeding {count} sweets...")
+        seed_sweets(count)
+
+        with app.test_client() as client:
+            report('buffered', *measure(client, '/api/sweets'))
+            report('ndjson', *measure(client, '/api/sweets?stream=1'))
+            report('json', *measure(client, '/api/sweets?stream=json'))
+
+        mongo.db.sweets.delete_many({})
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""Shared helpers for the benchmark scripts"""
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models import mongo, Sweet
+
+WORDS = ['Chocolate', 'Caramel', 'Toffee', 'Gummy', 'Mint', 'Fudge', 'Sour', 'Honey',
+         'Lemon', 'Cherry', 'Berry', 'Coconut', 'Liquorice', 'Marshmallow', 'Nougat']
+
+def synthetic_sweet(index, now):
+    """Deterministic sweet document number index"""
+    name = f'{WORDS[index % len(WORDS)]} {WORDS[(index // len(WORDS)) % len(WORDS)]} {index:06d}'
+    category = f'Category {index % 50}'
+    sweet = {
+        'name': name,
+        'category': category,
+        'price': 1.0 + (index % 500) / 100,
+        'quantity': index % 200,
+        'created_at': now,
+        'updated_at': now
+    }
+    sweet.update(Sweet.search_fields(name, category))
+    return sweet
+
+def seed_sweets(count, batch_size=10_000):
+    """Replace the sweets collection with count synthetic documents"""
+    sweets = mongo.db.sweets
+    sweets.delete_many({})
+    now = datetime.utcnow()
+    batch = []
+    for index in range(count):
+        batch.append(synthetic_sweet(index, now))
+        if len(batch) == batch_size:
+            sweets.insert_many(batch)
+            batch = []
+    if batch:
+        sweets.insert_many(batch)
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
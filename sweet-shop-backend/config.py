@@ -7,15 +7,135 @@ load_dotenv()
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     MONGO_URI = os.environ.get('MONGO_URI') or 'mongodb://localhost:27017/sweet_shop'
+    # Connection pool, per process: every gunicorn worker builds its own
+    # client, so size MAX_POOL_SIZE against the worker's threads. Check-outs
+    # that wait longer than WAIT_QUEUE_TIMEOUT_MS fail instead of piling up
+    MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 100))
+    MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 4))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000))
+    MONGO_READ_PREFERENCE = os.environ.get('MONGO_READ_PREFERENCE', 'primary')
+    # Catalogue listing, search and cached single-sweet reads may be served by
+    # a secondary at most MAX_STALENESS_SECONDS behind (90 minimum, -1 for no
+    # bound). Writes and their pre-checks follow MONGO_READ_PREFERENCE, which
+    # should stay 'primary' for read-your-writes
+    CATALOGUE_READ_PREFERENCE = os.environ.get('CATALOGUE_READ_PREFERENCE', 'secondaryPreferred')
+    CATALOGUE_MAX_STALENESS_SECONDS = int(os.environ.get('CATALOGUE_MAX_STALENESS_SECONDS', 90))
+    # Comma separated wire compressors, e.g. 'zstd,zlib'; empty disables
+    MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', '')
+    # Open MIN_POOL_SIZE connections at startup instead of on first requests
+    MONGO_WARM_UP = os.environ.get('MONGO_WARM_UP', 'true').lower() == 'true'
+    MONGO_WARM_UP_TIMEOUT = float(os.environ.get('MONGO_WARM_UP_TIMEOUT', 5))
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-key-change-in-production'
-    JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
+    # Short-lived access tokens; clients renew them at /api/auth/refresh
+    # with the refresh token issued at login instead of logging in again
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=int(os.environ.get('JWT_ACCESS_TOKEN_MINUTES', 15)))
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=int(os.environ.get('JWT_REFRESH_TOKEN_DAYS', 30)))
     JWT_TOKEN_LOCATION = ['headers']
+    # Verified tokens are cached by hash until they expire, at most
+    # VERIFY_CACHE_TTL seconds. Revocations (logout) from other workers are
+    # picked up every BLOCKLIST_REFRESH seconds
+    JWT_VERIFY_CACHE_ENABLED = os.environ.get('JWT_VERIFY_CACHE_ENABLED', 'true').lower() == 'true'
+    JWT_VERIFY_CACHE_MAXSIZE = int(os.environ.get('JWT_VERIFY_CACHE_MAXSIZE', 10000))
+    JWT_VERIFY_CACHE_TTL = int(os.environ.get('JWT_VERIFY_CACHE_TTL', 300))
+    JWT_BLOCKLIST_REFRESH = float(os.environ.get('JWT_BLOCKLIST_REFRESH', 5))
+    CORS_ORIGINS = ['http://localhost:3000']
+    # bcrypt runs on a bounded pool; logins beyond MAX_PENDING get a 503
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_POOL_EXECUTOR = os.environ.get('PASSWORD_POOL_EXECUTOR', 'thread')
+    PASSWORD_POOL_WORKERS = int(os.environ.get('PASSWORD_POOL_WORKERS', os.cpu_count() or 2))
+    PASSWORD_POOL_MAX_PENDING = int(os.environ.get('PASSWORD_POOL_MAX_PENDING', 32))
+    PASSWORD_POOL_TIMEOUT = float(os.environ.get('PASSWORD_POOL_TIMEOUT', 5))
+    PASSWORD_POOL_RETRY_AFTER = int(os.environ.get('PASSWORD_POOL_RETRY_AFTER', 1))
+    # Token-bucket limits per endpoint as 'count/period' (second, minute,
+    # hour, day): bursts of count, refilled over the period. Callers are keyed
+    # by JWT identity, or by IP without a valid token. 'memory' buckets are
+    # per process; 'mongo' shares them between workers
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'true').lower() == 'true'
+    RATELIMIT_BACKEND = os.environ.get('RATELIMIT_BACKEND', 'memory')
+    RATELIMITS = {
+        'auth.login': '10/minute',
+        'auth.register': '5/minute',
+        'auth.refresh': '30/minute',
+        'inventory.purchase_sweet': '60/minute',
+        'inventory.checkout': '30/minute',
+        'inventory.create_hold': '30/minute'
+    }
+    # Unique indexes back the duplicate checks in User.create and Sweet.create
+    MONGO_CREATE_INDEXES = os.environ.get('MONGO_CREATE_INDEXES', 'true').lower() == 'true'
+    MONGO_VERIFY_INDEXES = os.environ.get('MONGO_VERIFY_INDEXES', 'false').lower() == 'true'
+    # 'fast' uses orjson for every jsonify call, 'default' keeps Flask's encoder
+    JSON_PROVIDER = os.environ.get('JSON_PROVIDER', 'fast')
+    SWEETS_DEFAULT_PAGE_SIZE = 50
+    # Logs are queued off the request thread and written as JSON lines.
+    # LOG_SAMPLE_RATES keeps a fraction of records per level, e.g. {'DEBUG': 0.01}
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_JSON = os.environ.get('LOG_JSON', 'true').lower() == 'true'
+    LOG_QUEUE_SIZE = 10000
+    LOG_SAMPLE_RATES = {}
+    LOG_REDACT_FIELDS = ('password', 'token', 'access_token', 'refresh_token', 'authorization')
+    # Stock movements are appended to inventory_movements off the request
+    # thread, in batches of up to LEDGER_BATCH_SIZE written at least every
+    # LEDGER_FLUSH_INTERVAL seconds. A full queue drops movements (counted in
+    # ledger_movements_dropped_total) rather than slowing purchases
+    LEDGER_ENABLED = os.environ.get('LEDGER_ENABLED', 'true').lower() == 'true'
+    LEDGER_QUEUE_SIZE = int(os.environ.get('LEDGER_QUEUE_SIZE', 10000))
+    LEDGER_BATCH_SIZE = int(os.environ.get('LEDGER_BATCH_SIZE', 500))
+    LEDGER_FLUSH_INTERVAL = float(os.environ.get('LEDGER_FLUSH_INTERVAL', 1))
+    LEDGER_SHUTDOWN_TIMEOUT = float(os.environ.get('LEDGER_SHUTDOWN_TIMEOUT', 10))
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    SWEETS_MAX_PAGE_SIZE = 200
+    SWEETS_STREAM_BATCH_SIZE = 500
+    # Bulk imports upsert this many rows per bulk_write and report at most
+    # SWEETS_BULK_MAX_ERRORS rejected rows individually
+    SWEETS_BULK_BATCH_SIZE = int(os.environ.get('SWEETS_BULK_BATCH_SIZE', 1000))
+    SWEETS_BULK_MAX_ERRORS = 1000
+    SEARCH_MAX_TERM_LENGTH = 100
+    # In-process read cache for Sweet.get_all/search/find_by_id. Listings are
+    # keyed by the catalogue version; single sweets from other workers' writes
+    # can be stale for up to the TTL
+    CATALOGUE_CACHE_ENABLED = os.environ.get('CATALOGUE_CACHE_ENABLED', 'true').lower() == 'true'
+    CATALOGUE_CACHE_TTL = int(os.environ.get('CATALOGUE_CACHE_TTL', 30))
+    CATALOGUE_CACHE_MAXSIZE = int(os.environ.get('CATALOGUE_CACHE_MAXSIZE', 1024))
+    # Admin analytics are recomputed after catalogue writes, at most once per
+    # ANALYTICS_REFRESH_INTERVAL seconds per worker
+    ANALYTICS_REFRESH_INTERVAL = float(os.environ.get('ANALYTICS_REFRESH_INTERVAL', 2))
+    ANALYTICS_LOW_STOCK_THRESHOLD = 10
+    ANALYTICS_HISTOGRAM_BUCKETS = 10
+    ANALYTICS_MAX_HISTOGRAM_BUCKETS = 100
+    # Hot sweets can have their stock split over counters (see app/stock.py).
+    # A counter that runs dry is refilled with up to STOCK_SHARD_REFILL units
+    STOCK_DEFAULT_SHARDS = 8
+    STOCK_MAX_SHARDS = 64
+    STOCK_SHARD_REFILL = int(os.environ.get('STOCK_SHARD_REFILL', 100))
+    # Cart holds keep stock reserved for HOLD_TTL_SECONDS; a thread in each
+    # worker puts expired holds back on sale every HOLD_SWEEP_INTERVAL seconds
+    HOLD_TTL_SECONDS = int(os.environ.get('HOLD_TTL_SECONDS', 600))
+    HOLD_SWEEPER_ENABLED = os.environ.get('HOLD_SWEEPER_ENABLED', 'true').lower() == 'true'
+    HOLD_SWEEP_INTERVAL = float(os.environ.get('HOLD_SWEEP_INTERVAL', 30))
+    HOLD_SWEEP_BATCH_SIZE = 500
+    # Open holds a customer may have at once, so nobody can park the stock
+    HOLD_MAX_ACTIVE_PER_USER = int(os.environ.get('HOLD_MAX_ACTIVE_PER_USER', 5))
+    # Cache-Control per endpoint for ETag-enabled responses. no-cache lets
+    # browsers and CDNs store responses but revalidate with If-None-Match
+    CACHE_CONTROL_DEFAULT = 'no-cache'
+    CACHE_CONTROL = {
+        'sweets.get_all_sweets': 'public, no-cache',
+        'sweets.search_sweets': 'public, no-cache',
+        'sweets.get_sweet': 'public, max-age=5'
+    }
     
 class DevelopmentConfig(Config):
     DEBUG = True
     
 class TestingConfig(Config):
     TESTING = True
+    BCRYPT_LOG_ROUNDS = 4
+    LOG_LEVEL = 'WARNING'
+    MONGO_MIN_POOL_SIZE = 0
+    RATELIMIT_ENABLED = False
+    LEDGER_FLUSH_INTERVAL = 0.05
+    ANALYTICS_REFRESH_INTERVAL = 0
+    HOLD_SWEEPER_ENABLED = False
     MONGO_URI = os.environ.get('TEST_MONGO_URI') or 'mongodb://localhost:27017/sweet_shop_test'
     
 class ProductionConfig(Config):
@@ -0,0 +1,26 @@
+import os
+from app.holds import sweeper
+from app.ledger import ledger
+from app.models import mongo
+
+# gunicorn -c gunicorn.conf.py run:app
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+# With preload the master runs create_app (and index creation) once and the
+# workers fork from it; every worker still builds its own Mongo client
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'false').lower() == 'true'
+
+def when_ready(server):
+    # The master only needed Mongo for startup; workers open their own pools
+    mongo.close()
+
+def post_fork(server, worker):
+    # Without preload the app is not loaded yet and create_app warms up itself
+    mongo.warm_up()
+    # Likewise the sweeper is not configured yet; the first request starts it
+    sweeper.start()
+
+def worker_exit(server, worker):
+    # Write queued stock movements before the worker goes away
+    ledger.close()
@@ -0,0 +1,120 @@
+import pytest
+from app import create_app
+from app.models import mongo, User, Sweet
+from app.reports import ReportCache, histogram_boundaries, price_histogram_report
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    app.config['TESTING'] = True
+
+    with app.app_context():
+        mongo.db.users.delete_many({})
+        mongo.db.sweets.delete_many({})
+        User.create('user@test.com', 'password123', 'Test User', 'customer')
+        User.create('admin@test.com', 'password123', 'Admin User', 'admin')
+        Sweet.create('Milk Chocolate', 'Chocolate', 2.0, 10)
+        Sweet.create('Dark Chocolate', 'Chocolate', 3.0, 0)
+        Sweet.create('Sour Worms', 'Gummy', 1.0, 4)
+        Sweet.create('Fudge', 'Fudge', 5.0, 30)
+
+        yield app
+
+        mongo.db.users.delete_many({})
+        mongo.db.sweets.delete_many({})
+
+@pytest.fixture
+def client(app):
+    with app.test_client() as client:
+        yield client
+
+def login(client, email):
+    response = client.post('/api/auth/login', json={'email': email, 'password': 'password123'})
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+def test_stock_value_by_category(client):
+    """Test value, units and out-of-stock counts are grouped per category"""
+    response = client.get('/api/analytics/stock-value', headers=login(client, 'admin@test.com'))
+    assert response.status_code == 200
+    data = response.get_json()
+
+    assert [category['category'] for category in data['categories']] == ['Fudge', 'Chocolate', 'Gummy']
+    chocolate = data['categories'][1]
+    assert chocolate == {'category': 'Chocolate', 'items': 2, 'units': 10, 'out_of_stock': 1, 'value': 20.0}
+    assert data['total_value'] == 174.0
+    assert data['total_items'] == 4
+    assert data['out_of_stock'] == 1
+
+def test_low_stock_lists_emptiest_first(client):
+    """Test sweets under the threshold come back ordered by quantity"""
+    response = client.get('/api/analytics/low-stock?threshold=5', headers=login(client, 'admin@test.com'))
+    assert response.status_code == 200
+    data = response.get_json()
+
+    assert data['count'] == 2
+    assert [(sweet['name'], sweet['quantity']) for sweet in data['sweets']] == [
+        ('Dark Chocolate', 0), ('Sour Worms', 4)
+    ]
+
+    response = client.get('/api/analytics/low-stock?threshold=0', headers=login(client, 'admin@test.com'))
+    assert response.status_code == 400
+
+def test_price_histogram(client):
+    """Test every sweet lands in one bucket, empty buckets included"""
+    response = client.get('/api/analytics/price-histogram?buckets=4', headers=login(client, 'admin@test.com'))
+    assert response.status_code == 200
+    buckets = response.get_json()['buckets']
+
+    assert len(buckets) == 4
+    assert buckets[0]['min'] == 1.0 and buckets[-1]['max'] == 5.0
+    assert [bucket['count'] for bucket in buckets] == [1, 1, 1, 1]
+    assert sum(bucket['units'] for bucket in buckets) == 44
+
+def test_histogram_boundaries_cover_the_top_price():
+    """Test the highest price falls inside the last (exclusive) bound"""
+    boundaries = histogram_boundaries(1.0, 5.0, 4)
+    assert boundaries[:4] == [1.0, 2.0, 3.0, 4.0]
+    assert boundaries[-1] > 5.0
+
+    # A single price still gets one bucket
+    assert len(histogram_boundaries(2.0, 2.0, 10)) == 2
+    assert price_histogram_report([], [])['buckets'] == []
+
+def test_reports_are_admin_only(client):
+    """Test customers get a 403"""
+    for path in ('/api/analytics/stock-value', '/api/analytics/low-stock', '/api/analytics/price-histogram'):
+        response = client.get(path, headers=login(client, 'user@test.com'))
+        assert response.status_code == 403
+
+def test_reports_refresh_after_writes(client):
+    """Test creates, updates and deletes show up in the next report"""
+    admin = login(client, 'admin@test.com')
+    assert client.get('/api/analytics/stock-value', headers=admin).get_json()['total_value'] == 174.0
+
+    sweet = Sweet.create('Toffee', 'Fudge', 1.0, 6)
+    assert client.get('/api/analytics/stock-value', headers=admin).get_json()['total_value'] == 180.0
+
+    Sweet.update(sweet['id'], {'quantity': 1})
+    assert client.get('/api/analytics/stock-value', headers=admin).get_json()['total_value'] == 175.0
+
+    Sweet.delete(sweet['id'])
+    assert client.get('/api/analytics/stock-value', headers=admin).get_json()['total_value'] == 174.0
+
+def test_report_cache_throttles_recomputation():
+    """Test a new version is only recomputed once refresh_interval has passed"""
+    now = [0.0]
+    cache = ReportCache(refresh_interval=2, clock=lambda: now[0])
+    computed = []
+
+    def compute():
+        computed.append(1)
+        return len(computed)
+
+    assert cache.get('report', 1, compute) == 1
+    assert cache.get('report', 1, compute) == 1
+    # Written again, but within the interval: the previous result stands
+    assert cache.get('report', 2, compute) == 1
+    now[0] += 2
+    assert cache.get('report', 2, compute) == 2
+    assert cache.get('report', 2, compute) == 2
+    assert len(computed) == 2
@@ -0,0 +1,175 @@
+import pytest
+import json
+from bson import ObjectId
+from app import create_app
+from app.ledger import ledger
+from app.bulk import ImportReport, csv_records, ndjson_records, validated_batches
+from app.models import mongo, User, Sweet
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    app.config['TESTING'] = True
+    app.config['SWEETS_BULK_BATCH_SIZE'] = 2
+
+    with app.app_context():
+        mongo.db.users.delete_many({})
+        mongo.db.sweets.delete_many({})
+        mongo.db.stock_shards.delete_many({})
+        User.create('user@test.com', 'password123', 'Test User', 'customer')
+        User.create('admin@test.com', 'password123', 'Admin User', 'admin')
+
+        yield app
+
+        mongo.db.users.delete_many({})
+        mongo.db.sweets.delete_many({})
+        mongo.db.stock_shards.delete_many({})
+
+@pytest.fixture
+def client(app):
+    with app.test_client() as client:
+        yield client
+
+def login(client, email):
+    response = client.post('/api/auth/login', json={'email': email, 'password': 'password123'})
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+def test_json_array_is_upserted_by_name(client):
+    """Test new names are created and existing ones updated in place"""
+    existing = Sweet.create('Fudge', 'Fudge', 1.0, 1)
+    created_at = mongo.db.sweets.find_one({'name': 'Fudge'})['created_at']
+    rows = [
+        {'name': 'Fudge', 'category': 'Fudge', 'price': 2.5, 'quantity': 40},
+        {'name': 'Toffee', 'category': 'Toffee', 'price': 1.2, 'quantity': 10},
+        {'name': 'Mint', 'category': 'Mints', 'price': 0.5}
+    ]
+    response = client.post('/api/sweets/bulk', json=rows, headers=login(client, 'admin@test.com'))
+    assert response.status_code == 200
+    data = response.get_json()
+
+    assert (data['received'], data['inserted'], data['updated'], data['failed']) == (3, 2, 1, 0)
+    fudge = Sweet.find_by_id(existing['id'], cached=False)
+    assert (fudge['price'], fudge['quantity']) == (2.5, 40)
+    assert fudge['created_at'] == created_at
+    mint = mongo.db.sweets.find_one({'name': 'Mint'})
+    assert (mint['quantity'], mint['name_lower'], mint['category_lower']) == (0, 'mint', 'mints')
+
+def test_reimport_records_stock_changes(client):
+    """Test overwriting the quantity of an existing sweet writes a ledger movement"""
+    fudge = Sweet.create('Fudge', 'Fudge', 1.0, 10)
+    mongo.db.inventory_movements.delete_many({})
+    rows = [
+        {'name': '$quantity', 'category': '$name', 'price': 1.0, 'quantity': 2},
+        {'name': 'Fudge', 'category': 'Fudge', 'price': 1.0, 'quantity': 4}
+    ]
+    response = client.post('/api/sweets/bulk', json=rows, headers=login(client, 'admin@test.com'))
+    assert response.status_code == 200
+    assert ledger.flush()
+
+    movements = {movement['sweet_id']: movement['delta'] for movement in mongo.db.inventory_movements.find()}
+    assert movements[ObjectId(fudge['id'])] == -6
+    assert len(movements) == 2
+    assert 'pending_import' not in mongo.db.sweets.find_one({'name': 'Fudge'})
+    # Uploaded values are stored as given, never read as field paths
+    assert mongo.db.sweets.find_one({'name': '$quantity'})['category'] == '$name'
+    mongo.db.inventory_movements.delete_many({})
+
+def test_reimport_refuses_sharded_sweets(client):
+    """Test a row for a sharded sweet is reported and leaves its stock alone"""
+    fudge = Sweet.create('Fudge', 'Fudge', 1.0, 10)
+    Sweet.shard_stock(fudge['id'], 4)
+    rows = [
+        {'name': 'Toffee', 'category': 'Toffee', 'price': 1.2, 'quantity': 5},
+        {'name': 'Fudge', 'category': 'Fudge', 'price': 2.0, 'quantity': 4}
+    ]
+    response = client.post('/api/sweets/bulk', json=rows, headers=login(client, 'admin@test.com'))
+    assert response.status_code == 200
+    data = response.get_json()
+
+    assert (data['inserted'], data['updated'], data['failed']) == (1, 0, 1)
+    assert data['errors'] == [{'row': 2, 'error': 'Stock of a sharded sweet can only be changed by restocking'}]
+    fudge = Sweet.find_by_id(fudge['id'], cached=False)
+    assert (fudge['price'], fudge['quantity']) == (1.0, 10)
+
+def test_csv_upload_reports_rows_that_fail_validation(client):
+    """Test bad rows are rejected by row number while the rest are saved"""
+    body = (
+        'name,category,price,quantity\n'
+        'Sherbet,Powder,1.10,5\n'
+        'Nameless,,1.00,3\n'
+        'Gobstopper,Hard,-2,1\n'
+        'Liquorice,Chewy,0.80,\n'
+        'Bonbon,Chewy,0.90,lots\n'
+    )
+    response = client.post('/api/sweets/bulk', data=body, content_type='text/csv',
+                           headers=login(client, 'admin@test.com'))
+    assert response.status_code == 200
+    data = response.get_json()
+
+    assert (data['received'], data['inserted'], data['failed']) == (5, 2, 3)
+    assert data['errors'] == [
+        {'row': 2, 'error': 'Missing required field: category'},
+        {'row': 3, 'error': 'Price must be greater than 0'},
+        {'row': 5, 'error': 'Invalid quantity value'}
+    ]
+    assert sorted(sweet['name'] for sweet in Sweet.get_all()) == ['Liquorice', 'Sherbet']
+
+def test_ndjson_upload(client):
+    """Test NDJSON rows, skipping blank lines and reporting unparseable ones"""
+    body = '\n'.join([
+        json.dumps({'name': 'Jelly Bean', 'category': 'Jelly', 'price': 0.1, 'quantity': 500}),
+        '',
+        '{not json',
+        json.dumps(['not', 'an', 'object']),
+        json.dumps({'name': 42, 'category': 'Jelly', 'price': 1})
+    ])
+    response = client.post('/api/sweets/bulk', data=body, content_type='application/x-ndjson',
+                           headers=login(client, 'admin@test.com'))
+    data = response.get_json()
+
+    assert response.status_code == 200
+    assert data['inserted'] == 1
+    assert [error['error'] for error in data['errors']] == [
+        'Invalid JSON', 'Row must be an object', 'Invalid name value'
+    ]
+
+def test_bulk_rejects_unsupported_uploads(client):
+    """Test wrong content types, non-array JSON and non-admins"""
+    admin = login(client, 'admin@test.com')
+    response = client.post('/api/sweets/bulk', data='x', content_type='text/plain', headers=admin)
+    assert response.status_code == 415
+
+    response = client.post('/api/sweets/bulk', json={'name': 'Fudge'}, headers=admin)
+    assert response.status_code == 400
+
+    response = client.post('/api/sweets/bulk', json=[], headers=login(client, 'user@test.com'))
+    assert response.status_code == 403
+
+def test_rows_are_written_in_configured_batches(app, monkeypatch):
+    """Test one upsert_many call per SWEETS_BULK_BATCH_SIZE rows"""
+    calls = []
+    upsert_many = Sweet.upsert_many
+    monkeypatch.setattr(Sweet, 'upsert_many', staticmethod(lambda rows: calls.append(len(rows)) or upsert_many(rows)))
+    client = app.test_client()
+    rows = [{'name': f'Sweet {index}', 'category': 'Mixed', 'price': 1} for index in range(5)]
+
+    response = client.post('/api/sweets/bulk', json=rows, headers=login(client, 'admin@test.com'))
+
+    assert response.get_json()['inserted'] == 5
+    assert calls == [2, 2, 1]
+
+def test_server_rejected_rows_are_reported():
+    """Test write errors from bulk_write map back to their row numbers"""
+    report = ImportReport()
+    batch = list(next(validated_batches(
+        [{'name': 'A', 'category': 'C', 'price': 1}, {'name': 'B', 'category': 'C', 'price': 1}], 10, report
+    )))
+    report.add_batch(batch, ({0: 'id-a'}, 0, {1: {'index': 1, 'code': 11000}}, {}))
+
+    assert report.created == [('id-a', 0)]
+    assert report.errors == [{'row': 2, 'error': 'Conflicting write for this name, please retry'}]
+
+def test_record_readers():
+    """Test CSV empty cells are dropped and NDJSON blank lines skipped"""
+    assert list(csv_records(['name,price\n', 'Fudge,\n'])) == [{'name': 'Fudge'}]
+    assert list(ndjson_records(['{"a": 1}\n', '\n'])) == [{'a': 1}]
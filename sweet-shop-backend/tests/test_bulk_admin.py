@@ -0,0 +1,134 @@
+import pytest
+from bson import ObjectId
+from app import create_app
+from app.models import mongo, User, Sweet
+from app.validation import ValidationError, parse_price_change
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    app.config['TESTING'] = True
+
+    with app.app_context():
+        mongo.db.users.delete_many({})
+        mongo.db.sweets.delete_many({})
+        User.create('user@test.com', 'password123', 'Test User', 'customer')
+        User.create('admin@test.com', 'password123', 'Admin User', 'admin')
+
+        yield app
+
+        mongo.db.users.delete_many({})
+        mongo.db.sweets.delete_many({})
+
+@pytest.fixture
+def client(app):
+    with app.test_client() as client:
+        yield client
+
+@pytest.fixture
+def sweets(app):
+    return {
+        sweet['name']: sweet for sweet in (
+            Sweet.create('Milk Chocolate', 'Chocolate', 2.00, 10),
+            Sweet.create('Dark Chocolate', 'Chocolate', 0.40, 5),
+            Sweet.create('Sour Worms', 'Gummy', 1.00, 4)
+        )
+    }
+
+def login(client, email):
+    response = client.post('/api/auth/login', json={'email': email, 'password': 'password123'})
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+def price(name):
+    return mongo.db.sweets.find_one({'name': name})['price']
+
+def test_percentage_price_change_by_category(client, sweets):
+    """Test a category is repriced in one request, rounded to cents"""
+    response = client.post('/api/sweets/bulk/price', json={'category': 'chocolate', 'percent': 12.5},
+                           headers=login(client, 'admin@test.com'))
+    assert response.status_code == 200
+    assert response.get_json()['matched'] == 2
+    assert response.get_json()['updated'] == 2
+
+    assert price('Milk Chocolate') == 2.25
+    assert price('Dark Chocolate') == 0.45
+    assert price('Sour Worms') == 1.00
+
+def test_absolute_cut_skips_sweets_it_would_make_free(client, sweets):
+    """Test a price cut leaves sweets priced at or below the cut alone"""
+    response = client.post('/api/sweets/bulk/price', json={'max_price': 5, 'amount': -0.5},
+                           headers=login(client, 'admin@test.com'))
+    data = response.get_json()
+
+    assert (data['updated'], data['skipped']) == (2, 1)
+    assert price('Milk Chocolate') == 1.50
+    assert price('Sour Worms') == 0.50
+    assert price('Dark Chocolate') == 0.40
+
+def test_price_change_requires_a_filter(client, sweets):
+    """Test an unfiltered change needs an explicit "all": true"""
+    admin = login(client, 'admin@test.com')
+    response = client.post('/api/sweets/bulk/price', json={'percent': 10}, headers=admin)
+    assert response.status_code == 400
+
+    response = client.post('/api/sweets/bulk/price', json={'percent': 10, 'all': True}, headers=admin)
+    assert response.get_json()['updated'] == 3
+
+    response = client.post('/api/sweets/bulk/price', json={'category': 'Gummy', 'percent': 10},
+                           headers=login(client, 'user@test.com'))
+    assert response.status_code == 403
+
+def test_parse_price_change():
+    """Test exactly one of percent or amount, and no changes to zero or below"""
+    filters, percent, amount = parse_price_change({'category': 'Fudge', 'amount': '0.25'}, Sweet.SEARCH_MODES, 100)
+    assert (filters['category'], percent, amount) == ('Fudge', None, 0.25)
+    for body in ({'category': 'Fudge'}, {'category': 'Fudge', 'percent': 5, 'amount': 1},
+                 {'category': 'Fudge', 'percent': -100}, {'category': 'Fudge', 'amount': 0},
+                 {'category': 'Fudge', 'percent': 'lots'}, {'category': 3, 'percent': 5}, None):
+        with pytest.raises(ValidationError):
+            parse_price_change(body, Sweet.SEARCH_MODES, 100)
+
+def test_multi_item_restock(client, sweets):
+    """Test several sweets are restocked in one request, repeats summed"""
+    milk, gummy = sweets['Milk Chocolate']['id'], sweets['Sour Worms']['id']
+    missing = str(ObjectId())
+    response = client.post('/api/sweets/restock', json={'items': [
+        {'sweet_id': milk, 'quantity': 5},
+        {'sweet_id': gummy, 'quantity': 20},
+        {'sweet_id': milk, 'quantity': 1},
+        {'sweet_id': missing, 'quantity': 3}
+    ]}, headers=login(client, 'admin@test.com'))
+    assert response.status_code == 200
+    data = response.get_json()
+
+    assert (data['restocked'], data['not_found']) == (2, 1)
+    assert [(item['sweet_id'], item['status']) for item in data['items']] == [
+        (milk, 'restocked'), (gummy, 'restocked'), (missing, 'not_found')
+    ]
+    assert data['items'][0]['stock'] == 16
+    assert Sweet.find_by_id(gummy, cached=False)['quantity'] == 24
+
+def test_multi_item_restock_validation(client, sweets):
+    """Test bad lines are rejected before anything is written"""
+    admin = login(client, 'admin@test.com')
+    milk = sweets['Milk Chocolate']['id']
+    response = client.post('/api/sweets/restock', json={'items': [
+        {'sweet_id': milk, 'quantity': 5}, {'sweet_id': milk, 'quantity': 0}
+    ]}, headers=admin)
+    assert response.status_code == 400
+
+    response = client.post('/api/sweets/restock', json={'items': []}, headers=admin)
+    assert response.get_json()['error'] == 'Restock requires a non-empty list of items'
+    assert Sweet.find_by_id(milk, cached=False)['quantity'] == 10
+
+def test_rename_checks_the_exact_name(client, sweets):
+    """Test a rename is only refused when another sweet has exactly that name"""
+    admin = login(client, 'admin@test.com')
+    milk = sweets['Milk Chocolate']['id']
+
+    # "Dark" prefixes another sweet's name but is free
+    response = client.put(f'/api/sweets/{milk}', json={'name': 'Dark'}, headers=admin)
+    assert response.status_code == 200
+
+    response = client.put(f'/api/sweets/{milk}', json={'name': 'Sour Worms'}, headers=admin)
+    assert response.status_code == 400
@@ -0,0 +1,71 @@
+from app.cache import TTLCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_cache_hit_and_miss():
+    """Test get_or_load only calls the loader on a miss"""
+    cache = TTLCache(maxsize=10, ttl=30)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return 'value'
+
+    assert cache.get_or_load(('sweet', '1'), loader) == 'value'
+    assert cache.get_or_load(('sweet', '1'), loader) == 'value'
+    assert len(calls) == 1
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+def test_cache_ttl_expiry():
+    """Test entries expire after the TTL"""
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=30, clock=clock)
+    cache.set(('sweet', '1'), 'value')
+
+    clock.now = 29
+    assert cache.get(('sweet', '1')) == 'value'
+    clock.now = 31
+    assert cache.get(('sweet', '1')) is None
+    assert cache.stats()['expirations'] == 1
+
+def test_cache_lru_eviction():
+    """Test the least recently used entry is evicted at the size bound"""
+    cache = TTLCache(maxsize=2, ttl=30)
+    cache.set(('sweet', '1'), 'one')
+    cache.set(('sweet', '2'), 'two')
+    cache.get(('sweet', '1'))
+    cache.set(('sweet', '3'), 'three')
+
+    assert cache.get(('sweet', '2')) is None
+    assert cache.get(('sweet', '1')) == 'one'
+    assert cache.stats()['evictions'] == 1
+
+def test_cache_invalidate_namespace():
+    """Test invalidate drops only the given namespace"""
+    cache = TTLCache(maxsize=10, ttl=30)
+    cache.set(('search', 'choc'), ['a'])
+    cache.set(('search', 'mint'), ['b'])
+    cache.set(('sweet', '1'), 'one')
+
+    cache.invalidate('search')
+
+    assert cache.get(('search', 'choc')) is None
+    assert cache.get(('search', 'mint')) is None
+    assert cache.get(('sweet', '1')) == 'one'
+
+def test_cache_skips_load_that_raced_a_write():
+    """Test a value loaded before an invalidation is not stored"""
+    cache = TTLCache(maxsize=10, ttl=30)
+
+    def loader():
+        cache.delete(('sweet', '1'))
+        return 'stale'
+
+    assert cache.get_or_load(('sweet', '1'), loader) == 'stale'
+    assert cache.get(('sweet', '1')) is None
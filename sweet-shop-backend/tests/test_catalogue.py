@@ -0,0 +1,214 @@
+import pytest
+import json
+from app import create_app
+from pymongo.read_preferences import SecondaryPreferred
+from app.models import mongo, Sweet
+
+@pytest.fixture
+def client():
+    app = create_app('testing')
+    app.config['TESTING'] = True
+
+    with app.test_client() as client:
+        with app.app_context():
+            mongo.db.sweets.delete_many({})
+
+            # Create a small catalogue
+            for index in range(5):
+                Sweet.create(f'Toffee {index}', 'Toffee', 1.00 + index, 10)
+
+            yield client
+            mongo.db.sweets.delete_many({})
+
+def test_get_all_sweets_unpaginated(client):
+    """Test old clients still get the full list"""
+    response = client.get('/api/sweets')
+    data = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert len(data['sweets']) == 5
+    assert 'next_cursor' not in data
+
+def test_get_sweets_paginated(client):
+    """Test walking the catalogue with limit/after cursors"""
+    response = client.get('/api/sweets?limit=2')
+    data = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert [s['name'] for s in data['sweets']] == ['Toffee 0', 'Toffee 1']
+    assert data['total'] == 5
+
+    names = [s['name'] for s in data['sweets']]
+    while data['next_cursor']:
+        response = client.get(f'/api/sweets?limit=2&count=false&after={data["next_cursor"]}')
+        data = json.loads(response.data)
+        assert 'total' not in data
+        names.extend(s['name'] for s in data['sweets'])
+
+    assert names == [f'Toffee {index}' for index in range(5)]
+
+def test_get_sweets_projection(client):
+    """Test fields= limits the returned keys"""
+    response = client.get('/api/sweets?limit=1&fields=name,price')
+    data = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert data['sweets'] == [{'name': 'Toffee 0', 'price': 1.00}]
+
+def test_get_sweets_invalid_cursor(client):
+    """Test a garbage cursor is rejected"""
+    response = client.get('/api/sweets?after=not-a-cursor')
+
+    assert response.status_code == 400
+
+def test_stream_sweets_ndjson(client):
+    """Test ?stream=1 yields one JSON record per line"""
+    response = client.get('/api/sweets?stream=1')
+    lines = response.data.decode('utf-8').splitlines()
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert [json.loads(line)['name'] for line in lines] == [f'Toffee {index}' for index in range(5)]
+
+def test_stream_sweets_accept_header(client):
+    """Test Accept: application/x-ndjson selects the streaming mode"""
+    response = client.get('/api/sweets', headers={'Accept': 'application/x-ndjson'})
+
+    assert response.mimetype == 'application/x-ndjson'
+    assert len(response.data.decode('utf-8').splitlines()) == 5
+
+def test_stream_sweets_json(client):
+    """Test the streamed JSON envelope matches the regular response"""
+    streamed = json.loads(client.get('/api/sweets?stream=json').data)
+    regular = json.loads(client.get('/api/sweets').data)
+
+    assert streamed == regular
+
+def test_search_prefix(client):
+    """Test prefix search is case-insensitive"""
+    Sweet.create('Chocolate Bar', 'Chocolate', 2.99, 10)
+
+    response = client.get('/api/sweets/search?name=choc&mode=prefix')
+    data = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert [s['name'] for s in data['sweets']] == ['Chocolate Bar']
+
+def test_search_escapes_regex(client):
+    """Test regex metacharacters in user input are matched literally"""
+    response = client.get('/api/sweets/search?name=.*&mode=prefix')
+    data = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert data['count'] == 0
+
+def test_search_by_category(client):
+    """Test category filter ignores case"""
+    Sweet.create('Chocolate Bar', 'Chocolate', 2.99, 10)
+
+    response = client.get('/api/sweets/search?category=chocolate')
+    data = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert [s['name'] for s in data['sweets']] == ['Chocolate Bar']
+
+def test_search_invalid_mode(client):
+    """Test unknown search modes are rejected"""
+    response = client.get('/api/sweets/search?name=choc&mode=fuzzy')
+
+    assert response.status_code == 400
+
+def test_cached_listing_invalidated_on_write(client):
+    """Test a write through the model is visible on the next read"""
+    first = json.loads(client.get('/api/sweets').data)
+    sweet = Sweet.create('Chocolate Bar', 'Chocolate', 2.99, 10)
+    Sweet.purchase(sweet['id'], 4)
+    second = json.loads(client.get('/api/sweets').data)
+
+    assert len(second['sweets']) == len(first['sweets']) + 1
+    assert Sweet.find_by_id(sweet['id'])['quantity'] == 6
+
+def test_get_sweets_etag(client):
+    """Test an unchanged catalogue answers If-None-Match with 304"""
+    response = client.get('/api/sweets')
+    etag = response.headers['ETag']
+
+    response = client.get('/api/sweets', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+    Sweet.create('Chocolate Bar', 'Chocolate', 2.99, 10)
+    response = client.get('/api/sweets', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+def test_get_sweet_etag(client):
+    """Test single sweets are conditional on their last update"""
+    sweet = Sweet.create('Chocolate Bar', 'Chocolate', 2.99, 10)
+
+    response = client.get(f'/api/sweets/{sweet["id"]}')
+    etag = response.headers['ETag']
+    assert response.status_code == 200
+    assert json.loads(response.data)['sweet']['name'] == 'Chocolate Bar'
+
+    response = client.get(f'/api/sweets/{sweet["id"]}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+    Sweet.purchase(sweet['id'], 1)
+    response = client.get(f'/api/sweets/{sweet["id"]}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+
+def test_stock_writes_skip_the_catalogue_counter(client, monkeypatch):
+    """Test purchases and restocks leave counters.sweets alone yet still move ETags and listings"""
+    sweet = Sweet.find_by_name('Toffee 0')
+    counter = mongo.db.counters.find_one({'_id': 'sweets'})
+    etag = client.get('/api/sweets').headers['ETag']
+    assert Sweet.get_all()[0]['quantity'] == 10
+
+    # Written by another worker, so this one's cache is not told
+    monkeypatch.setattr(Sweet, 'mark_stock_changed', lambda *sweet_ids: None)
+    Sweet.purchase(sweet['id'], 3)
+    Sweet.restock(sweet['id'], 1)
+    assert Sweet.checkout([(sweet['id'], 1)])[0]
+
+    assert mongo.db.counters.find_one({'_id': 'sweets'}) == counter
+    assert Sweet.get_all()[0]['quantity'] == 7
+    response = client.get('/api/sweets', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert json.loads(response.data)['sweets'][0]['quantity'] == 7
+
+def test_get_sweet_not_found(client):
+    """Test unknown sweets are still a 404"""
+    response = client.get('/api/sweets/000000000000000000000000')
+
+    assert response.status_code == 404
+
+def test_catalogue_reads_prefer_secondaries(client):
+    """Test browsing reads use the bounded-staleness read preference"""
+    read_preference = Sweet.catalogue().read_preference
+
+    assert read_preference == SecondaryPreferred(max_staleness=90)
+    assert mongo.db.sweets.read_preference.mongos_mode == 'primary'
+
+def test_writes_and_pre_checks_stay_on_primary(client, monkeypatch):
+    """Test listing and search route through Sweet.catalogue, purchases never do"""
+    calls = []
+    catalogue = Sweet.catalogue
+
+    def spy():
+        calls.append(1)
+        return catalogue()
+
+    monkeypatch.setattr(Sweet, 'catalogue', staticmethod(spy))
+    sweet_id = client.get('/api/sweets').get_json()['sweets'][0]['id']
+    client.get('/api/sweets/search?name=toffee&mode=prefix')
+    client.get(f'/api/sweets/{sweet_id}')
+    assert len(calls) == 3
+
+    def refuse():
+        raise AssertionError('write path read from the catalogue')
+
+    monkeypatch.setattr(Sweet, 'catalogue', staticmethod(refuse))
+    assert Sweet.find_by_id(sweet_id, cached=False)['quantity'] == 10
+    assert Sweet.purchase(sweet_id, 3)['quantity'] == 7
+    assert Sweet.checkout([(sweet_id, 2)])[0] is True
@@ -0,0 +1,310 @@
+import pytest
+import json
+import asyncio
+from app import create_app
+from app.asgi import create_asgi_app
+from app.models import mongo, User, Sweet
+
+class ContractResponse:
+    """The parts of a test response the contract tests look at"""
+
+    def __init__(self, status_code, headers, data):
+        self.status_code = status_code
+        self.headers = headers
+        self.data = data
+
+    def get_json(self):
+        return json.loads(self.data)
+
+class ASGIClient:
+    """Drives the Quart test client from synchronous tests.
+
+    The app is started (before_serving) on a private event loop, so the
+    same test bodies run unchanged against both variants.
+    """
+
+    def __init__(self, app):
+        self.loop = asyncio.new_event_loop()
+        self.serving = app.test_app()
+        self.loop.run_until_complete(self.serving.__aenter__())
+        self.client = app.test_client()
+
+    def open(self, path, method, **kwargs):
+        async def send():
+            response = await self.client.open(path, method=method, **kwargs)
+            return ContractResponse(response.status_code, response.headers, await response.get_data())
+        return self.loop.run_until_complete(send())
+
+    def get(self, path, **kwargs):
+        return self.open(path, 'GET', **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.open(path, 'POST', **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.open(path, 'PUT', **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.open(path, 'DELETE', **kwargs)
+
+    def close(self):
+        self.loop.run_until_complete(self.serving.__aexit__(None, None, None))
+        self.loop.close()
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    app.config['TESTING'] = True
+
+    with app.app_context():
+        mongo.db.users.delete_many({})
+        mongo.db.sweets.delete_many({})
+        mongo.db.revoked_tokens.delete_many({})
+
+        User.create('user@test.com', 'password123', 'Test User', 'customer')
+        User.create('admin@test.com', 'password123', 'Admin User', 'admin')
+
+        yield app
+
+        mongo.db.users.delete_many({})
+        mongo.db.sweets.delete_many({})
+
+@pytest.fixture(params=['wsgi', 'asgi'])
+def client(request, app):
+    """Every test below runs against the Flask app and the Quart app"""
+    if request.param == 'wsgi':
+        with app.test_client() as client:
+            yield client
+    else:
+        client = ASGIClient(create_asgi_app('testing'))
+        try:
+            yield client
+        finally:
+            client.close()
+
+def auth_headers(client, email='user@test.com'):
+    response = client.post('/api/auth/login', json={'email': email, 'password': 'password123'})
+    return {'Authorization': f'Bearer {response.get_json()["token"]}'}
+
+def test_register_and_login(client):
+    response = client.post('/api/auth/register', json={
+        'name': 'New User', 'email': 'new@test.com', 'password': 'password123'
+    })
+    assert response.status_code == 201
+    assert response.get_json()['user']['role'] == 'customer'
+
+    response = client.post('/api/auth/register', json={
+        'name': 'New User', 'email': 'new@test.com', 'password': 'password123'
+    })
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'User with this email already exists'
+
+    response = client.post('/api/auth/login', json={'email': 'new@test.com', 'password': 'password123'})
+    assert response.status_code == 200
+    assert response.get_json()['user']['email'] == 'new@test.com'
+
+    response = client.post('/api/auth/login', json={'email': 'new@test.com', 'password': 'wrong'})
+    assert response.status_code == 401
+
+def test_register_validation(client):
+    response = client.post('/api/auth/register', json={'name': 'X', 'email': 'bad', 'password': 'password123'})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid email format'
+
+def test_auth_errors(client):
+    response = client.post('/api/sweets', json={'name': 'Fudge', 'category': 'Fudge', 'price': 1})
+    assert response.status_code == 401
+    assert response.get_json() == {'msg': 'Missing Authorization Header'}
+
+    response = client.post('/api/sweets', json={'name': 'Fudge', 'category': 'Fudge', 'price': 1},
+                           headers={'Authorization': 'Bearer not-a-token'})
+    assert response.status_code == 422
+
+    response = client.post('/api/sweets', json={'name': 'Fudge', 'category': 'Fudge', 'price': 1},
+                           headers=auth_headers(client))
+    assert response.status_code == 403
+
+def test_logout_revokes_token(client):
+    headers = auth_headers(client)
+
+    response = client.post('/api/auth/logout', headers=headers)
+    assert response.status_code == 200
+
+    response = client.post('/api/auth/logout', headers=headers)
+    assert response.status_code == 401
+    assert response.get_json() == {'msg': 'Token has been revoked'}
+
+    response = client.post('/api/auth/logout', headers=auth_headers(client))
+    assert response.status_code == 200
+
+def test_refresh_token(client):
+    response = client.post('/api/auth/login', json={'email': 'user@test.com', 'password': 'password123'})
+    data = response.get_json()
+    refresh = {'Authorization': f'Bearer {data["refresh_token"]}'}
+
+    response = client.post('/api/auth/refresh', headers=refresh)
+    assert response.status_code == 200
+    token = response.get_json()['token']
+
+    sweet = Sweet.create('Fudge', 'Fudge', 1.50, 5)
+    response = client.post(f'/api/sweets/{sweet["id"]}/purchase', json={'quantity': 1},
+                           headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+
+    # Each token type only works where it is meant to
+    response = client.post(f'/api/sweets/{sweet["id"]}/purchase', json={'quantity': 1}, headers=refresh)
+    assert response.status_code == 422
+    response = client.post('/api/auth/refresh', headers={'Authorization': f'Bearer {data["token"]}'})
+    assert response.status_code == 422
+    assert response.get_json() == {'msg': 'Only refresh tokens are allowed'}
+
+def test_logout_revokes_refresh_token(client):
+    response = client.post('/api/auth/login', json={'email': 'user@test.com', 'password': 'password123'})
+    data = response.get_json()
+    headers = {'Authorization': f'Bearer {data["token"]}'}
+
+    response = client.post('/api/auth/logout', json={'refresh_token': 'garbage'}, headers=headers)
+    assert response.status_code == 400
+
+    response = client.post('/api/auth/logout', json={'refresh_token': data['refresh_token']}, headers=headers)
+    assert response.status_code == 200
+
+    response = client.post('/api/auth/refresh', headers={'Authorization': f'Bearer {data["refresh_token"]}'})
+    assert response.status_code == 401
+
+def test_tokens_work_across_variants(app):
+    """A token issued by one app is accepted by the other"""
+    asgi_client = ASGIClient(create_asgi_app('testing'))
+    try:
+        with app.test_client() as wsgi_client:
+            sweet = Sweet.create('Fudge', 'Fudge', 1.50, 5)
+            for issuer, verifier in ((asgi_client, wsgi_client), (wsgi_client, asgi_client)):
+                response = verifier.post(f'/api/sweets/{sweet["id"]}/purchase', json={'quantity': 1},
+                                         headers=auth_headers(issuer))
+                assert response.status_code == 200
+    finally:
+        asgi_client.close()
+
+def test_sweet_crud(client):
+    admin = auth_headers(client, 'admin@test.com')
+
+    response = client.post('/api/sweets', json={'name': 'Fudge', 'category': 'Fudge', 'price': 1.5},
+                           headers=admin)
+    assert response.status_code == 201
+    sweet = response.get_json()['sweet']
+    assert sweet['quantity'] == 0
+
+    response = client.post('/api/sweets', json={'name': 'Fudge', 'category': 'Fudge', 'price': 1.5},
+                           headers=admin)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Sweet with this name already exists'
+
+    response = client.post('/api/sweets', json={'name': 'Mint', 'category': 'Mint', 'price': -1},
+                           headers=admin)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Price must be greater than 0'
+
+    response = client.get(f'/api/sweets/{sweet["id"]}')
+    assert response.status_code == 200
+    assert response.get_json()['sweet']['name'] == 'Fudge'
+
+    response = client.put(f'/api/sweets/{sweet["id"]}', json={'price': 2.5, 'quantity': 4}, headers=admin)
+    assert response.status_code == 200
+    assert response.get_json()['sweet']['price'] == 2.5
+    assert response.get_json()['sweet']['quantity'] == 4
+
+    response = client.put(f'/api/sweets/{sweet["id"]}', json={'name': 'Fudge'}, headers=admin)
+    assert response.get_json()['message'] == 'No changes detected'
+
+    response = client.delete(f'/api/sweets/{sweet["id"]}', headers=admin)
+    assert response.status_code == 200
+
+    response = client.get(f'/api/sweets/{sweet["id"]}')
+    assert response.status_code == 404
+    assert response.get_json() == {'error': 'Sweet not found'}
+
+def test_listing(client):
+    for index in range(5):
+        Sweet.create(f'Toffee {index}', 'Toffee', 1.00 + index, 10)
+
+    response = client.get('/api/sweets')
+    assert response.status_code == 200
+    assert [s['name'] for s in response.get_json()['sweets']] == [f'Toffee {i}' for i in range(5)]
+
+    response = client.get('/api/sweets?limit=2&fields=name,price')
+    data = response.get_json()
+    assert data['sweets'] == [{'name': 'Toffee 0', 'price': 1.0}, {'name': 'Toffee 1', 'price': 2.0}]
+    assert data['total'] == 5
+
+    response = client.get(f'/api/sweets?limit=10&count=false&after={data["next_cursor"]}')
+    data = response.get_json()
+    assert [s['name'] for s in data['sweets']] == ['Toffee 2', 'Toffee 3', 'Toffee 4']
+    assert data['next_cursor'] is None
+    assert 'total' not in data
+
+    assert client.get('/api/sweets?fields=secret').status_code == 400
+    assert client.get('/api/sweets?after=garbage').get_json() == {'error': 'Invalid cursor'}
+
+def test_stream(client):
+    Sweet.create('Toffee', 'Toffee', 1.00, 10)
+    Sweet.create('Fudge', 'Fudge', 2.00, 10)
+
+    response = client.get('/api/sweets?stream=ndjson&fields=name')
+    assert response.headers['Content-Type'].startswith('application/x-ndjson')
+    assert [json.loads(line) for line in response.data.splitlines()] == [{'name': 'Fudge'}, {'name': 'Toffee'}]
+
+def test_search(client):
+    Sweet.create('Chocolate Bar', 'Chocolate', 2.99, 10)
+    Sweet.create('Chocolate Truffle', 'Chocolate', 5.99, 10)
+    Sweet.create('Gummy Bears', 'Gummy', 1.99, 10)
+
+    response = client.get('/api/sweets/search?name=choc&mode=prefix&max_price=4')
+    assert response.status_code == 200
+    assert [s['name'] for s in response.get_json()['sweets']] == ['Chocolate Bar']
+
+    response = client.get('/api/sweets/search?min_price=5&max_price=1')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Minimum price cannot be greater than maximum price'
+
+def test_purchase_and_restock(client):
+    sweet = Sweet.create('Chocolate Bar', 'Chocolate', 2.99, 5)
+    headers = auth_headers(client)
+
+    response = client.post(f'/api/sweets/{sweet["id"]}/purchase', json={'quantity': 3}, headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['sweet']['quantity'] == 2
+
+    response = client.post(f'/api/sweets/{sweet["id"]}/purchase', json={'quantity': 3}, headers=headers)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Not enough stock. Available: 2'
+
+    response = client.post('/api/sweets/000000000000000000000000/purchase', json={}, headers=headers)
+    assert response.status_code == 404
+
+    response = client.post(f'/api/sweets/{sweet["id"]}/restock', json={'quantity': 8}, headers=headers)
+    assert response.status_code == 403
+
+    response = client.post(f'/api/sweets/{sweet["id"]}/restock', json={'quantity': 8},
+                           headers=auth_headers(client, 'admin@test.com'))
+    assert response.status_code == 200
+    assert response.get_json()['sweet']['quantity'] == 10
+
+def test_checkout(client):
+    bar = Sweet.create('Chocolate Bar', 'Chocolate', 2.50, 5)
+    gum = Sweet.create('Gummy Bears', 'Gummy', 1.00, 1)
+    headers = auth_headers(client)
+
+    response = client.post('/api/sweets/checkout', json={'items': [
+        {'sweet_id': bar['id'], 'quantity': 2},
+        {'sweet_id': gum['id'], 'quantity': 2}
+    ]}, headers=headers)
+    assert response.status_code == 400
+    assert [item['status'] for item in response.get_json()['items']] == ['rolled_back', 'insufficient_stock']
+    assert Sweet.find_by_id(bar['id'], cached=False)['quantity'] == 5
+
+    response = client.post('/api/sweets/checkout', json=[
+        {'sweet_id': bar['id'], 'quantity': 2},
+        {'sweet_id': gum['id']}
+    ], headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['total'] == 6.0
@@ -0,0 +1,119 @@
+import pytest
+import json
+from pymongo import monitoring
+from app import create_app
+from app import db
+from pymongo.read_preferences import Primary, SecondaryPreferred
+from app.db import ForkSafeMongo, PoolStats, client_options, catalogue_read_preference, read_preference
+from app.metrics import registry
+from config import config
+
+ADDRESS = ('db.example', 27017)
+
+@pytest.fixture
+def client():
+    app = create_app('testing')
+    app.config['TESTING'] = True
+
+    with app.test_client() as client:
+        yield client
+
+def test_client_options_from_config():
+    """Test pool settings map onto MongoClient options"""
+    settings = dict(vars(config['testing']))
+    settings.update({
+        'MONGO_MAX_POOL_SIZE': 20,
+        'MONGO_MIN_POOL_SIZE': 5,
+        'MONGO_WAIT_QUEUE_TIMEOUT_MS': 0,
+        'MONGO_READ_PREFERENCE': 'secondaryPreferred',
+        'MONGO_COMPRESSORS': 'zstd,zlib'
+    })
+    options = client_options(settings)
+
+    assert options['maxPoolSize'] == 20
+    assert options['minPoolSize'] == 5
+    assert options['waitQueueTimeoutMS'] is None
+    assert options['readPreference'] == 'secondaryPreferred'
+    assert options['compressors'] == 'zstd,zlib'
+    assert options['event_listeners'][0] is db.pool_stats
+
+    settings['MONGO_COMPRESSORS'] = ''
+    assert 'compressors' not in client_options(settings)
+
+def test_catalogue_read_preference_from_config():
+    """Test catalogue reads get a staleness-bounded read preference"""
+    settings = {'CATALOGUE_READ_PREFERENCE': 'secondaryPreferred', 'CATALOGUE_MAX_STALENESS_SECONDS': 90}
+    assert catalogue_read_preference(settings) == SecondaryPreferred(max_staleness=90)
+
+    settings['CATALOGUE_READ_PREFERENCE'] = 'primary'
+    assert catalogue_read_preference(settings) == Primary()
+    assert read_preference('nearest').max_staleness == -1
+
+def test_read_preference_rejects_bad_settings():
+    """Test unknown modes and staleness below the driver minimum fail early"""
+    with pytest.raises(ValueError):
+        read_preference('closest')
+    with pytest.raises(ValueError):
+        read_preference('secondaryPreferred', 30)
+
+def test_pool_stats_records_waits_and_connections():
+    """Test check-out waits and connection counts are tracked per address"""
+    stats = PoolStats()
+    stats.connection_created(monitoring.ConnectionCreatedEvent(ADDRESS, 1))
+    stats.connection_created(monitoring.ConnectionCreatedEvent(ADDRESS, 2))
+    stats.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(ADDRESS))
+    stats.connection_checked_out(monitoring.ConnectionCheckedOutEvent(ADDRESS, 1))
+
+    snapshot = stats.snapshot()
+    assert snapshot['open'] == {'db.example:27017': 2}
+    assert snapshot['in_use'] == {'db.example:27017': 1}
+    assert snapshot['checkouts'] == 1
+    assert stats.open_connections() == 2
+
+    stats.connection_checked_in(monitoring.ConnectionCheckedInEvent(ADDRESS, 1))
+    stats.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(ADDRESS))
+    stats.connection_check_out_failed(monitoring.ConnectionCheckOutFailedEvent(ADDRESS, 'timeout'))
+
+    assert stats.snapshot()['in_use'] == {'db.example:27017': 0}
+    rendered = registry.render()
+    assert 'mongo_pool_wait_seconds_bucket{address="db.example:27017",le="0.001"}' in rendered
+    assert 'mongo_pool_checkout_failures_total{address="db.example:27017",reason="timeout"} 1' in rendered
+
+def test_client_is_rebuilt_after_fork(monkeypatch):
+    """Test a forked worker gets its own client instead of the parent's"""
+    created = []
+
+    class FakeClient:
+        def __init__(self, uri, **kwargs):
+            self.kwargs = kwargs
+            created.append(self)
+
+        def __getitem__(self, name):
+            return (self, name)
+
+    app = create_app('testing')
+    monkeypatch.setattr(db, 'MongoClient', FakeClient)
+    mongo = ForkSafeMongo()
+    mongo.init_app(app)
+
+    pid = 1000
+    monkeypatch.setattr(db.os, 'getpid', lambda: pid)
+    assert mongo.db == (created[0], 'sweet_shop_test')
+    assert mongo.cx is created[0]
+    assert created[0].kwargs['connect'] is False
+
+    pid = 1001
+    assert mongo.cx is created[1]
+    assert len(created) == 2
+
+def test_warm_up_requires_init_app():
+    """Test warm-up is a no-op before the extension is configured"""
+    assert ForkSafeMongo().warm_up() is False
+
+def test_health_reports_pool(client):
+    """Test /api/health exposes the pool counters"""
+    response = client.get('/api/health')
+    data = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert set(data['mongo_pool']) == {'open', 'in_use', 'checkouts', 'wait_avg_ms', 'wait_max_ms'}
@@ -0,0 +1,224 @@
+import time
+import pytest
+from datetime import datetime, timedelta
+from bson import ObjectId
+from app import create_app
+from app.holds import sweeper
+from app.models import mongo, User, Sweet, Hold
+from config import config
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    app.config['TESTING'] = True
+
+    with app.app_context():
+        mongo.db.users.delete_many({})
+        mongo.db.sweets.delete_many({})
+        mongo.db.holds.delete_many({})
+        mongo.db.stock_shards.delete_many({})
+        User.create('user@test.com', 'password123', 'Regular User')
+        User.create('other@test.com', 'password123', 'Other User')
+
+        yield app
+
+        mongo.db.users.delete_many({})
+        mongo.db.sweets.delete_many({})
+        mongo.db.holds.delete_many({})
+        mongo.db.stock_shards.delete_many({})
+
+@pytest.fixture
+def client(app):
+    with app.test_client() as client:
+        yield client
+
+def login(client, email):
+    response = client.post('/api/auth/login', json={'email': email, 'password': 'password123'})
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+@pytest.fixture
+def user(client):
+    return login(client, 'user@test.com')
+
+def stock_of(sweet_id):
+    sweet = Sweet.to_dict(Sweet.find_by_id(sweet_id, cached=False))
+    return sweet['quantity'], sweet['on_hand']
+
+def expire_all():
+    mongo.db.holds.update_many({}, {'$set': {'expires_at': datetime.utcnow() - timedelta(seconds=1)}})
+
+def test_hold_takes_stock_off_sale(client, user):
+    """Test a hold lowers what is on sale but not what is on hand"""
+    fudge = Sweet.create('Fudge', 'Fudge', 1.5, 10)
+    toffee = Sweet.create('Toffee', 'Toffee', 2.0, 1)
+
+    response = client.post('/api/sweets/holds', json={'items': [
+        {'sweet_id': fudge['id'], 'quantity': 4}, {'sweet_id': toffee['id'], 'quantity': 1}
+    ]}, headers=user)
+    assert response.status_code == 201
+    hold = response.get_json()['hold']
+    assert hold['total'] == 8.0
+    assert [item['status'] for item in response.get_json()['items']] == ['held', 'held']
+
+    assert stock_of(fudge['id']) == (6, 10)
+    assert stock_of(toffee['id']) == (0, 1)
+    listed = {sweet['name']: sweet for sweet in Sweet.get_all()}
+    assert Sweet.to_dict(listed['Fudge'])['on_hand'] == 10
+    assert b'"on_hand":10' in Sweet.get_all_json()
+
+    # Held units cannot be bought by anyone else
+    assert Sweet.purchase(toffee['id'], 1) is None
+
+def test_hold_is_all_or_nothing(client, user):
+    """Test a short line leaves every sweet untouched"""
+    fudge = Sweet.create('Fudge', 'Fudge', 1.5, 10)
+    toffee = Sweet.create('Toffee', 'Toffee', 2.0, 1)
+
+    response = client.post('/api/sweets/holds', json={'items': [
+        {'sweet_id': fudge['id'], 'quantity': 4}, {'sweet_id': toffee['id'], 'quantity': 2}
+    ]}, headers=user)
+    assert response.status_code == 400
+    assert [item['status'] for item in response.get_json()['items']] == ['rolled_back', 'insufficient_stock']
+    assert stock_of(fudge['id']) == (10, 10)
+    assert mongo.db.holds.count_documents({}) == 0
+
+def test_confirm_sells_held_units_without_reading_sweets(client, user, monkeypatch):
+    """Test confirming drops the units from on hand using only the hold"""
+    fudge = Sweet.create('Fudge', 'Fudge', 1.5, 10)
+    hold = client.post('/api/sweets/holds', json=[{'sweet_id': fudge['id'], 'quantity': 4}],
+                       headers=user).get_json()['hold']
+
+    def no_reads(*args, **kwargs):
+        raise AssertionError('confirm read a sweet')
+    monkeypatch.setattr(Sweet, 'find_by_id', no_reads)
+    response = client.post(f'/api/sweets/holds/{hold["id"]}/confirm', headers=user)
+    monkeypatch.undo()
+
+    assert response.status_code == 200
+    assert response.get_json()['total'] == 6.0
+    assert stock_of(fudge['id']) == (6, 6)
+
+    # A hold can only be confirmed once
+    response = client.post(f'/api/sweets/holds/{hold["id"]}/confirm', headers=user)
+    assert response.status_code == 404
+
+def test_holds_belong_to_their_customer(client, user):
+    fudge = Sweet.create('Fudge', 'Fudge', 1.5, 10)
+    hold = client.post('/api/sweets/holds', json=[{'sweet_id': fudge['id'], 'quantity': 4}],
+                       headers=user).get_json()['hold']
+    other = login(client, 'other@test.com')
+
+    assert client.post(f'/api/sweets/holds/{hold["id"]}/confirm', headers=other).status_code == 404
+    assert client.delete(f'/api/sweets/holds/{hold["id"]}', headers=other).status_code == 404
+    assert stock_of(fudge['id']) == (6, 10)
+
+def test_cancel_puts_stock_back(client, user):
+    fudge = Sweet.create('Fudge', 'Fudge', 1.5, 10)
+    hold = client.post('/api/sweets/holds', json=[{'sweet_id': fudge['id'], 'quantity': 4}],
+                       headers=user).get_json()['hold']
+
+    assert client.delete(f'/api/sweets/holds/{hold["id"]}', headers=user).status_code == 200
+    assert stock_of(fudge['id']) == (10, 10)
+    assert client.delete(f'/api/sweets/holds/{hold["id"]}', headers=user).status_code == 404
+
+def test_expired_holds_are_released(client, user):
+    """Test an expired hold cannot be confirmed and the sweep puts it back on sale"""
+    fudge = Sweet.create('Fudge', 'Fudge', 1.5, 10)
+    hold = client.post('/api/sweets/holds', json=[{'sweet_id': fudge['id'], 'quantity': 4}],
+                       headers=user).get_json()['hold']
+    assert Hold.release_expired() == 0
+
+    expire_all()
+    response = client.post(f'/api/sweets/holds/{hold["id"]}/confirm', headers=user)
+    assert response.status_code == 410
+    assert stock_of(fudge['id']) == (6, 10)
+
+    assert Hold.release_expired() == 1
+    assert stock_of(fudge['id']) == (10, 10)
+    assert Hold.release_expired() == 0
+
+def test_open_holds_are_capped_per_customer(client, user, app):
+    """Test a customer cannot park more stock once at HOLD_MAX_ACTIVE_PER_USER open holds"""
+    assert 'inventory.create_hold' in app.config['RATELIMITS']
+    fudge = Sweet.create('Fudge', 'Fudge', 1.5, 10)
+    for _ in range(sweeper.max_active):
+        response = client.post('/api/sweets/holds', json=[{'sweet_id': fudge['id'], 'quantity': 1}], headers=user)
+        assert response.status_code == 201
+
+    response = client.post('/api/sweets/holds', json=[{'sweet_id': fudge['id'], 'quantity': 1}], headers=user)
+    assert response.status_code == 400
+    assert 'open holds' in response.get_json()['error']
+    assert stock_of(fudge['id']) == (10 - sweeper.max_active, 10)
+
+    # Expired holds no longer count, nor do other customers' holds
+    other = login(client, 'other@test.com')
+    assert client.post('/api/sweets/holds', json=[{'sweet_id': fudge['id'], 'quantity': 1}],
+                       headers=other).status_code == 201
+    expire_all()
+    assert client.post('/api/sweets/holds', json=[{'sweet_id': fudge['id'], 'quantity': 1}],
+                       headers=user).status_code == 201
+
+def test_confirm_skips_deleted_sweets(client, user):
+    """Test confirming sells nothing for sweets deleted while they were held"""
+    fudge = Sweet.create('Fudge', 'Fudge', 1.5, 10)
+    toffee = Sweet.create('Toffee', 'Toffee', 2.0, 5)
+    lines = [{'sweet_id': fudge['id'], 'quantity': 2}, {'sweet_id': toffee['id'], 'quantity': 1}]
+    hold = client.post('/api/sweets/holds', json=lines, headers=user).get_json()['hold']
+    mongo.db.sweets.delete_one({'_id': ObjectId(toffee['id'])})
+
+    response = client.post(f'/api/sweets/holds/{hold["id"]}/confirm', headers=user)
+    assert response.status_code == 200
+    assert [item['name'] for item in response.get_json()['items']] == ['Fudge']
+    assert response.get_json()['total'] == 3.0
+
+    hold = client.post('/api/sweets/holds', json=lines[:1], headers=user).get_json()['hold']
+    mongo.db.sweets.delete_one({'_id': ObjectId(fudge['id'])})
+    response = client.post(f'/api/sweets/holds/{hold["id"]}/confirm', headers=user)
+    assert response.status_code == 410
+
+def test_release_expired_command(app):
+    fudge = Sweet.create('Fudge', 'Fudge', 1.5, 10)
+    Hold.create('someone', [(fudge['id'], 3)])
+    expire_all()
+
+    result = app.test_cli_runner().invoke(args=['release-expired-holds'])
+    assert 'Released 1 expired holds' in result.output
+    assert stock_of(fudge['id']) == (10, 10)
+
+def test_hold_on_sharded_sweet(app):
+    """Test holds gather units from stock counters and keep the total intact"""
+    fudge = Sweet.create('Fudge', 'Fudge', 1.5, 10)
+    Sweet.shard_stock(fudge['id'], 4)
+
+    hold, _ = Hold.create('someone', [(fudge['id'], 7)])
+    assert hold
+    assert stock_of(fudge['id']) == (3, 10)
+
+    Hold.release(str(hold['_id']), 'someone')
+    assert stock_of(fudge['id']) == (10, 10)
+    assert mongo.db.sweets.find_one({'_id': ObjectId(fudge['id'])})['reserved'] == 0
+
+def test_sweeper_releases_in_the_background(app, monkeypatch):
+    """Test the sweeper started by the first request puts expired stock back"""
+    fudge = Sweet.create('Fudge', 'Fudge', 1.5, 10)
+    # Held by another worker, so this one never calls Hold.create
+    Hold.create('someone', [(fudge['id'], 3)])
+    expire_all()
+
+    monkeypatch.setattr(config['testing'], 'HOLD_SWEEPER_ENABLED', True)
+    monkeypatch.setattr(config['testing'], 'HOLD_SWEEP_INTERVAL', 0.01)
+    try:
+        # A preloading gunicorn master runs create_app and must not own the thread
+        app = create_app('testing')
+        assert sweeper._thread is None
+
+        with app.test_client() as client:
+            client.get('/')
+        assert sweeper._thread is not None
+        deadline = time.monotonic() + 5
+        while mongo.db.holds.count_documents({}) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert stock_of(fudge['id']) == (10, 10)
+    finally:
+        sweeper.close()
+        sweeper.enabled = False
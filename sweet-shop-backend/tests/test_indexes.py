@@ -0,0 +1,38 @@
+import pytest
+from app import create_app
+from app.indexes import ensure_indexes, verify_indexes, IndexVerificationError
+from app.models import mongo, User, Sweet
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    app.config['TESTING'] = True
+
+    with app.app_context():
+        mongo.db.users.delete_many({})
+        mongo.db.sweets.delete_many({})
+        yield app
+        mongo.db.users.delete_many({})
+        mongo.db.sweets.delete_many({})
+
+def test_hot_queries_use_indexes(app):
+    """Test every hot query is served by an index after bootstrap"""
+    ensure_indexes()
+    verify_indexes()
+
+def test_verify_fails_without_indexes(app):
+    """Test the self-check fails loudly on a collection scan"""
+    mongo.db.sweets.drop_indexes()
+    try:
+        with pytest.raises(IndexVerificationError):
+            verify_indexes()
+    finally:
+        ensure_indexes()
+
+def test_unique_indexes_reject_duplicates(app):
+    """Test duplicate emails and sweet names are rejected by the indexes"""
+    assert User.create('user@test.com', 'password123', 'Test User')
+    assert User.create('user@test.com', 'password456', 'Other User') is None
+
+    assert Sweet.create('Chocolate Bar', 'Chocolate', 2.99, 10)
+    assert Sweet.create('Chocolate Bar', 'Chocolate', 3.99, 5) is None
@@ -0,0 +1,163 @@
+import pytest
+import json
+import time
+import threading
+from app import create_app
+from app.models import mongo, User, Sweet
+
+STRESS_THREADS = 16
+STRESS_ATTEMPTS_PER_THREAD = 25
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    app.config['TESTING'] = True
+
+    with app.app_context():
+        mongo.db.users.delete_many({})
+        mongo.db.sweets.delete_many({})
+
+        # Create test users
+        User.create('user@test.com', 'password123', 'Test User', 'customer')
+        User.create('admin@test.com', 'password123', 'Admin User', 'admin')
+
+        yield app
+
+        mongo.db.users.delete_many({})
+        mongo.db.sweets.delete_many({})
+
+@pytest.fixture
+def client(app):
+    with app.test_client() as client:
+        yield client
+
+def get_auth_token(client, email, password):
+    """Helper to get auth token"""
+    response = client.post('/api/auth/login',
+                          json={'email': email, 'password': password})
+    data = json.loads(response.data)
+    return data['token']
+
+def legacy_purchase(sweet_id, quantity):
+    """Read, check in Python, then write - the pre-atomic purchase path"""
+    sweet = Sweet.find_by_id(sweet_id)
+    if not sweet or sweet['quantity'] < quantity:
+        return None
+    return Sweet.update(sweet_id, {'quantity': sweet['quantity'] - quantity})
+
+def run_purchase_storm(app, purchase, sweet_id):
+    """Hammer one sweet from many threads, return (successes, elapsed seconds)"""
+    successes = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(STRESS_THREADS)
+
+    def buyer():
+        with app.app_context():
+            barrier.wait()
+            for _ in range(STRESS_ATTEMPTS_PER_THREAD):
+                if purchase(sweet_id, 1):
+                    with lock:
+                        successes.append(1)
+
+    threads = [threading.Thread(target=buyer) for _ in range(STRESS_THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(successes), time.perf_counter() - start
+
+def test_purchase_sweet(client):
+    """Test purchasing decrements stock"""
+    token = get_auth_token(client, 'user@test.com', 'password123')
+    sweet = Sweet.create('Chocolate Bar', 'Chocolate', 2.99, 10)
+
+    response = client.post(f'/api/sweets/{sweet["id"]}/purchase',
+                          json={'quantity': 3},
+                          headers={'Authorization': f'Bearer {token}'})
+
+    data = json.loads(response.data)
+    assert response.status_code == 200
+    assert data['sweet']['quantity'] == 7
+
+def test_purchase_insufficient_stock(client):
+    """Test purchasing more than available leaves stock untouched"""
+    token = get_auth_token(client, 'user@test.com', 'password123')
+    sweet = Sweet.create('Chocolate Bar', 'Chocolate', 2.99, 2)
+
+    response = client.post(f'/api/sweets/{sweet["id"]}/purchase',
+                          json={'quantity': 3},
+                          headers={'Authorization': f'Bearer {token}'})
+
+    data = json.loads(response.data)
+    assert response.status_code == 400
+    assert data['error'] == 'Not enough stock. Available: 2'
+    assert Sweet.find_by_id(sweet['id'])['quantity'] == 2
+
+def test_purchase_nonexistent_sweet(client):
+    """Test purchasing an unknown sweet"""
+    token = get_auth_token(client, 'user@test.com', 'password123')
+
+    response = client.post('/api/sweets/000000000000000000000000/purchase',
+                          json={'quantity': 1},
+                          headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == 404
+
+def test_concurrent_purchases_never_oversell(app):
+    """Stress test: many threads buying the same sweet must not oversell"""
+    stock = STRESS_THREADS * STRESS_ATTEMPTS_PER_THREAD // 2
+    atomic_sweet = Sweet.create('Atomic Toffee', 'Toffee', 1.00, stock)
+    legacy_sweet = Sweet.create('Legacy Toffee', 'Toffee', 1.00, stock)
+
+    sold, atomic_elapsed = run_purchase_storm(app, Sweet.purchase, atomic_sweet['id'])
+    legacy_sold, legacy_elapsed = run_purchase_storm(app, legacy_purchase, legacy_sweet['id'])
+
+    assert sold == stock
+    assert Sweet.find_by_id(atomic_sweet['id'])['quantity'] == 0
+
+    attempts = STRESS_THREADS * STRESS_ATTEMPTS_PER_THREAD
+    print(f"\natomic purchase: {attempts / atomic_elapsed:.0f} attempts/s, sold {sold}/{stock}")
+    print(f"legacy purchase: {attempts / legacy_elapsed:.0f} attempts/s, sold {legacy_sold}/{stock}, "
+          f"final stock {Sweet.find_by_id(legacy_sweet['id'])['quantity']}")
+
+def test_checkout_multiple_items(client):
+    """Test checking out a cart purchases every line"""
+    token = get_auth_token(client, 'user@test.com', 'password123')
+    chocolate = Sweet.create('Chocolate Bar', 'Chocolate', 2.50, 10)
+    gummies = Sweet.create('Gummy Bears', 'Gummies', 1.00, 5)
+
+    response = client.post('/api/sweets/checkout',
+                          json={'items': [
+                              {'sweet_id': chocolate['id'], 'quantity': 2},
+                              {'sweet_id': gummies['id'], 'quantity': 5}
+                          ]},
+                          headers={'Authorization': f'Bearer {token}'})
+
+    data = json.loads(response.data)
+    assert response.status_code == 200
+    assert [item['status'] for item in data['items']] == ['purchased', 'purchased']
+    assert data['total'] == 10.00
+    assert Sweet.find_by_id(chocolate['id'])['quantity'] == 8
+    assert Sweet.find_by_id(gummies['id'])['quantity'] == 0
+
+def test_checkout_rolls_back_on_short_stock(client):
+    """Test one short line cancels the whole order"""
+    token = get_auth_token(client, 'user@test.com', 'password123')
+    chocolate = Sweet.create('Chocolate Bar', 'Chocolate', 2.50, 10)
+    gummies = Sweet.create('Gummy Bears', 'Gummies', 1.00, 1)
+
+    response = client.post('/api/sweets/checkout',
+                          json=[
+                              {'sweet_id': chocolate['id'], 'quantity': 2},
+                              {'sweet_id': gummies['id'], 'quantity': 3}
+                          ],
+                          headers={'Authorization': f'Bearer {token}'})
+
+    data = json.loads(response.data)
+    assert response.status_code == 400
+    assert data['items'][0]['status'] == 'rolled_back'
+    assert data['items'][1]['status'] == 'insufficient_stock'
+    assert data['items'][1]['available'] == 1
+    assert Sweet.find_by_id(chocolate['id'])['quantity'] == 10
+    assert not mongo.db.sweets.find_one({'name': 'Chocolate Bar'}).get('pending_checkouts')
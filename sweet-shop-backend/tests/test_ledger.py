@@ -0,0 +1,204 @@
+import pytest
+import time
+import threading
+from types import SimpleNamespace
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, BulkWriteError
+from app import create_app
+from app.ledger import Ledger, ledger, tail
+from app.models import mongo, User, Sweet
+
+def ledger_config(**overrides):
+    config = {
+        'LEDGER_ENABLED': True,
+        'LEDGER_QUEUE_SIZE': 100,
+        'LEDGER_BATCH_SIZE': 10,
+        'LEDGER_FLUSH_INTERVAL': 0.05,
+        'LEDGER_SHUTDOWN_TIMEOUT': 5
+    }
+    config.update(overrides)
+    return SimpleNamespace(config=config)
+
+class Recorder:
+    """Stands in for insert_many, optionally failing the first calls"""
+
+    def __init__(self, failures=()):
+        self.batches = []
+        self.failures = list(failures)
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, movements):
+        self.release.wait()
+        if self.failures:
+            raise self.failures.pop(0)
+        self.batches.append(list(movements))
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    app.config['TESTING'] = True
+
+    with app.app_context():
+        mongo.db.users.delete_many({})
+        mongo.db.sweets.delete_many({})
+        mongo.db.inventory_movements.delete_many({})
+        User.create('user@test.com', 'password123', 'Test User', 'customer')
+        User.create('admin@test.com', 'password123', 'Admin User', 'admin')
+
+        yield app
+
+        ledger.flush()
+        mongo.db.users.delete_many({})
+        mongo.db.sweets.delete_many({})
+        mongo.db.inventory_movements.delete_many({})
+
+def login(client, email):
+    response = client.post('/api/auth/login', json={'email': email, 'password': 'password123'})
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+def test_movements_are_written_in_bounded_batches():
+    """Test a burst is split into batches of at most LEDGER_BATCH_SIZE"""
+    writes = Recorder()
+    book = Ledger()
+    book.init_app(ledger_config(), writes)
+    sweet_id = ObjectId()
+
+    for _ in range(25):
+        book.record(sweet_id, -1, 'user', 'purchase')
+    assert book.flush()
+
+    assert sum(len(batch) for batch in writes.batches) == 25
+    assert max(len(batch) for batch in writes.batches) <= 10
+    movement = writes.batches[0][0]
+    assert movement['sweet_id'] == sweet_id
+    assert movement['delta'] == -1
+    assert movement['user_id'] == 'user'
+    assert movement['reason'] == 'purchase'
+    book.close()
+
+def test_partial_batch_is_written_after_flush_interval():
+    """Test movements do not wait for a full batch"""
+    writes = Recorder()
+    book = Ledger()
+    book.init_app(ledger_config(LEDGER_BATCH_SIZE=1000), writes)
+
+    book.record(ObjectId(), 5, 'admin', 'restock')
+    deadline = time.monotonic() + 2
+    while not writes.batches and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert len(writes.batches) == 1
+    book.close()
+
+def test_close_writes_everything_queued():
+    """Test the shutdown flush drains the queue"""
+    writes = Recorder()
+    book = Ledger()
+    book.init_app(ledger_config(LEDGER_FLUSH_INTERVAL=60, LEDGER_BATCH_SIZE=1000), writes)
+
+    for _ in range(7):
+        book.record(ObjectId(), -2)
+    book.close()
+
+    assert sum(len(batch) for batch in writes.batches) == 7
+
+def test_full_queue_drops_instead_of_blocking():
+    """Test record() never waits on a stalled writer"""
+    writes = Recorder()
+    writes.release.clear()
+    book = Ledger()
+    book.init_app(ledger_config(LEDGER_QUEUE_SIZE=5, LEDGER_BATCH_SIZE=1), writes)
+
+    start = time.monotonic()
+    for _ in range(50):
+        book.record(ObjectId(), -1)
+    assert time.monotonic() - start < 1
+
+    writes.release.set()
+    book.close()
+    # One movement held by the stalled writer plus a full queue
+    assert sum(len(batch) for batch in writes.batches) <= 6
+
+def test_failed_writes_are_retried_without_duplicates():
+    """Test retries resend only the movements that did not make it in"""
+    partial = BulkWriteError({'writeErrors': [
+        {'index': 0, 'code': 11000, 'errmsg': 'duplicate key'},
+        {'index': 1, 'code': 91, 'errmsg': 'shutdown in progress'}
+    ]})
+    writes = Recorder(failures=[AutoReconnect('primary stepped down'), partial])
+    book = Ledger()
+    book.init_app(ledger_config(), writes)
+
+    first, second = ObjectId(), ObjectId()
+    book.record(first, -1)
+    book.record(second, -1)
+    assert book.flush()
+
+    assert [[movement['sweet_id'] for movement in batch] for batch in writes.batches] == [[second]]
+    book.close()
+
+def test_disabled_ledger_records_nothing():
+    """Test LEDGER_ENABLED=False turns record() into a no-op"""
+    writes = Recorder()
+    book = Ledger()
+    book.init_app(ledger_config(LEDGER_ENABLED=False), writes)
+
+    book.record(ObjectId(), -1)
+    assert book.flush()
+    assert writes.batches == []
+
+def test_stock_changes_are_recorded(app):
+    """Test purchases, checkouts and restocks land in inventory_movements"""
+    client = app.test_client()
+    sweet = Sweet.create('Ledger Fudge', 'Fudge', 2.5, 10)
+    customer = login(client, 'user@test.com')
+    admin = login(client, 'admin@test.com')
+
+    client.post(f"/api/sweets/{sweet['id']}/purchase", json={'quantity': 3}, headers=customer)
+    client.post('/api/sweets/checkout', json={'items': [{'sweet_id': sweet['id'], 'quantity': 2}]},
+                headers=customer)
+    client.post(f"/api/sweets/{sweet['id']}/restock", json={'quantity': 20}, headers=admin)
+    # A purchase that fails changes no stock and records nothing
+    client.post(f"/api/sweets/{sweet['id']}/purchase", json={'quantity': 1000}, headers=customer)
+    assert ledger.flush()
+
+    movements = list(mongo.db.inventory_movements.find({'sweet_id': ObjectId(sweet['id'])}).sort('_id', 1))
+    assert [(m['reason'], m['delta']) for m in movements] == [
+        ('purchase', -3), ('checkout', -2), ('restock', 20)
+    ]
+    user = User.find_by_email('user@test.com')
+    assert movements[0]['user_id'] == user['id']
+    assert 10 + sum(m['delta'] for m in movements) == Sweet.find_by_id(sweet['id'], cached=False)['quantity']
+
+def test_adjustment_excludes_sales_made_during_the_edit(app, monkeypatch):
+    """Test a quantity edit records only what it changed, not a sale that raced it"""
+    client = app.test_client()
+    sweet = Sweet.create('Ledger Fudge', 'Fudge', 2.5, 10)
+    admin = login(client, 'admin@test.com')
+    update = Sweet.update
+
+    def sell_first(*args, **kwargs):
+        # Lands after update_sweet read the sweet, before it writes
+        Sweet.purchase(sweet['id'], 3)
+        return update(*args, **kwargs)
+    monkeypatch.setattr(Sweet, 'update', sell_first)
+
+    response = client.put(f"/api/sweets/{sweet['id']}", json={'quantity': 20}, headers=admin)
+    assert response.status_code == 200
+    assert ledger.flush()
+
+    movements = list(mongo.db.inventory_movements.find({'sweet_id': ObjectId(sweet['id'])}))
+    assert [(m['reason'], m['delta']) for m in movements] == [('adjustment', 13)]
+
+def test_tail_follows_the_ledger(app):
+    """Test tail() yields earlier movements, then new ones as they are written"""
+    sweet_id = ObjectId()
+    collection = mongo.db.inventory_movements
+    collection.insert_many([Ledger.movement(sweet_id, -1), Ledger.movement(sweet_id, -2)])
+
+    stream = tail(collection, poll_interval=0.01)
+    assert [next(stream)['delta'], next(stream)['delta']] == [-1, -2]
+
+    collection.insert_one(Ledger.movement(sweet_id, 4))
+    assert next(stream)['delta'] == 4
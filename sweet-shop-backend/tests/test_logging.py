@@ -0,0 +1,53 @@
+import json
+import logging
+from app import create_app
+from app.log import JSONFormatter, RedactingFilter, SamplingFilter
+
+def make_record(msg, args=None, **extra):
+    record = logging.LogRecord('app.test', logging.INFO, __file__, 1, msg, args, None)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+def test_json_formatter_includes_extra_fields():
+    """Test records become one JSON object with their extra= fields"""
+    record = make_record('Login successful', user_id='abc', request_id='req-1')
+
+    entry = json.loads(JSONFormatter().format(record))
+
+    assert entry['message'] == 'Login successful'
+    assert entry['level'] == 'INFO'
+    assert entry['user_id'] == 'abc'
+    assert entry['request_id'] == 'req-1'
+
+def test_redacting_filter_masks_sensitive_fields():
+    """Test passwords and tokens never reach the log line"""
+    record = make_record('Payload %s', ({'email': 'a@b.c', 'password': 'secret'},),
+                         token='abc', payload={'nested': {'Password': 'secret'}})
+
+    RedactingFilter(['password', 'token']).filter(record)
+    line = JSONFormatter().format(record)
+
+    assert 'secret' not in line
+    assert 'abc' not in line
+    assert 'a@b.c' in line
+
+def test_sampling_filter_drops_by_level():
+    """Test a zero sample rate suppresses a level entirely"""
+    sampler = SamplingFilter({'DEBUG': 0.0})
+    debug = make_record('noisy')
+    debug.levelno = logging.DEBUG
+
+    assert not sampler.filter(debug)
+    assert sampler.filter(make_record('kept'))
+
+def test_request_id_header():
+    """Test every response carries a request id, echoing the client's"""
+    app = create_app('testing')
+
+    with app.test_client() as client:
+        generated = client.get('/api/health').headers['X-Request-ID']
+        echoed = client.get('/api/health', headers={'X-Request-ID': 'abc-123'}).headers['X-Request-ID']
+
+    assert generated
+    assert echoed == 'abc-123'
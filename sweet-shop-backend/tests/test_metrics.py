@@ -0,0 +1,33 @@
+from app import create_app
+from app.metrics import Registry
+
+def test_histogram_renders_cumulative_buckets():
+    """Test histogram buckets are cumulative with sum and count"""
+    registry = Registry()
+    latency = registry.histogram('latency_seconds', 'Latency', labels=('route',), buckets=(0.1, 1.0))
+    latency.observe(0.05, '/a')
+    latency.observe(0.5, '/a')
+    latency.observe(5.0, '/a')
+
+    text = registry.render()
+
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{route="/a",le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{route="/a"} 3' in text
+    assert 'latency_seconds_sum{route="/a"} 5.55' in text
+
+def test_metrics_endpoint_counts_requests():
+    """Test requests are labelled by URL rule and exposed at /api/metrics"""
+    app = create_app('testing')
+
+    with app.test_client() as client:
+        client.get('/api/health')
+        client.get('/api/health')
+        response = client.get('/api/metrics')
+
+    text = response.data.decode('utf-8')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert 'http_requests_total{method="GET",route="/api/health",status="200"}' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/api/health",le="+Inf"}' in text
@@ -0,0 +1,59 @@
+import pytest
+import json
+from app import create_app
+from app.models import mongo, passwords, User
+from app.passwords import PasswordHasher, HasherBusy, hash_password
+
+@pytest.fixture
+def client():
+    app = create_app('testing')
+    app.config['TESTING'] = True
+
+    with app.test_client() as client:
+        with app.app_context():
+            mongo.db.users.delete_many({})
+            User.create('user@test.com', 'password123', 'Test User', 'customer')
+            yield client
+            mongo.db.users.delete_many({})
+
+def saturate(hasher):
+    """Take every pending slot so the next hash is shed"""
+    _, slots = hasher._pool()
+    for _ in range(hasher.max_pending):
+        slots.acquire()
+    return slots
+
+def test_hasher_round_trip():
+    """Test hashes made on the pool verify on the pool"""
+    hasher = PasswordHasher()
+    hasher.rounds = 4
+    pw_hash = hasher.hash('password123')
+
+    assert hasher.check(pw_hash, 'password123')
+    assert not hasher.check(pw_hash, 'wrongpassword')
+    assert hasher.check(hash_password('password123', 4), 'password123')
+    hasher.shutdown()
+
+def test_hasher_sheds_load_when_full():
+    """Test a full pool raises HasherBusy instead of queuing"""
+    hasher = PasswordHasher()
+    hasher.max_pending = 2
+    saturate(hasher)
+
+    with pytest.raises(HasherBusy):
+        hasher.hash('password123')
+    hasher.shutdown()
+
+def test_login_overloaded_returns_503(client):
+    """Test login answers 503 with Retry-After when bcrypt is saturated"""
+    slots = saturate(passwords)
+    try:
+        response = client.post('/api/auth/login',
+                              json={'email': 'user@test.com', 'password': 'password123'})
+    finally:
+        for _ in range(passwords.max_pending):
+            slots.release()
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert 'error' in json.loads(response.data)
@@ -0,0 +1,136 @@
+import pytest
+import json
+import asyncio
+from app import create_app
+from app.asgi import create_asgi_app
+from app.asgi import ratelimit as asgi_ratelimit
+from app.models import mongo, User, Sweet
+from app.ratelimit import Limit, MemoryBackend, MongoBackend, limiter, parse_limit
+
+def enable(app, **limits):
+    app.config['RATELIMIT_ENABLED'] = True
+    app.config['RATELIMITS'] = limits
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    app.config['TESTING'] = True
+
+    with app.app_context():
+        mongo.db.users.delete_many({})
+        mongo.db.sweets.delete_many({})
+        mongo.db.rate_limits.delete_many({})
+        User.create('user@test.com', 'password123', 'Test User', 'customer')
+        User.create('other@test.com', 'password123', 'Other User', 'customer')
+
+        yield app
+
+        mongo.db.users.delete_many({})
+        mongo.db.sweets.delete_many({})
+        mongo.db.rate_limits.delete_many({})
+
+def login(client, email='user@test.com'):
+    return client.post('/api/auth/login', json={'email': email, 'password': 'password123'})
+
+def test_parse_limit():
+    """Test 'count/period' strings become bucket sizes and refill rates"""
+    assert parse_limit('10/minute') == Limit(rate=10 / 60, capacity=10)
+    assert parse_limit('5/second') == Limit(rate=5, capacity=5)
+    for value in ('10', 'ten/minute', '10/fortnight', '0/minute'):
+        with pytest.raises(ValueError):
+            parse_limit(value)
+
+def test_memory_bucket_bursts_then_refills():
+    """Test a burst up to capacity, then one request per refill interval"""
+    now = [0.0]
+    backend = MemoryBackend(clock=lambda: now[0])
+    limit = parse_limit('3/minute')
+
+    assert [backend.consume('k', limit) for _ in range(3)] == [0, 0, 0]
+    assert backend.consume('k', limit) == pytest.approx(20)
+
+    now[0] += 20
+    assert backend.consume('k', limit) == 0
+    assert backend.consume('other', limit) == 0
+
+def test_memory_backend_is_bounded():
+    """Test least recently used buckets are dropped"""
+    backend = MemoryBackend(maxsize=2)
+    limit = parse_limit('1/hour')
+    for key in ('a', 'b', 'c'):
+        backend.consume(key, limit)
+
+    # 'a' was evicted, so it starts with a full bucket again
+    assert backend.consume('a', limit) == 0
+    assert backend.consume('c', limit) > 0
+
+def test_login_limited_by_ip(app):
+    """Test floods of logins get 429 with Retry-After"""
+    enable(app, **{'auth.login': '2/minute'})
+    limiter.init_app(app)
+
+    with app.test_client() as client:
+        assert login(client).status_code == 200
+        assert login(client, 'other@test.com').status_code == 200
+        response = login(client)
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '30'
+    assert json.loads(response.data) == {'error': 'Too many requests, please try again later'}
+
+def test_purchase_limited_per_identity(app):
+    """Test authenticated callers each get their own bucket"""
+    sweet = Sweet.create('Fudge', 'Fudge', 1.50, 10)
+    with app.test_client() as client:
+        tokens = [json.loads(login(client, email).data)['token'] for email in ('user@test.com', 'other@test.com')]
+
+        enable(app, **{'inventory.purchase_sweet': '1/minute'})
+        limiter.init_app(app)
+
+        def purchase(token):
+            return client.post(f'/api/sweets/{sweet["id"]}/purchase', json={'quantity': 1},
+                               headers={'Authorization': f'Bearer {token}'})
+
+        assert purchase(tokens[0]).status_code == 200
+        assert purchase(tokens[0]).status_code == 429
+        assert purchase(tokens[1]).status_code == 200
+
+def test_unlisted_endpoints_are_not_limited(app):
+    enable(app, **{'auth.login': '1/minute'})
+    limiter.init_app(app)
+
+    with app.test_client() as client:
+        for _ in range(3):
+            assert client.get('/api/sweets').status_code == 200
+
+def test_asgi_login_limited(app):
+    """Test the ASGI app answers 429 the same way"""
+    asgi_app = create_asgi_app('testing')
+    enable(asgi_app, **{'auth.login': '1/minute'})
+    asgi_ratelimit.init_app(asgi_app)
+
+    async def logins():
+        async with asgi_app.test_app():
+            client = asgi_app.test_client()
+            statuses = []
+            for _ in range(2):
+                response = await client.post('/api/auth/login', json={
+                    'email': 'user@test.com', 'password': 'password123'
+                })
+                statuses.append(response.status_code)
+            return statuses, response.headers['Retry-After']
+
+    statuses, retry_after = asyncio.run(logins())
+    assert statuses == [200, 429]
+    assert retry_after == '60'
+
+def test_mongo_buckets_are_shared(app):
+    """Test workers sharing the Mongo backend draw from one bucket"""
+    limit = parse_limit('3/minute')
+    workers = [MongoBackend(lambda: mongo.db.rate_limits) for _ in range(2)]
+
+    waits = [workers[index % 2].consume('auth.login:ip:10.0.0.1', limit) for index in range(4)]
+
+    assert waits[:3] == [0, 0, 0]
+    assert waits[3] == pytest.approx(20, abs=1)
+    assert mongo.db.rate_limits.find_one({'_id': 'auth.login:ip:10.0.0.1'})['expires_at']
@@ -0,0 +1,31 @@
+import json
+from datetime import datetime
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+from app import create_app
+from app.models import Sweet
+from app.serialization import FastJSONProvider, dumps
+
+def test_dumps_matches_to_dict():
+    """Test raw documents encode the same as Sweet.to_dict output"""
+    now = datetime(2024, 1, 2, 3, 4, 5, 123000)
+    sweet = {'id': 'abc', 'name': 'Toffee', 'category': 'Toffee', 'price': 1.5,
+             'quantity': 3, 'on_hand': 3, 'version': 2, 'created_at': now, 'updated_at': now}
+
+    assert json.loads(dumps(sweet)) == Sweet.to_dict(sweet)
+
+def test_dumps_object_id():
+    """Test ObjectIds are written as strings"""
+    obj_id = ObjectId()
+
+    assert json.loads(dumps({'_id': obj_id})) == {'_id': str(obj_id)}
+
+def test_fast_provider_matches_default():
+    """Test the fast provider keeps Flask's response encoding"""
+    app = create_app('testing')
+    payload = {'b': 1, 'a': [1.5, 'x', None], 'when': datetime(2024, 1, 2, 3, 4, 5)}
+
+    fast = FastJSONProvider(app).dumps(payload)
+    default = DefaultJSONProvider(app).dumps(payload)
+
+    assert json.loads(fast) == json.loads(default)
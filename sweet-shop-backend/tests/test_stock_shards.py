@@ -0,0 +1,208 @@
+import pytest
+from bson import ObjectId
+from app import create_app
+from app.models import mongo, User, Sweet
+from app.stock import split, stock
+from app.validation import ValidationError, parse_shards
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    app.config['TESTING'] = True
+
+    with app.app_context():
+        mongo.db.users.delete_many({})
+        mongo.db.sweets.delete_many({})
+        mongo.db.stock_shards.delete_many({})
+        User.create('admin@test.com', 'password123', 'Admin User', 'admin')
+        User.create('user@test.com', 'password123', 'Regular User')
+
+        yield app
+
+        mongo.db.users.delete_many({})
+        mongo.db.sweets.delete_many({})
+        mongo.db.stock_shards.delete_many({})
+
+@pytest.fixture
+def client(app):
+    with app.test_client() as client:
+        yield client
+
+def login(client, email):
+    response = client.post('/api/auth/login', json={'email': email, 'password': 'password123'})
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+@pytest.fixture
+def admin(client):
+    return login(client, 'admin@test.com')
+
+@pytest.fixture
+def user(client):
+    return login(client, 'user@test.com')
+
+def counters(sweet_id):
+    return sorted(counter['quantity'] for counter in mongo.db.stock_shards.find({'sweet_id': ObjectId(sweet_id)}))
+
+def on_hand(sweet_id):
+    pool = mongo.db.sweets.find_one({'_id': ObjectId(sweet_id)})['quantity']
+    return pool + sum(counters(sweet_id))
+
+def test_split_spreads_evenly():
+    """Test whole units are spread with the remainder on the first counters"""
+    assert split(10, 4) == [3, 3, 2, 2]
+    assert split(0, 3) == [0, 0, 0]
+    assert sum(split(1001, 8)) == 1001
+
+def test_sharding_moves_stock_into_counters(client, admin):
+    """Test enabling shards empties the pool and keeps the reported stock"""
+    sweet = Sweet.create('Fudge', 'Fudge', 1.0, 10)
+
+    response = client.put(f'/api/sweets/{sweet["id"]}/shards', json={'shards': 4}, headers=admin)
+    assert response.status_code == 200
+    assert response.get_json()['sweet']['quantity'] == 10
+    assert response.get_json()['shards'] == 4
+    assert counters(sweet['id']) == [2, 2, 3, 3]
+    assert mongo.db.sweets.find_one({'_id': ObjectId(sweet['id'])})['quantity'] == 0
+
+    response = client.put('/api/sweets/64b000000000000000000000/shards', json={'shards': 4}, headers=admin)
+    assert response.status_code == 404
+    response = client.put(f'/api/sweets/{sweet["id"]}/shards', json={'shards': 1}, headers=admin)
+    assert response.status_code == 400
+
+def test_purchases_keep_every_view_in_step(app):
+    """Test listings, pages, search and lookups all report pool plus counters"""
+    sweet = Sweet.create('Fudge', 'Fudge', 1.0, 10)
+    Sweet.shard_stock(sweet['id'], 4)
+
+    for _ in range(3):
+        assert Sweet.purchase(sweet['id'], 1)['quantity'] < 10
+    version = Sweet.find_by_id(sweet['id'], cached=False)['version']
+    Sweet.purchase(sweet['id'], 2)
+
+    assert on_hand(sweet['id']) == 5
+    # Sales from counters leave the catalogue document alone; ETags still
+    # change, see test_etags_change_with_sharded_sales
+    assert Sweet.find_by_id(sweet['id'], cached=False)['version'] == version
+    assert Sweet.to_dict(Sweet.find_by_id(sweet['id'], cached=False))['quantity'] == 5
+    assert Sweet.get_all()[0]['quantity'] == 5
+    assert b'"quantity":5' in Sweet.get_all_json()
+    assert Sweet.get_page(limit=10)[0][0]['quantity'] == 5
+    assert Sweet.search(name='fud')[0]['quantity'] == 5
+
+def test_purchase_refills_from_the_pool_after_restock(app):
+    """Test a restock lands in the pool and later sales draw it into counters"""
+    sweet = Sweet.create('Fudge', 'Fudge', 1.0, 4)
+    Sweet.shard_stock(sweet['id'], 2)
+    Sweet.purchase(sweet['id'], 4)
+    assert Sweet.purchase(sweet['id'], 1) is None
+
+    assert Sweet.restock(sweet['id'], 10)['quantity'] == 10
+    assert Sweet.purchase(sweet['id'], 3)['quantity'] == 7
+    assert sum(counters(sweet['id'])) > 0
+    assert on_hand(sweet['id']) == 7
+
+def test_sold_out_sharded_sweet(client, user):
+    """Test a purchase larger than all counters together is refused untouched"""
+    sweet = Sweet.create('Fudge', 'Fudge', 1.0, 5)
+    Sweet.shard_stock(sweet['id'], 4)
+
+    response = client.post(f'/api/sweets/{sweet["id"]}/purchase', json={'quantity': 6}, headers=user)
+    assert response.status_code == 400
+    assert 'Available: 5' in response.get_json()['error']
+    assert on_hand(sweet['id']) == 5
+
+    # Needs units from several counters, which a rebalance gathers
+    response = client.post(f'/api/sweets/{sweet["id"]}/purchase', json={'quantity': 5}, headers=user)
+    assert response.status_code == 200
+    assert response.get_json()['sweet']['quantity'] == 0
+
+def test_worker_without_hint_finds_the_counters(app):
+    """Test a worker that never saw the sweet sharded still sells from counters"""
+    sweet = Sweet.create('Fudge', 'Fudge', 1.0, 6)
+    Sweet.shard_stock(sweet['id'], 3)
+    stock._hints.clear()
+
+    assert Sweet.purchase(sweet['id'], 2)['quantity'] == 4
+    assert stock.hint(ObjectId(sweet['id'])) == 3
+    assert on_hand(sweet['id']) == 4
+
+def test_checkout_and_unshard(client, admin, user):
+    """Test checkout gathers from counters and unsharding folds them back"""
+    sweet = Sweet.create('Fudge', 'Fudge', 1.0, 8)
+    other = Sweet.create('Toffee', 'Toffee', 2.0, 3)
+    Sweet.shard_stock(sweet['id'], 4)
+
+    response = client.post('/api/sweets/checkout', json={'items': [
+        {'sweet_id': sweet['id'], 'quantity': 5}, {'sweet_id': other['id'], 'quantity': 1}
+    ]}, headers=user)
+    assert response.status_code == 200
+    assert on_hand(sweet['id']) == 3
+
+    response = client.delete(f'/api/sweets/{sweet["id"]}/shards', headers=admin)
+    assert response.status_code == 200
+    assert response.get_json()['sweet']['quantity'] == 3
+    assert counters(sweet['id']) == []
+    assert mongo.db.sweets.find_one({'_id': ObjectId(sweet['id'])})['quantity'] == 3
+
+def test_quantity_edit_of_sharded_sweet_is_refused(client, admin):
+    """Test stock of a sharded sweet only changes through restocks and sales"""
+    sweet = Sweet.create('Fudge', 'Fudge', 1.0, 8)
+    Sweet.shard_stock(sweet['id'], 2)
+
+    response = client.put(f'/api/sweets/{sweet["id"]}', json={'quantity': 50}, headers=admin)
+    assert response.status_code == 400
+    response = client.put(f'/api/sweets/{sweet["id"]}', json={'price': 2.5}, headers=admin)
+    assert response.status_code == 200
+    assert response.get_json()['sweet']['quantity'] == 8
+
+def test_delete_removes_counters(app):
+    sweet = Sweet.create('Fudge', 'Fudge', 1.0, 8)
+    Sweet.shard_stock(sweet['id'], 2)
+
+    assert Sweet.delete(sweet['id'])
+    assert counters(sweet['id']) == []
+
+def test_etags_change_with_sharded_sales(client, user):
+    """Test a sale from a counter invalidates listing, search and sweet ETags"""
+    sweet = Sweet.create('Fudge', 'Fudge', 1.0, 10)
+    Sweet.shard_stock(sweet['id'], 4)
+    paths = ['/api/sweets', '/api/sweets/search?name=fud', f'/api/sweets/{sweet["id"]}']
+    etags = {path: client.get(path).headers['ETag'] for path in paths}
+
+    assert client.post(f'/api/sweets/{sweet["id"]}/purchase', json={'quantity': 1}, headers=user).status_code == 200
+
+    for path in paths:
+        response = client.get(path, headers={'If-None-Match': etags[path]})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etags[path]
+    assert response.get_json()['sweet']['quantity'] == 9
+    # Unchanged since the last read, so the fresh ETag still gets a 304
+    response = client.get(paths[2], headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+
+def test_analytics_count_counter_stock(client, admin, user):
+    """Test reports add the counters to the pool and refresh after sharded sales"""
+    sweet = Sweet.create('Fudge', 'Fudge', 2.0, 10)
+    Sweet.create('Toffee', 'Toffee', 1.0, 3)
+    Sweet.shard_stock(sweet['id'], 4)
+
+    data = client.get('/api/analytics/stock-value', headers=admin).get_json()
+    assert (data['total_units'], data['total_value'], data['out_of_stock']) == (13, 23.0, 0)
+    data = client.get('/api/analytics/low-stock?threshold=5', headers=admin).get_json()
+    assert [sweet['name'] for sweet in data['sweets']] == ['Toffee']
+
+    client.post(f'/api/sweets/{sweet["id"]}/purchase', json={'quantity': 6}, headers=user)
+    data = client.get('/api/analytics/stock-value', headers=admin).get_json()
+    assert data['total_units'] == 7
+    data = client.get('/api/analytics/low-stock?threshold=5', headers=admin).get_json()
+    assert (data['count'], [sweet['quantity'] for sweet in data['sweets']]) == (2, [3, 4])
+    data = client.get('/api/analytics/price-histogram?buckets=2', headers=admin).get_json()
+    assert sum(bucket['units'] for bucket in data['buckets']) == 7
+
+def test_parse_shards():
+    """Test the default, the bounds and malformed values"""
+    assert parse_shards(None, default=8, maximum=64) == 8
+    assert parse_shards({'shards': '16'}, default=8, maximum=64) == 16
+    for value in (1, 65, 'many'):
+        with pytest.raises(ValidationError):
+            parse_shards({'shards': value}, default=8, maximum=64)
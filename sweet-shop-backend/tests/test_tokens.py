@@ -0,0 +1,116 @@
+import pytest
+import json
+from datetime import datetime, timedelta
+from flask_jwt_extended import JWTManager
+from app import create_app, jwt
+from app.models import mongo, passwords, User
+from app.tokens import Blocklist, blocklist
+
+@pytest.fixture
+def client():
+    app = create_app('testing')
+    app.config['TESTING'] = True
+
+    with app.test_client() as client:
+        with app.app_context():
+            mongo.db.users.delete_many({})
+            mongo.db.revoked_tokens.delete_many({})
+            User.create('user@test.com', 'password123', 'Test User', 'customer')
+
+            yield client
+
+            mongo.db.users.delete_many({})
+            mongo.db.revoked_tokens.delete_many({})
+
+def login(client):
+    response = client.post('/api/auth/login', json={'email': 'user@test.com', 'password': 'password123'})
+    return json.loads(response.data)['token']
+
+def create_sweet(client, token):
+    """An admin-only request: verifies the token, then answers 403"""
+    return client.post('/api/sweets', json={'name': 'Fudge', 'category': 'Fudge', 'price': 1},
+                       headers={'Authorization': f'Bearer {token}'})
+
+def test_verified_tokens_are_cached(client, monkeypatch):
+    """Test a token's signature is checked once, not on every request"""
+    token = login(client)
+    assert create_sweet(client, token).status_code == 403
+
+    def no_verify(*args, **kwargs):
+        raise AssertionError('token verified twice')
+
+    monkeypatch.setattr(JWTManager, '_decode_jwt_from_config', no_verify)
+    response = create_sweet(client, token)
+
+    assert response.status_code == 403
+    assert json.loads(response.data) == {'error': 'Admin access required'}
+    assert jwt.verified.stats()['hits'] >= 1
+
+def test_invalid_tokens_are_not_cached(client):
+    """Test a bad token is rejected every time"""
+    token = login(client)[:-2] + 'xx'
+
+    assert create_sweet(client, token).status_code == 422
+    assert create_sweet(client, token).status_code == 422
+    assert jwt.verified.stats()['size'] == 0
+
+def test_revocation_from_another_worker(client):
+    """Test revocations recorded elsewhere apply after the next refresh"""
+    token = login(client)
+    claims = jwt._decode_jwt_from_config(token)
+    assert create_sweet(client, token).status_code == 403
+
+    mongo.db.revoked_tokens.insert_one(Blocklist.document(claims))
+    blocklist.refresh_interval = 0
+    response = create_sweet(client, token)
+
+    assert response.status_code == 401
+    assert json.loads(response.data) == {'msg': 'Token has been revoked'}
+
+def test_refresh_skips_password_check(client, monkeypatch):
+    """Test renewing an access token never runs bcrypt"""
+    response = client.post('/api/auth/login', json={'email': 'user@test.com', 'password': 'password123'})
+    refresh_token = json.loads(response.data)['refresh_token']
+
+    def no_bcrypt(*args):
+        raise AssertionError('bcrypt ran during refresh')
+
+    monkeypatch.setattr(passwords, 'check', no_bcrypt)
+    response = client.post('/api/auth/refresh', headers={'Authorization': f'Bearer {refresh_token}'})
+
+    assert response.status_code == 200
+    assert jwt._decode_jwt_from_config(json.loads(response.data)['token'])['role'] == 'customer'
+
+def test_refresh_for_deleted_user(client):
+    """Test a refresh token stops working once its user is gone"""
+    response = client.post('/api/auth/login', json={'email': 'user@test.com', 'password': 'password123'})
+    refresh_token = json.loads(response.data)['refresh_token']
+    mongo.db.users.delete_many({})
+
+    response = client.post('/api/auth/refresh', headers={'Authorization': f'Bearer {refresh_token}'})
+    assert response.status_code == 401
+
+def test_blocklist_refreshes_once_per_interval():
+    """Test only one caller per interval goes to Mongo"""
+    now = [100.0]
+    revoked = Blocklist(refresh_interval=5, clock=lambda: now[0])
+
+    assert revoked.refresh_due()
+    assert not revoked.refresh_due()
+    now[0] += 5
+    assert revoked.refresh_due()
+
+def test_blocklist_merges_and_prunes():
+    """Test merged revocations are incremental and expired ones dropped"""
+    revoked = Blocklist()
+    assert revoked.query() == {}
+
+    revoked_at = datetime.utcnow()
+    revoked.merge([
+        {'_id': 'live', 'revoked_at': revoked_at, 'expires_at': revoked_at + timedelta(hours=1)},
+        {'_id': 'expired', 'revoked_at': revoked_at, 'expires_at': revoked_at - timedelta(seconds=1)}
+    ])
+
+    assert 'live' in revoked
+    assert 'expired' not in revoked
+    assert revoked.query() == {'revoked_at': {'$gte': revoked_at - Blocklist.OVERLAP}}
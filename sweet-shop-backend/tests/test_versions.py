@@ -0,0 +1,127 @@
+import pytest
+from app import create_app
+from app.models import mongo, User, Sweet
+from app.validation import ValidationError, parse_if_match
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    app.config['TESTING'] = True
+
+    with app.app_context():
+        mongo.db.users.delete_many({})
+        mongo.db.sweets.delete_many({})
+        User.create('admin@test.com', 'password123', 'Admin User', 'admin')
+
+        yield app
+
+        mongo.db.users.delete_many({})
+        mongo.db.sweets.delete_many({})
+
+@pytest.fixture
+def client(app):
+    with app.test_client() as client:
+        yield client
+
+@pytest.fixture
+def admin(client):
+    response = client.post('/api/auth/login', json={'email': 'admin@test.com', 'password': 'password123'})
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+def test_every_write_bumps_the_version(app):
+    """Test create starts at 1 and updates, purchases and restocks each add one"""
+    sweet = Sweet.create('Fudge', 'Fudge', 1.0, 10)
+    assert Sweet.to_dict(sweet)['version'] == 1
+
+    assert Sweet.update(sweet['id'], {'price': 1.5})['version'] == 2
+    assert Sweet.purchase(sweet['id'], 1)['version'] == 3
+    assert Sweet.restock(sweet['id'], 4)['version'] == 4
+    Sweet.checkout([(sweet['id'], 1)])
+    assert Sweet.find_by_id(sweet['id'], cached=False)['version'] == 5
+
+def test_conditional_update_is_compare_and_set(app):
+    """Test only the first of two writers holding the same version succeeds"""
+    sweet = Sweet.create('Fudge', 'Fudge', 1.0, 10)
+
+    assert Sweet.update(sweet['id'], {'quantity': 11}, version=1)['quantity'] == 11
+    assert Sweet.update(sweet['id'], {'quantity': 99}, version=1) is None
+    assert Sweet.find_by_id(sweet['id'], cached=False)['quantity'] == 11
+
+    # Writing the values already stored still counts as a successful update
+    assert Sweet.update(sweet['id'], {'quantity': 11}) is not None
+
+def test_put_with_stale_if_match_is_a_conflict(client, admin):
+    """Test a stale If-Match gets a 409 carrying the current sweet"""
+    sweet = Sweet.create('Fudge', 'Fudge', 1.0, 10)
+    Sweet.purchase(sweet['id'], 2)
+
+    response = client.put(f'/api/sweets/{sweet["id"]}', json={'quantity': 50},
+                          headers={**admin, 'If-Match': '"1"'})
+    assert response.status_code == 409
+    current = response.get_json()['sweet']
+    assert (current['quantity'], current['version']) == (8, 2)
+
+    response = client.put(f'/api/sweets/{sweet["id"]}', json={'quantity': 50},
+                          headers={**admin, 'If-Match': f'"{current["version"]}"'})
+    assert response.status_code == 200
+    assert response.get_json()['sweet']['version'] == 3
+
+    response = client.put(f'/api/sweets/{sweet["id"]}', json={'price': 2}, headers={**admin, 'If-Match': '*'})
+    assert response.status_code == 200
+
+def test_restock_increments_in_place(client, admin):
+    """Test restock adds to the stored quantity rather than a value read earlier"""
+    sweet = Sweet.create('Fudge', 'Fudge', 1.0, 10)
+    stale = Sweet.find_by_id(sweet['id'], cached=False)
+    Sweet.purchase(sweet['id'], 3)
+
+    response = client.post(f'/api/sweets/{sweet["id"]}/restock', json={'quantity': 5}, headers=admin)
+    assert response.status_code == 200
+    assert response.get_json()['sweet']['quantity'] == 12
+
+    response = client.post(f'/api/sweets/{sweet["id"]}/restock', json={'quantity': 5},
+                           headers={**admin, 'If-Match': str(stale['version'])})
+    assert response.status_code == 409
+    assert Sweet.find_by_id(sweet['id'], cached=False)['quantity'] == 12
+
+    response = client.post('/api/sweets/64b000000000000000000000/restock', json={'quantity': 5}, headers=admin)
+    assert response.status_code == 404
+
+def test_sweets_without_a_version_count_as_zero(client, admin):
+    """Test documents written before versioning can still be updated conditionally"""
+    sweet = Sweet.create('Fudge', 'Fudge', 1.0, 10)
+    mongo.db.sweets.update_many({}, {'$unset': {'version': ''}})
+    assert Sweet.to_dict(Sweet.find_by_id(sweet['id'], cached=False))['version'] == 0
+
+    response = client.put(f'/api/sweets/{sweet["id"]}', json={'price': 2}, headers={**admin, 'If-Match': '"0"'})
+    assert response.status_code == 200
+    assert response.get_json()['sweet']['version'] == 1
+
+def test_rename_racing_another_is_a_bad_request(client, admin, monkeypatch):
+    """Test a name taken after the route checked it is a 400, not a 500"""
+    fudge = Sweet.create('Fudge', 'Fudge', 1.0, 10)
+    Sweet.create('Toffee', 'Toffee', 1.0, 10)
+    # The other rename lands between the name check and the write
+    monkeypatch.setattr(Sweet, 'find_by_name', lambda name: None)
+
+    response = client.put(f'/api/sweets/{fudge["id"]}', json={'name': 'Toffee'}, headers=admin)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Sweet with this name already exists'
+    assert Sweet.find_by_id(fudge['id'], cached=False)['name'] == 'Fudge'
+
+def test_update_body_must_be_an_object(client, admin):
+    sweet = Sweet.create('Fudge', 'Fudge', 1.0, 10)
+
+    for body in (['quantity', 5], 'quantity', {'name': 5}):
+        response = client.put(f'/api/sweets/{sweet["id"]}', json=body, headers=admin)
+        assert response.status_code == 400
+
+def test_parse_if_match():
+    """Test quoted and bare versions, wildcard, and malformed headers"""
+    assert parse_if_match(None) is None
+    assert parse_if_match('*') is None
+    assert parse_if_match('"7"') == 7
+    assert parse_if_match(' 7 ') == 7
+    for value in ('W/"7"', '"abc"', '"-1"', '"7", "8"', ''):
+        with pytest.raises(ValidationError):
+            parse_if_match(value)